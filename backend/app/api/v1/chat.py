@@ -1,21 +1,88 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends
+import asyncio
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel
 
-from backend.app.services.chatbot import answer
+from backend.app.services.case_context import ContextNotFound, create_context, delete_context, get_context
+from backend.app.services.chatbot import DISCLAIMER, aanswer, astream_answer
+from backend.app.services.scheduler import admit, hold
 from backend.app.core.security import require_role
+from backend.app.utils.sse import sse_event, sse_response
 
 router = APIRouter()
 
+CHAT_ROLES = ("clinician", "patient", "admin")
+
 
 class ChatIn(BaseModel):
     message: str
     notes: Optional[str] = None
     imaging_findings: Optional[List[str]] = None
+    context_id: Optional[str] = None     # from POST /chat/context; replaces notes + imaging_findings
+
+
+class ContextIn(BaseModel):
+    notes: Optional[str] = None
+    imaging_findings: Optional[List[str]] = None
+
+
+async def _load_context(in_: ChatIn, claims: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not in_.context_id:
+        return None
+    try:
+        return await asyncio.to_thread(get_context, in_.context_id, claims.get("sub"))
+    except ContextNotFound:
+        raise HTTPException(status_code=404, detail="Unknown or expired context_id; register the case again.")
+
+
+@router.post("/chat/context", status_code=201)
+async def register_context(in_: ContextIn, claims: Dict[str, Any] = Depends(require_role(*CHAT_ROLES))):
+    """Store case notes + imaging findings once; pass the returned `context_id` to /chat. Expires after CONTEXT_TTL_S idle."""
+    return await asyncio.to_thread(create_context, claims.get("sub"), in_.notes, in_.imaging_findings)
+
+
+@router.delete("/chat/context/{context_id}", status_code=204)
+async def drop_context(context_id: str, claims: Dict[str, Any] = Depends(require_role(*CHAT_ROLES))):
+    try:
+        await asyncio.to_thread(delete_context, context_id, claims.get("sub"))
+    except ContextNotFound:
+        raise HTTPException(status_code=404, detail="Unknown or expired context_id.")
+    return Response(status_code=204)
+
+
+@router.post("/chat")
+async def chat(in_: ChatIn, claims: Dict[str, Any] = Depends(require_role(*CHAT_ROLES))):
+    """General QA over optional case context (notes + imaging findings); cites the note excerpts used."""
+    context = await _load_context(in_, claims)
+    citations = []
+    async with admit("llm", claims.get("role")):
+        resp = await aanswer(in_.message, notes=in_.notes, imaging_findings=in_.imaging_findings or [],
+                             citations_out=citations, context=context)
+    return {"reply": resp, "citations": citations}
+
 
+@router.post("/chat/stream")
+async def chat_stream(in_: ChatIn, claims: Dict[str, Any] = Depends(require_role(*CHAT_ROLES))):
+    """
+    Same as /chat, streamed as SSE: `token` events ({"text"}), then `done` with
+    citations, or `error` ({"detail", "partial", "disclaimer"}): `partial` says
+    tokens were already sent, so the client must mark that answer incomplete.
+    """
+    context = await _load_context(in_, claims)
+    release = await hold("llm", claims.get("role"))  # shed (503) before the stream starts
 
-@router.post("/chat", dependencies=[Depends(require_role("clinician", "patient", "admin"))])
-def chat(in_: ChatIn):
-    """General QA over optional case context (notes + imaging findings)."""
-    resp = answer(in_.message, notes=in_.notes, imaging_findings=in_.imaging_findings or [])
-    return {"reply": resp}
+    async def events():
+        citations = []
+        sent = False
+        try:
+            async for delta in astream_answer(in_.message, notes=in_.notes, imaging_findings=in_.imaging_findings or [],
+                                              citations_out=citations, context=context):
+                sent = True
+                yield sse_event("token", {"text": delta})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Chat failed: {e}", "partial": sent, "disclaimer": DISCLAIMER})
+            return
+        finally:
+            release()
+        yield sse_event("done", {"citations": citations})
+    return sse_response(events(), cleanup=release)
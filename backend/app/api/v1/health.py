@@ -1,7 +1,23 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from backend.app.core.security import require_role
+from backend.app.utils import metrics
 
 router = APIRouter()
 
 @router.get("/health")
 def health():
     return {"status": "ok"}
+
+@router.get("/metrics", dependencies=[Depends(require_role("admin"))])
+def get_metrics():
+    """In-process counters (batch sizes, queue delays, ...) for this worker."""
+    from backend.app.services import llm_cache, llm_limiter, llm_resilience, prefetch, scheduler
+    limiter = llm_limiter.get_limiter()
+    return {
+        **metrics.snapshot(),
+        "llm_cache": llm_cache.stats(),
+        "llm_providers": llm_resilience.status(),
+        "llm_limiter": limiter.snapshot() if limiter else None,
+        "scheduler": scheduler.snapshot(),
+        "prefetch": prefetch.stats(),
+    }
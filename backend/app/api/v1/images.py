@@ -1,31 +1,136 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from backend.app.services.image_analyzer import analyze_image_bytes
+import asyncio, json, weakref, zipfile
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Response
+from fastapi.responses import StreamingResponse
+from backend.app.services.image_analyzer import analyze_image_bytes, get_result_cache, image_cache_key
+from backend.app.services.study_analyzer import ArchiveTooLarge, analyze_study, check_archives, iter_upload_items
+from backend.app.services.inference_pool import InferenceQueueFull, get_inference_pool
+from backend.app.services.scheduler import Overloaded, hold
+from backend.app.services.prefetch import note_case
+from backend.app.utils.common import UnsupportedDicom
 from backend.app.core.security import require_role
+from backend.app.utils.uploads import BufferReader, check_upload, map_file, mapped, release
+
+IMAGE_KINDS = ("png", "jpeg", "dicom")
+STUDY_KINDS = IMAGE_KINDS + ("zip",)
 
 router = APIRouter()
 
 
-@router.post("/images/analyze", dependencies=[Depends(require_role("clinician", "admin"))])
-async def analyze_image(file: UploadFile = File(...)):
+@router.post("/images/analyze")
+async def analyze_image(response: Response, file: UploadFile = File(...),
+                        claims: Dict[str, Any] = Depends(require_role("clinician", "admin"))):
     """
     Accepts PNG, JPG, JPEG, or DICOM (.dcm) files and returns AI analysis.
-    Relaxed content-type check to handle browser quirks.
+    The type is sniffed from the file's first bytes; the declared content
+    type is not trusted.
     """
     filename = file.filename or "uploaded_image"
-    content_type = file.content_type or ""
+    await check_upload(file, "image", IMAGE_KINDS)
+    with mapped(file.file) as data:
+        result, tier = await analyze_cached(data, filename, claims.get("role"))
+    response.headers["X-Cache"] = "MISS" if tier == "miss" else f"HIT-{tier.upper()}"
+    await note_case(claims.get("sub"), claims.get("role"), findings=result.get("findings", []))
+    return result
 
-    allowed_types = ["image/png", "image/jpeg", "application/dicom", "application/octet-stream"]
-    if not (any(t in content_type for t in allowed_types) or filename.lower().endswith(".dcm")):
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unsupported file type: {content_type}. Please upload PNG, JPG, or DICOM.",
-        )
 
-    data = await file.read()
-    if not data:
-        raise HTTPException(status_code=400, detail="Empty file uploaded.")
+async def analyze_cached(data, filename: str, role: Optional[str]) -> Tuple[Dict[str, Any], str]:
+    """Analysis of one upload buffer -> (result, cache tier); errors as HTTPExceptions."""
+    # Identical uploads (re-clicks, retries, other views) are served from cache.
+    cache = get_result_cache()
+    key = await asyncio.to_thread(image_cache_key, data)
+    cached, tier = await asyncio.to_thread(cache.get, key)
+    if cached is not None:
+        return cached, tier
 
+    # Decode + inference run on the inference pool so the event loop stays free;
+    # the role scheduler decides who gets the next pool slot. Both slots are
+    # held until the pool thread finishes, even if this request is cancelled.
     try:
-        return analyze_image_bytes(data, filename=filename)
+        release_sched = await hold("inference", role)
+        try:
+            fut = get_inference_pool().submit(analyze_image_bytes, data, filename=filename)
+        except BaseException:
+            release_sched()
+            raise
+        fut.add_done_callback(lambda _: release_sched())
+        result = await asyncio.wrap_future(fut)
+    except InferenceQueueFull as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Image analysis is at capacity, please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except UnsupportedDicom as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Image analysis failed: {e}")
+    await asyncio.to_thread(cache.set, key, result)
+    return result, tier
+
+
+def _spool(upload: UploadFile):
+    # The request closes its UploadFiles once the handler returns, before a
+    # StreamingResponse body runs; a mapping of the spooled file outlives that.
+    buf = map_file(upload.file)
+    return upload.filename or "upload", BufferReader(buf), buf
+
+
+@router.post("/images/analyze_study")
+async def analyze_study_upload(files: List[UploadFile] = File(...),
+                               claims: Dict[str, Any] = Depends(require_role("clinician", "admin"))):
+    """
+    Whole study/series: a zip and/or several DICOM/PNG/JPG files (multi-frame
+    DICOMs are expanded). Streams NDJSON: one {"type": "image", ...} record per
+    frame in the /images/analyze shape, {"type": "error", ...} for frames that
+    fail, and a final {"type": "study", ...} aggregate (max prob per finding).
+    Archives over the STUDY_MAX_* entry/size limits are rejected with 413.
+    """
+    for f in files:
+        await check_upload(f, "study", STUDY_KINDS)
+    pool = get_inference_pool()
+    release_sched = await hold("inference", claims.get("role"))
+    try:
+        pool.admit()  # one slot for the whole study
+    except InferenceQueueFull as e:
+        release_sched()
+        raise HTTPException(
+            status_code=429,
+            detail="Image analysis is at capacity, please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    spooled = []
+
+    def cleanup():
+        for _, fp, buf in spooled:
+            fp.close()
+            release(buf)
+        pool.release()
+        release_sched()
+
+    try:
+        for f in files:
+            spooled.append(await asyncio.to_thread(_spool, f))
+        await asyncio.to_thread(check_archives, [fp for _, fp, _ in spooled])
+    except ArchiveTooLarge as e:
+        cleanup()
+        raise HTTPException(status_code=413, detail=str(e))
+    except zipfile.BadZipFile as e:
+        cleanup()
+        raise HTTPException(status_code=422, detail=f"Unreadable zip archive: {e}")
+    except BaseException:
+        cleanup()
+        raise
+
+    def stream():
+        try:
+            for rec in analyze_study(iter_upload_items((name, fp) for name, fp, _ in spooled)):
+                yield json.dumps(rec) + "\n"
+        finally:
+            done()
+
+    body = stream()
+    done = weakref.finalize(body, cleanup)  # also runs if the body is dropped before it starts
+    return StreamingResponse(body, media_type="application/x-ndjson")
@@ -0,0 +1,71 @@
+import asyncio
+from typing import Any, Dict
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi.responses import JSONResponse
+
+from backend.app.api.v1.images import IMAGE_KINDS
+from backend.app.api.v1.records import SummarizeIn
+from backend.app.services.jobs import DONE, FAILED, get_job_queue
+from backend.app.services.prefetch import note_case
+from backend.app.core.security import require_role
+from backend.app.utils.uploads import check_upload, mapped
+
+router = APIRouter()
+
+
+def _serving(kind: str):
+    """The queue, if this process runs `kind` jobs; 503 otherwise (submit to the pods that serve it)."""
+    queue = get_job_queue()
+    if not queue.serves(kind):
+        raise HTTPException(status_code=503, detail=f"{kind} jobs are not run by this service.")
+    return queue
+
+
+@router.post("/jobs/images/analyze", status_code=202)
+async def submit_image_analyze(file: UploadFile = File(...),
+                               claims: Dict[str, Any] = Depends(require_role("clinician", "admin"))):
+    """Queue an image analysis; poll /jobs/{job_id} for the result. Runs at the submitter's role priority."""
+    queue = _serving("image.analyze")
+    await check_upload(file, "image", IMAGE_KINDS)
+    with mapped(file.file) as data:
+        return await asyncio.to_thread(
+            queue.submit, "image.analyze", {"filename": file.filename or "uploaded_image"}, data,
+            claims.get("role"), claims.get("sub"),
+        )
+
+
+@router.post("/jobs/records/summarize", status_code=202)
+async def submit_summarize(in_: SummarizeIn, claims: Dict[str, Any] = Depends(require_role("clinician", "admin"))):
+    """Queue a summarization; poll /jobs/{job_id} for the result. Runs at the submitter's role priority."""
+    queue = _serving("records.summarize")
+    payload = {"text": in_.text, "imaging_findings": in_.imaging_findings or []}
+    return await asyncio.to_thread(
+        queue.submit, "records.summarize", payload, None, claims.get("role"), claims.get("sub")
+    )
+
+
+async def _get(job_id: str, claims: Dict[str, Any]) -> Dict[str, Any]:
+    job = await asyncio.to_thread(get_job_queue().get, job_id, claims.get("sub"))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    if (job["status"] == DONE and job["kind"] == "image.analyze"
+            and await asyncio.to_thread(get_job_queue().mark_delivered, job_id)):
+        await note_case(claims.get("sub"), claims.get("role"), findings=job["result"].get("findings", []))
+    return job
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str, claims: Dict[str, Any] = Depends(require_role("clinician", "admin"))):
+    """Job status; includes `result` once done (or `error` if it failed)."""
+    return await _get(job_id, claims)
+
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str, claims: Dict[str, Any] = Depends(require_role("clinician", "admin"))):
+    """The bare result: 200 when done, 202 while pending, the failure's status (415, 500) if it failed."""
+    job = await _get(job_id, claims)
+    if job["status"] == DONE:
+        return job["result"]
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=job["code"], detail=f"Job failed: {job.get('error')}")
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status": job["status"]}, headers={"Retry-After": "1"})
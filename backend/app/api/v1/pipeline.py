@@ -0,0 +1,96 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+
+from backend.app.api.v1.images import IMAGE_KINDS, analyze_cached
+from backend.app.core.config import settings
+from backend.app.core.security import require_role
+from backend.app.services.pipeline import Stage, StageSkipped, run_stages
+from backend.app.services.scheduler import admit
+from backend.app.services.summarizer import asummarize_notes
+from backend.app.utils.pdf_extractor import extract_pdf_text
+from backend.app.utils.sse import sse_event, sse_response
+from backend.app.utils.uploads import check_upload, close_path, map_file, release, spooled_path
+
+router = APIRouter()
+
+
+@router.post("/pipeline/case")
+async def case_pipeline(image: Optional[UploadFile] = File(None), pdf: Optional[UploadFile] = File(None),
+                        notes: str = Form(""),
+                        claims: Dict[str, Any] = Depends(require_role("clinician", "admin"))):
+    """
+    Image analysis, PDF extraction and summary in one call, streamed as SSE.
+
+    The image and PDF stages run concurrently; the summary starts once both
+    are done and gets the typed `notes`, the PDF text and the imaging
+    findings of whichever succeeded. One `stage` event per stage as it
+    finishes ({stage, status, ms, result | detail}), then `done` with the
+    timings.
+    """
+    if image is None and pdf is None and not notes.strip():
+        raise HTTPException(status_code=400, detail="Provide an image, a PDF and/or notes.")
+    role = claims.get("role")
+    stages = []
+    buffers = []  # mappings outlive the uploads, which close when the handler returns
+    paths = []
+
+    def cleanup():
+        # Idempotent: from the stream's finally, when an unstarted stream is
+        # dropped, or when a later upload is refused.
+        for buf in buffers:
+            release(buf)
+        for path in paths:
+            close_path(path)
+
+    try:
+        if image is not None:
+            await check_upload(image, "image", IMAGE_KINDS)
+            buffers.append(map_file(image.file))
+        if pdf is not None:
+            await check_upload(pdf, "pdf", ("pdf",))
+            buffers.append(map_file(pdf.file))
+            paths.append(spooled_path(pdf.file))
+    except BaseException:
+        cleanup()
+        raise
+
+    if image is not None:
+        img, filename = buffers[0], image.filename or "uploaded_image"
+
+        async def analyze(_):
+            result, _tier = await analyze_cached(img, filename, role)
+            return result
+        stages.append(Stage("image", analyze))
+
+    if pdf is not None:
+        doc, doc_path = buffers[-1], paths[0]
+
+        async def extract(_):
+            text = await asyncio.to_thread(extract_pdf_text, doc, settings.pdf_max_chars, doc_path)
+            if not text:
+                raise ValueError("Could not extract text from PDF.")
+            return {"text": text}
+        stages.append(Stage("pdf", extract))
+
+    async def summarize(results):
+        text = "\n\n".join(t for t in (notes.strip(), results.get("pdf", {}).get("text", "")) if t)
+        findings = results.get("image", {}).get("findings", [])
+        if not text and not findings:
+            raise StageSkipped("No notes or imaging findings to summarize.")
+        async with admit("llm", role):
+            return await asummarize_notes(text, findings)
+    stages.append(Stage("summary", summarize, after=tuple(s.name for s in stages)))
+
+    async def events():
+        started = time.perf_counter()
+        timings = {}
+        try:
+            async for record in run_stages(stages):
+                timings[record["stage"]] = record["ms"]
+                yield sse_event("stage", record)
+        finally:
+            cleanup()
+        yield sse_event("done", {"timings": timings, "total_ms": round((time.perf_counter() - started) * 1000.0, 1)})
+    return sse_response(events(), cleanup=cleanup)
@@ -1,10 +1,17 @@
-from typing import List, Optional
+import asyncio
+from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from pydantic import BaseModel
 
-from backend.app.services.summarizer import summarize_notes
-from backend.app.utils.pdf_extractor import extract_pdf_text
+from backend.app.services.summarizer import asummarize_notes, astream_summary
+from backend.app.utils.pdf_extractor import extract_pdf_text, iter_pdf_pages
+from backend.app.core.config import settings
+from backend.app.utils.uploads import check_upload, close_path, map_file, mapped, release, spooled_path
 from backend.app.core.security import require_role
+from backend.app.services.scheduler import admit, hold
+from backend.app.services.prefetch import claim, note_case
+from backend.app.services.summary_versions import asummarize_case, astream_case
+from backend.app.utils.sse import sse_event, sse_response
 
 router = APIRouter()
 
@@ -12,21 +19,102 @@ router = APIRouter()
 class SummarizeIn(BaseModel):
     text: str
     imaging_findings: Optional[List[str]] = None
+    case_id: Optional[str] = None   # keep a versioned summary; appended material is summarized incrementally
 
 
-@router.post("/records/summarize", dependencies=[Depends(require_role("clinician", "admin"))])
-def summarize(in_: SummarizeIn):
+@router.post("/records/summarize")
+async def summarize(in_: SummarizeIn, claims: Dict[str, Any] = Depends(require_role("clinician", "admin"))):
     """Summarize clinical notes (optionally with imaging findings)."""
-    return summarize_notes(in_.text, in_.imaging_findings or [])
+    if in_.case_id:
+        async with admit("llm", claims.get("role")):
+            return await asummarize_case(claims.get("sub"), in_.case_id, in_.text, in_.imaging_findings)
+    prefetched = await claim(in_.text, in_.imaging_findings or [])
+    if prefetched is not None:
+        return prefetched
+    async with admit("llm", claims.get("role")):
+        return await asummarize_notes(in_.text, in_.imaging_findings or [])
 
 
-@router.post("/records/extract_pdf", dependencies=[Depends(require_role("clinician", "admin", "patient"))])
-async def extract_pdf(file: UploadFile = File(...)):
-    """Extract plain text from a PDF."""
-    if not file.content_type or "pdf" not in file.content_type:
-        raise HTTPException(status_code=400, detail="Please upload a PDF file.")
-    data = await file.read()
-    text = extract_pdf_text(data)
+@router.post("/records/summarize/stream")
+async def summarize_stream(in_: SummarizeIn, claims: Dict[str, Any] = Depends(require_role("clinician", "admin"))):
+    """Same as /records/summarize, streamed as SSE: `token` events, then `done` with citations and usage."""
+    prefetched = None if in_.case_id else await claim(in_.text, in_.imaging_findings or [])
+    if prefetched is not None:
+        async def replay():
+            yield sse_event("token", {"text": prefetched["summary"]})
+            yield sse_event("done", {"citations": prefetched["citations"], "usage": prefetched["usage"],
+                                     "prefetched": True})
+        return sse_response(replay())
+    release = await hold("llm", claims.get("role"))
+
+    async def events():
+        usage = {}
+        try:
+            if in_.case_id:
+                stream = astream_case(claims.get("sub"), in_.case_id, in_.text, in_.imaging_findings, usage_out=usage)
+            else:
+                stream = astream_summary(in_.text, in_.imaging_findings or [], usage_out=usage)
+            async for delta in stream:
+                yield sse_event("token", {"text": delta})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Summarization failed: {e}"})
+            return
+        finally:
+            release()
+        yield sse_event("done", {"citations": [], "usage": usage})
+    return sse_response(events(), cleanup=release)
+
+
+@router.post("/records/extract_pdf")
+async def extract_pdf(file: UploadFile = File(...),
+                      claims: Dict[str, Any] = Depends(require_role("clinician", "admin", "patient"))):
+    """Extract plain text from a PDF (capped at PDF_MAX_CHARS)."""
+    await check_upload(file, "pdf", ("pdf",))
+    path = spooled_path(file.file)  # a disk-spooled upload is read in place, not copied
+    try:
+        with mapped(file.file) as data:
+            text = await asyncio.to_thread(extract_pdf_text, data, settings.pdf_max_chars, path)
+    finally:
+        close_path(path)
     if not text:
         raise HTTPException(status_code=422, detail="Could not extract text from PDF.")
-    return {"text": text[:200_000]}  # safety cap
+    await note_case(claims.get("sub"), claims.get("role"), notes=text)
+    return {"text": text}
+
+
+@router.post("/records/extract_pdf/stream")
+async def extract_pdf_stream(file: UploadFile = File(...),
+                             claims: Dict[str, Any] = Depends(require_role("clinician", "admin", "patient"))):
+    """Same as /records/extract_pdf, streamed as SSE: a `page` event per page, then `done`."""
+    await check_upload(file, "pdf", ("pdf",))
+    data = map_file(file.file)  # outlives the upload, which closes when the handler returns
+    path = spooled_path(file.file)
+
+    def cleanup():
+        release(data)
+        close_path(path)
+
+    async def events():
+        pages = iter_pdf_pages(data, settings.pdf_max_chars, path)
+        count = chars = 0
+        texts = []
+        try:
+            while True:
+                item = await asyncio.to_thread(next, pages, None)
+                if item is None:
+                    break
+                page, text = item
+                count, chars = count + 1, chars + len(text)
+                texts.append(text)
+                yield sse_event("page", {"page": page + 1, "text": text})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"PDF extraction failed: {e}"})
+            return
+        finally:
+            await asyncio.to_thread(pages.close)
+            cleanup()
+        yield sse_event("done", {"pages": count, "chars": chars, "truncated": chars >= settings.pdf_max_chars})
+        # Same text /records/extract_pdf would have returned.
+        await note_case(claims.get("sub"), claims.get("role"),
+                        notes="\n".join(texts).strip()[:settings.pdf_max_chars])
+    return sse_response(events(), cleanup=cleanup)
@@ -1,4 +1,4 @@
-from typing import List, Any, Optional
+from typing import Dict, List, Any, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import field_validator
 
@@ -8,11 +8,138 @@ class Settings(BaseSettings):
     api_prefix: str = "/api/v1"
     backend_cors_origins: List[str] = ["http://localhost:3000"]
     jwt_secret: str = "devsecret_change_me"
+    app_profile: str = "all"              # all | auth | api | imaging (see main.PROFILES)
+    app_routers: List[str] = []           # explicit router list, overrides the profile
 
     # --- LLM config (matches your .env names) ---
     llm_provider: str = "openai"
     openai_api_key: str | None = None
     openai_model: str = "gpt-4o-mini"
+    openai_base_url: str | None = None    # e.g. http://127.0.0.1:9100/v1 for backend.scripts.fake_llm
+    nim_api_key: str | None = None
+    nim_api_base: str | None = None       # e.g. https://integrate.api.nvidia.com
+    nim_model: str = "meta/llama-3.1-70b-instruct"
+
+    # --- LLM HTTP pool (async client) ---
+    llm_timeout_s: float = 120.0          # overall budget per LLM call, retries included
+    llm_max_connections: int = 200        # in-flight provider calls per worker
+    llm_max_keepalive: int = 50
+    llm_keepalive_s: float = 30.0
+
+    # --- LLM call resilience (services.llm_resilience) ---
+    llm_attempt_timeout_s: float = 45.0   # per attempt; for streams, time to first token
+    llm_max_attempts: int = 3
+    llm_backoff_base_s: float = 0.5       # full-jitter exponential backoff between attempts
+    llm_backoff_max_s: float = 8.0
+    llm_hedge_enabled: bool = False       # duplicate a call still running at the latency percentile
+    llm_hedge_percentile: float = 95.0
+    llm_hedge_min_samples: int = 20
+    llm_failover: bool = True             # fall back to the other provider when it has credentials
+    llm_breaker_failures: int = 5         # consecutive failures that open a provider's circuit
+    llm_breaker_cooldown_s: float = 30.0
+
+    # --- outbound LLM limiter (SQLite, shared by all workers on the host) ---
+    llm_limiter_enabled: bool = True
+    llm_limiter_path: str = "data/llm_limiter.sqlite"
+    llm_limiter_initial: int = 8          # starting in-flight cap per provider (AIMD adjusts it)
+    llm_limiter_min: int = 1
+    llm_limiter_max: int = 64
+    llm_limiter_tpm: int = 0              # provider tokens-per-minute quota, 0 = unmetered
+    llm_limiter_completion_tokens: int = 512   # completion estimate charged up front
+    llm_limiter_latency_target_s: float = 20.0 # slower calls (TTFT for streams) shrink the cap
+    llm_limiter_cut_window_s: float = 2.0 # at most one decrease per window
+    llm_limiter_max_wait_s: float = 15.0  # queued longer than this -> 503
+
+    # --- LLM completion cache (key: provider, model, prompts, temperature) ---
+    llm_cache_enabled: bool = True
+    llm_cache_max_items: int = 1024
+    llm_cache_ttl_s: float = 24 * 3600
+    llm_cache_path: Optional[str] = None     # e.g. data/cache/llm.sqlite; shared by workers
+    llm_cache_max_bytes: int = 128 * 1024 * 1024
+    llm_cache_bypass_routes: List[str] = []  # e.g. ["chat"]; routes: chat, summarize, llm
+
+    # --- summarization (token counts via tiktoken cl100k_base) ---
+    summarize_single_shot_tokens: int = 12000   # longer notes go through map-reduce
+    summarize_chunk_tokens: int = 6000          # notes per map-stage call
+    summarize_max_concurrency: int = 4          # parallel map-stage calls per request
+    summarize_prefetch: bool = False            # summarize in the background after extract_pdf / analyze
+    summarize_prefetch_max_inflight: int = 2    # speculative summaries running per worker
+    summarize_prefetch_max_tokens: int = 12000  # larger notes are not summarized speculatively
+    summarize_prefetch_timeout_s: float = 60
+    summarize_prefetch_ttl_s: float = 1800      # how long an unclaimed summary is kept
+    summarize_prefetch_path: Optional[str] = "data/cache/prefetch.sqlite"   # shared by workers
+
+    # --- versioned case summaries (requests with a case_id; SQLite, shared by all workers) ---
+    summary_db_path: str = "data/summaries.sqlite"
+    summary_ttl_s: float = 30 * 24 * 3600
+    summary_max_bytes: int = 128 * 1024 * 1024
+    summarize_full_every: int = 10        # incremental updates before a full re-summarization
+
+    # --- chat retrieval (BM25 over note chunks, see services.retrieval) ---
+    retrieval_chunk_tokens: int = 200
+    retrieval_top_k: int = 6
+    retrieval_max_tokens: int = 1500      # note excerpts per chat prompt
+    retrieval_cache_items: int = 64       # indexes kept, keyed by notes hash
+    retrieval_cache_ttl_s: float = 3600
+
+    # --- chat context sessions (SQLite, shared by all workers) ---
+    context_db_path: str = "data/contexts.sqlite"
+    context_ttl_s: float = 3600           # idle time before a context expires
+    context_max_bytes: int = 256 * 1024 * 1024
+    context_inline_notes_tokens: int = 3000   # shorter notes go whole into the cached prefix
+    context_history_tokens: int = 1500    # prior turns kept in each prompt
+
+    # --- role-priority scheduling (inference + LLM request paths, job queue order) ---
+    sched_enabled: bool = True
+    sched_weights: Dict[str, int] = {"clinician": 4, "admin": 2, "patient": 1}
+    sched_quotas: Dict[str, float] = {"patient": 0.5}   # max share of capacity per role
+    sched_max_queue: int = 64             # queue length for the top weight; lower weights get less
+    sched_max_wait_s: float = 10.0        # expected or actual wait beyond this -> 503
+    sched_llm_capacity: int = 32          # concurrent LLM-backed requests per worker
+
+    # --- uploads (limits enforced while the body streams in, see utils.uploads) ---
+    upload_max_mb: Dict[str, int] = {"image": 64, "study": 1024, "pdf": 100, "case": 164}   # case: image + pdf
+
+    # --- PDF text extraction ---
+    pdf_workers: int = 0                  # extraction processes, 0 = half the CPUs, 1 = inline
+    pdf_pages_per_task: int = 16          # pages per pool task
+    pdf_max_chars: int = 200_000          # extraction stops once this much text is read
+    pdf_cache_enabled: bool = True        # page texts keyed by content digest, documents by hash
+    pdf_cache_max_items: int = 4096       # pages + documents kept in memory per worker
+    pdf_cache_ttl_s: float = 30 * 24 * 3600
+    pdf_cache_path: Optional[str] = "data/cache/pdf.sqlite"   # shared by workers; None = memory only
+    pdf_cache_max_bytes: int = 512 * 1024 * 1024
+
+    # --- imaging inference ---
+    inference_backend: str = "eager"      # eager | torchscript | onnx | int8
+    inference_threads: int = 0            # torch/onnxruntime intra-op threads, 0 = library default
+    inference_artifact_dir: str = "data/models"   # written by backend.scripts.export_models
+    inference_max_batch_size: int = 8     # 1 disables micro-batching
+    inference_max_wait_ms: float = 5.0    # how long the first request waits for company
+    inference_workers: int = 2            # threads running decode + inference (raised to the batch size)
+    inference_max_queue: int = 16         # admitted-but-waiting calls before 429
+
+    study_decode_workers: int = 4         # parallel frame decoders per study upload
+    study_max_members: int = 4096         # zip entries per archive
+    study_max_member_mb: int = 256        # uncompressed size of one zip entry
+    study_max_total_mb: int = 4096        # uncompressed size of one archive
+
+    # --- DICOM ingest ---
+    dicom_modalities: List[str] = ["CR", "DX", "DR"]   # empty list accepts any
+    dicom_max_frame_mb: int = 256                       # decoded frame size limit
+
+    # --- background jobs (SQLite queue shared by all workers on the host) ---
+    jobs_db_path: str = "data/jobs.sqlite"
+    jobs_workers: int = 2
+    jobs_result_ttl_s: float = 3600
+    jobs_lease_s: float = 300             # a running job is re-queued if its worker vanishes this long
+    jobs_queued_ttl_s: float = 24 * 3600  # a job no worker claims in this long fails (503)
+
+    # --- imaging result cache (keyed by image bytes + model weights) ---
+    image_cache_max_items: int = 512
+    image_cache_ttl_s: float = 24 * 3600
+    image_cache_path: Optional[str] = None   # e.g. data/cache/images.sqlite; shared by workers
+    image_cache_max_bytes: int = 64 * 1024 * 1024
 
     model_config = SettingsConfigDict(
         env_prefix="",            # read vars exactly as given
@@ -21,10 +148,10 @@ class Settings(BaseSettings):
         extra="ignore",           # ignore any unrelated env keys
     )
 
-    # Accept JSON array or comma-separated list for CORS
-    @field_validator("backend_cors_origins", mode="before")
+    # Accept JSON array or comma-separated list
+    @field_validator("backend_cors_origins", "app_routers", "llm_cache_bypass_routes", mode="before")
     @classmethod
-    def parse_cors(cls, v: Any):
+    def parse_list(cls, v: Any):
         if isinstance(v, str):
             v = v.strip()
             if not v:
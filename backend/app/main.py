@@ -1,30 +1,104 @@
+import importlib
+from typing import Iterable, Optional
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from backend.app.api.v1.health import router as health_router
-from backend.app.api.v1.auth import router as auth_router
-from backend.app.api.v1.records import router as records_router
-from backend.app.api.v1.images import router as images_router
-from backend.app.api.v1.chat import router as chat_router
-
-app = FastAPI(title="MedAssist-AI")
-
-# CORS (adjust origins via env if you already have settings)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # tighten for prod
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-app.include_router(health_router, prefix="/api/v1")
-app.include_router(auth_router,   prefix="/api/v1")
-app.include_router(records_router, prefix="/api/v1")
-app.include_router(images_router,  prefix="/api/v1")
-app.include_router(chat_router,    prefix="/api/v1")
-
-
-@app.get("/")
-def root():
-    return {"app": "MedAssist-AI", "status": "ok"}
+from backend.app.core.config import settings
+
+# Routers by name, imported only when mounted.
+ROUTERS = {
+    "health":   "backend.app.api.v1.health",
+    "auth":     "backend.app.api.v1.auth",
+    "records":  "backend.app.api.v1.records",
+    "images":   "backend.app.api.v1.images",
+    "chat":     "backend.app.api.v1.chat",
+    "jobs":     "backend.app.api.v1.jobs",
+    "pipeline": "backend.app.api.v1.pipeline",
+}
+
+# Job kinds by the router whose pods run them (imaging work stays on imaging pods).
+JOB_KINDS = {
+    "images":  ["image.analyze"],
+    "records": ["records.summarize"],
+}
+
+# Deployment profiles: scale light and heavy endpoints as separate pods.
+PROFILES = {
+    "all":      list(ROUTERS),
+    "auth":     ["health", "auth"],
+    "api":      ["health", "auth", "records", "chat", "jobs"],
+    "imaging":  ["health", "images", "jobs", "pipeline"],
+}
+
+
+def create_app(profile: str = "all", routers: Optional[Iterable[str]] = None) -> FastAPI:
+    """Build the app with the routers of `profile` (or an explicit `routers` list)."""
+    names = list(routers) if routers else PROFILES.get(profile)
+    if names is None:
+        raise ValueError(f"Unknown app profile {profile!r}; expected one of {list(PROFILES)}")
+    unknown = [n for n in names if n not in ROUTERS]
+    if unknown:
+        raise ValueError(f"Unknown routers {unknown}; expected some of {list(ROUTERS)}")
+
+    app = FastAPI(title="MedAssist-AI")
+
+    # CORS (adjust origins via env if you already have settings)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # tighten for prod
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Per-route upload size limits, applied while the request body streams in.
+    from backend.app.utils.uploads import UploadLimit
+    app.add_middleware(UploadLimit)
+
+    for name in names:
+        app.include_router(importlib.import_module(ROUTERS[name]).router, prefix="/api/v1")
+
+    from fastapi.responses import JSONResponse
+    from backend.app.services.scheduler import Overloaded
+
+    @app.exception_handler(Overloaded)
+    async def shed(request, exc: Overloaded):
+        return JSONResponse(status_code=503, content={"detail": str(exc)},
+                            headers={"Retry-After": str(exc.retry_after)})
+
+    if "jobs" in names:
+        @app.on_event("startup")
+        def start_job_workers():
+            # Pick up jobs left queued (or orphaned mid-run) by a previous process,
+            # of the kinds this profile serves.
+            from backend.app.services.jobs import get_job_queue
+            get_job_queue().start([k for n in names for k in JOB_KINDS.get(n, [])])
+
+    if "chat" in names or "records" in names or "pipeline" in names:
+        from backend.app.services.llm_limiter import LimiterTimeout
+        from backend.app.services.llm_resilience import ProvidersUnavailable
+
+        @app.exception_handler(LimiterTimeout)
+        async def llm_capacity_exhausted(request, exc: LimiterTimeout):
+            return JSONResponse(status_code=503, content={"detail": str(exc)},
+                                headers={"Retry-After": str(exc.retry_after)})
+
+        @app.exception_handler(ProvidersUnavailable)
+        async def llm_providers_unavailable(request, exc: ProvidersUnavailable):
+            return JSONResponse(status_code=503, content={"detail": str(exc)},
+                                headers={"Retry-After": str(exc.retry_after)})
+
+        @app.on_event("shutdown")
+        async def close_llm_pool():
+            from backend.app.services.llm_client import aclose
+            await aclose()
+
+    @app.get("/")
+    def root():
+        return {"app": "MedAssist-AI", "status": "ok", "profile": profile, "routers": names}
+
+    return app
+
+
+app = create_app(settings.app_profile, settings.app_routers or None)
@@ -0,0 +1,77 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from backend.app.utils import metrics
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-image requests into one forward pass.
+
+    A background thread waits for the first item, then keeps pulling until
+    either `max_batch_size` items are queued or `max_wait_ms` has elapsed
+    since that first item arrived. `fn` receives a stacked [B, ...] array and
+    must return one row per input; each caller gets its own row back.
+    """
+
+    def __init__(self, fn: Callable[[np.ndarray], np.ndarray], max_batch_size: int = 8,
+                 max_wait_ms: float = 5.0, name: str = "batcher"):
+        self.fn = fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._q: "queue.Queue[Tuple[np.ndarray, Future, float]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: np.ndarray) -> Future:
+        fut: Future = Future()
+        self._q.put((item, fut, time.perf_counter()))
+        return fut
+
+    def __call__(self, item: np.ndarray) -> np.ndarray:
+        """Blocking convenience wrapper around `submit`."""
+        return self.submit(item).result()
+
+    def _collect(self) -> List[Tuple[np.ndarray, Future, float]]:
+        batch = [self._q.get()]
+        deadline = batch[0][2] + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            # Callers that gave up (cancelled futures) are dropped here; the
+            # rest can no longer be cancelled, so setting results is safe.
+            batch = [b for b in self._collect() if b[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            for _, _, enq in batch:
+                metrics.observe(f"{self.name}.queue_delay_ms", (started - enq) * 1000.0)
+            metrics.observe(f"{self.name}.batch_size", len(batch))
+            metrics.inc(f"{self.name}.batches")
+            metrics.inc(f"{self.name}.items", len(batch))
+
+            try:
+                out = self.fn(np.stack([item for item, _, _ in batch]))
+                if len(out) != len(batch):
+                    raise RuntimeError(f"{self.name}: fn returned {len(out)} rows for {len(batch)} inputs")
+            except BaseException as e:  # hand the failure to every waiter
+                for _, fut, _ in batch:
+                    fut.set_exception(e)
+                continue
+            metrics.observe(f"{self.name}.forward_ms", (time.perf_counter() - started) * 1000.0)
+
+            for i, (_, fut, _) in enumerate(batch):
+                fut.set_result(out[i])
@@ -0,0 +1,99 @@
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+from backend.app.utils.cache import SqliteStore
+from backend.app.utils.tokens import count_tokens
+
+# A context is one JSON row in a SqliteStore shared by every worker:
+#   {"owner", "notes", "imaging_findings", "prefix", "notes_inline", "history", "created"}
+# `prefix` is rendered once at registration and reused verbatim, so each turn's
+# prompt starts with the same bytes (provider-side prompt caching keys on that).
+# The store's TTL restarts whenever a turn is recorded.
+
+MAX_STORED_TURNS = 50
+
+_store: Optional[SqliteStore] = None
+
+
+class ContextNotFound(KeyError):
+    """Unknown, expired, or owned by another user."""
+
+
+def _get_store() -> SqliteStore:
+    global _store
+    if _store is None:
+        _store = SqliteStore(settings.context_db_path, max_bytes=settings.context_max_bytes,
+                             ttl_s=settings.context_ttl_s)
+    return _store
+
+
+def create_context(owner: str, notes: Optional[str], imaging_findings: Optional[List[str]]) -> Dict[str, Any]:
+    from .chatbot import case_prefix  # chatbot imports this module
+
+    notes = (notes or "").strip()
+    findings = list(imaging_findings or [])[:20]
+    prefix, inline = case_prefix(notes, findings)
+    if notes and not inline:
+        from .retrieval import get_index
+        get_index(notes)  # build the index now rather than on the first question
+    context_id = uuid.uuid4().hex
+    _get_store().set(context_id, {
+        "owner": owner,
+        "notes": notes,
+        "imaging_findings": findings,
+        "prefix": prefix,
+        "notes_inline": inline,
+        "history": [],
+        "created": time.time(),
+    })
+    metrics.inc("chat_context.created")
+    return {"context_id": context_id, "expires_in_s": settings.context_ttl_s, "prefix_tokens": count_tokens(prefix)}
+
+
+def get_context(context_id: str, owner: str) -> Dict[str, Any]:
+    ctx = _get_store().get(context_id)
+    if ctx is None or ctx.get("owner") != owner:
+        raise ContextNotFound(context_id)
+    ctx["id"] = context_id
+    return ctx
+
+
+def delete_context(context_id: str, owner: str) -> None:
+    get_context(context_id, owner)
+    _get_store().delete(context_id)
+
+
+def record_turn(ctx: Dict[str, Any], question: str, reply: str) -> None:
+    """
+    Append a turn to the stored context (which also restarts its TTL). Applied
+    to the row as it is now, so concurrent turns on one context are all kept.
+    """
+    turn = {"q": question, "a": reply}
+
+    def append(stored: Dict[str, Any]) -> Dict[str, Any]:
+        stored["history"] = (stored.get("history") or [])[-(MAX_STORED_TURNS - 1):] + [turn]
+        return stored
+    stored = _get_store().update(ctx["id"], append)
+    if stored is not None:
+        ctx["history"] = stored["history"]
+
+
+def history_block(history: List[Dict[str, str]], max_tokens: int) -> str:
+    """Most recent turns that fit in `max_tokens`, oldest first; older turns are dropped."""
+    kept: List[str] = []
+    budget = max_tokens
+    for turn in reversed(history or []):
+        text = f"User: {turn['q']}\nAssistant: {turn['a']}"
+        n = count_tokens(text)
+        if n > budget:
+            break
+        kept.append(text)
+        budget -= n
+    if not kept:
+        return ""
+    dropped = len(history) - len(kept)
+    head = f"(Earlier conversation: {dropped} older turn(s) omitted.)\n" if dropped else ""
+    return head + "\n\n".join(reversed(kept))
@@ -1,4 +1,11 @@
-from .llm_client import chat_complete
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from backend.app.core.config import settings
+from backend.app.utils.tokens import count_tokens
+from .case_context import history_block, record_turn
+from .llm_client import achat_complete, astream_chat_complete, chat_complete
+from .retrieval import retrieve
 
 SYSTEM = (
     "You are a careful, empathetic medical assistant for clinicians and patients. "
@@ -12,20 +19,104 @@ DISCLAIMER = (
     "For urgent concerns, seek immediate care._"
 )
 
-def answer(message: str, notes: str | None = None, imaging_findings: list[str] | None = None) -> str:
+INSTRUCTIONS = (
+    "Answer directly, referencing the context where possible (cite excerpts as [n]). "
+    "If probabilities are mentioned in imaging, keep them as probabilities."
+)
+
+def _findings_block(imaging_findings: list[str] | None) -> str:
+    joined = "\n".join(f"- {f}" for f in (imaging_findings or [])[:20])
+    return f"Imaging findings:\n{joined}"
+
+def _build_prompt(message: str, chunks: List[Dict[str, Any]], imaging_findings: list[str] | None) -> str:
     ctx_parts = []
-    if notes:
-        ctx_parts.append(f"Clinical notes:\n{notes.strip()[:5000]}")
+    if chunks:
+        excerpts = "\n\n".join(f"[{c['chunk']}] {c['text']}" for c in chunks)
+        ctx_parts.append(f"Clinical notes (relevant excerpts):\n{excerpts}")
     if imaging_findings:
-        joined = "\n".join(f"- {f}" for f in imaging_findings[:20])
-        ctx_parts.append(f"Imaging findings:\n{joined}")
+        ctx_parts.append(_findings_block(imaging_findings))
     ctx = "\n\n".join(ctx_parts) if ctx_parts else "(no case context provided)"
 
-    user = (
+    return (
         f"Context for this case:\n{ctx}\n\n"
         f"User question: {message}\n\n"
-        "Answer directly, referencing the context where possible. "
-        "If probabilities are mentioned in imaging, keep them as probabilities."
+        + INSTRUCTIONS
     )
-    out = chat_complete(SYSTEM, user, temperature=0.3)
+
+def case_prefix(notes: str, imaging_findings: List[str]) -> Tuple[str, bool]:
+    """
+    Fixed leading part of every prompt in a context session -> (prefix, notes inlined).
+    Notes up to CONTEXT_INLINE_NOTES_TOKENS go in whole; longer notes stay
+    out of the prefix and are retrieved per question instead.
+    """
+    inline = bool(notes) and count_tokens(notes) <= settings.context_inline_notes_tokens
+    parts = []
+    if inline:
+        parts.append(f"Clinical notes:\n{notes}")
+    elif notes:
+        parts.append("Clinical notes: long record; the relevant excerpts follow with each question.")
+    if imaging_findings:
+        parts.append(_findings_block(imaging_findings))
+    return "Context for this case:\n" + ("\n\n".join(parts) or "(no case context provided)"), inline
+
+def _build_session_prompt(message: str, ctx: Dict[str, Any], chunks: List[Dict[str, Any]]) -> str:
+    parts = [ctx["prefix"]]
+    if chunks:
+        excerpts = "\n\n".join(f"[{c['chunk']}] {c['text']}" for c in chunks)
+        parts.append(f"Clinical notes (relevant excerpts):\n{excerpts}")
+    history = history_block(ctx.get("history") or [], settings.context_history_tokens)
+    if history:
+        parts.append(f"Conversation so far:\n{history}")
+    parts.append(f"User question: {message}\n\n" + INSTRUCTIONS)
+    return "\n\n".join(parts)
+
+def _prepare(message: str, notes: str | None, imaging_findings: list[str] | None,
+             context: Dict[str, Any] | None) -> Tuple[str, List[Dict[str, Any]]]:
+    """-> (prompt, note chunks sent). Notes inlined in a session prefix yield no chunks."""
+    if context is not None:
+        long_notes = context["notes"] and not context["notes_inline"]
+        chunks = retrieve(context["notes"], message) if long_notes else []
+        return _build_session_prompt(message, context, chunks), chunks
+    chunks = retrieve(notes, message) if notes else []
+    return _build_prompt(message, chunks, imaging_findings), chunks
+
+def _citations(chunks: List[Dict[str, Any]], citations_out: list | None) -> None:
+    if citations_out is not None:
+        citations_out.extend(chunks)
+
+# Notes are never sent whole: the BM25 index (services.retrieval) picks the
+# top RETRIEVAL_TOP_K chunks within RETRIEVAL_MAX_TOKENS, and the chunks sent
+# are handed back through `citations_out`. With a `context` (services.case_context)
+# the stored notes, findings and history are used and the turn is recorded.
+
+def answer(message: str, notes: str | None = None, imaging_findings: list[str] | None = None,
+           citations_out: list | None = None, context: Dict[str, Any] | None = None) -> str:
+    prompt, chunks = _prepare(message, notes, imaging_findings, context)
+    _citations(chunks, citations_out)
+    out = chat_complete(SYSTEM, prompt, temperature=0.3, route="chat")
+    if context is not None:
+        record_turn(context, message, out)
     return out + DISCLAIMER
+
+async def aanswer(message: str, notes: str | None = None, imaging_findings: list[str] | None = None,
+                  citations_out: list | None = None, context: Dict[str, Any] | None = None) -> str:
+    prompt, chunks = await asyncio.to_thread(_prepare, message, notes, imaging_findings, context)
+    _citations(chunks, citations_out)
+    out = await achat_complete(SYSTEM, prompt, temperature=0.3, route="chat")
+    if context is not None:
+        await asyncio.to_thread(record_turn, context, message, out)
+    return out + DISCLAIMER
+
+async def astream_answer(message: str, notes: str | None = None, imaging_findings: list[str] | None = None,
+                         citations_out: list | None = None,
+                         context: Dict[str, Any] | None = None) -> AsyncIterator[str]:
+    """Token stream of `aanswer`; the disclaimer is the last chunk."""
+    prompt, chunks = await asyncio.to_thread(_prepare, message, notes, imaging_findings, context)
+    _citations(chunks, citations_out)
+    parts = []
+    async for delta in astream_chat_complete(SYSTEM, prompt, temperature=0.3, route="chat"):
+        parts.append(delta)
+        yield delta
+    if context is not None:
+        await asyncio.to_thread(record_turn, context, message, "".join(parts).strip())
+    yield DISCLAIMER
@@ -1,70 +1,181 @@
-from typing import Dict, Any
-import io, numpy as np
-from PIL import Image
-import torch
-import torchxrayvision as xrv
-from skimage.transform import resize
-import pydicom
+from typing import TYPE_CHECKING, Dict, Any
+import hashlib, threading, numpy as np
+
+from backend.app.core.config import settings
+from backend.app.utils.cache import TieredCache
+from backend.app.utils.uploads import as_stream
+from .batcher import MicroBatcher
+
+# torch, torchxrayvision, scikit-image, PIL and pydicom are imported on first
+# use: importing this module (and so the images router) stays cheap, and
+# processes that never analyze an image never load them.
+if TYPE_CHECKING:
+    from PIL import Image
+    from .inference_backends import InferenceBackend
+
+MODEL_WEIGHTS = "densenet121-res224-all"  # 18 findings
 
 # Load once (global)
 _model = None
 _transform = None
 _LABELS = None
+_backend = None
+_backend_lock = threading.Lock()
+_batcher = None
+_batcher_lock = threading.Lock()
+_result_cache = None
 
 def _init_model():
     global _model, _transform, _LABELS
     if _model is None:
-        _model = xrv.models.DenseNet(weights="densenet121-res224-all")  # 18 findings
+        import torchxrayvision as xrv
+        _model = xrv.models.DenseNet(weights=MODEL_WEIGHTS)
         _model.eval()
         _transform = xrv.datasets.XRayCenterCrop()  # simple center crop + normalize
         _LABELS = list(_model.pathologies)
     return _model, _transform, _LABELS
 
-def _load_as_float32_grayscale(img: Image.Image) -> np.ndarray:
+def _load_eager():
+    model, _, labels = _init_model()
+    return model, labels
+
+def _get_backend() -> "InferenceBackend":
+    """Engine chosen by INFERENCE_BACKEND (eager | torchscript | onnx | int8)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                from .inference_backends import build_backend
+                _backend = build_backend(
+                    settings.inference_backend,
+                    _load_eager,
+                    settings.inference_artifact_dir,
+                    threads=settings.inference_threads,
+                )
+    return _backend
+
+def warmup(batch_size: int = 1) -> None:
+    """Load the engine and run a dummy forward so the first request skips lazy init."""
+    _forward_batch(np.zeros((batch_size, TARGET, TARGET), dtype=np.float32))
+
+def freeze_for_fork() -> None:
+    """
+    Prepare loaded weights to be inherited by forked workers: no autograd
+    state, tensors moved to shared memory so every child maps the same pages.
+    """
+    import torch
+    backend = _get_backend()
+    model = getattr(backend, "model", None)
+    if isinstance(model, torch.nn.Module):
+        for p in model.parameters():
+            p.requires_grad_(False)
+        model.share_memory()
+
+def _forward_batch(batch: np.ndarray) -> np.ndarray:
+    """[B, 224, 224] z-normed float32 -> [B, n_labels] probabilities."""
+    return _get_backend()(batch)
+
+def _get_batcher() -> MicroBatcher | None:
+    global _batcher
+    if settings.inference_max_batch_size <= 1:
+        return None
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(
+                    _forward_batch,
+                    max_batch_size=settings.inference_max_batch_size,
+                    max_wait_ms=settings.inference_max_wait_ms,
+                    name="densenet",
+                )
+    return _batcher
+
+# -------------------------------------------------------------------
+# Preprocessing: shrink as early (and as cheaply) as possible, then do the
+# exact anti-aliased resize to 224 on a small array.
+# -------------------------------------------------------------------
+TARGET = 224
+_scratch_tls = threading.local()
+
+def _scratch(shape) -> np.ndarray:
+    """Per-thread float32 buffer, grown on demand and reused across requests."""
+    need = shape[0] * shape[1]
+    buf = getattr(_scratch_tls, "buf", None)
+    if buf is None or buf.size < need:
+        buf = np.empty(need, dtype=np.float32)
+        _scratch_tls.buf = buf
+    return buf[:need].reshape(shape)
+
+def _reduce_factor(w: int, h: int) -> int:
+    # Keep >= 2x the target so the final anti-aliased resize still does the
+    # smoothing; the cheap integer box reduce only removes the bulk.
+    return max(1, min(w, h) // (2 * TARGET))
+
+def _resize_to_target(arr: np.ndarray) -> np.ndarray:
+    from skimage.transform import resize
+    return resize(arr, (TARGET, TARGET), preserve_range=True, anti_aliasing=True).astype(np.float32, copy=False)
+
+def _open_image(img_bytes: bytes):
+    """Returns (PIL image, original (w, h)). JPEGs are decoded at reduced DCT scale."""
+    from PIL import Image
+    pil = Image.open(as_stream(img_bytes))  # no copy of an mmapped upload
+    size = pil.size
+    if pil.format == "JPEG":
+        pil.draft("L", (2 * TARGET, 2 * TARGET))
+    return pil, size
+
+def _load_as_float32_grayscale(img: "Image.Image") -> np.ndarray:
     img = img.convert("L")  # grayscale
-    arr = np.asarray(img).astype(np.float32)
+    factor = _reduce_factor(*img.size)
+    if factor > 1:
+        img = img.reduce(factor)  # box filter in C on uint8
+    u8 = np.asarray(img)
+    arr = _scratch(u8.shape)
+    np.copyto(arr, u8)
     # normalize to 0..1
-    if arr.max() > 1.0:
-        arr /= 255.0
+    if u8.max() > 1:
+        arr *= np.float32(1.0 / 255.0)
     # model expects 224x224
-    arr = resize(arr, (224, 224), preserve_range=True, anti_aliasing=True).astype(np.float32)
-    return arr
-
-def _dicom_to_pil(dcm_bytes: bytes) -> Image.Image:
-    ds = pydicom.dcmread(io.BytesIO(dcm_bytes))
-    arr = ds.pixel_array.astype(np.float32)
-    # rescale if present
-    if hasattr(ds, "RescaleSlope") and hasattr(ds, "RescaleIntercept"):
-        arr = arr * float(ds.RescaleSlope) + float(ds.RescaleIntercept)
-    arr = arr - arr.min()
-    if arr.max() > 0:
-        arr = arr / arr.max()
-    arr = (arr * 255.0).clip(0, 255).astype(np.uint8)
-    return Image.fromarray(arr)
+    return _resize_to_target(arr)
+
+def _dicom_to_float32(dcm_bytes: bytes, frame: int = 0):
+    """DICOM -> (224x224 float32 in 0..1, original (w, h)); header-first, see utils.dicom_reader."""
+    from backend.app.utils.dicom_reader import decode_reduced
+    arr, size, _ = decode_reduced(dcm_bytes, min_side=2 * TARGET, frame=frame)
+    return _resize_to_target(arr), size
+
+def is_dicom(img_bytes: bytes, filename: str | None = None) -> bool:
+    if filename and filename.lower().endswith(".dcm"):
+        return True
+    return img_bytes[128:132] == b"DICM"  # PACS exports often have no extension
+
+def preprocess_image_bytes(img_bytes: bytes, filename: str | None = None, frame: int = 0):
+    """Upload bytes -> (224x224 z-normed float32, original (w, h))."""
+    if is_dicom(img_bytes, filename):
+        arr, size = _dicom_to_float32(img_bytes, frame=frame)
+    else:
+        pil, size = _open_image(img_bytes)
+        arr = _load_as_float32_grayscale(pil)   # HxW in 0..1
+    arr -= arr.mean()
+    arr /= arr.std(ddof=1) + 1e-8               # z-norm (per image, as torch.std)
+    return arr, size
 
 def analyze_image_bytes(img_bytes: bytes, filename: str | None = None) -> Dict[str, Any]:
     """
     Returns model probabilities for common chest x-ray findings, plus top findings.
     Supports PNG/JPG and DICOM (.dcm).
     """
-    # Load as PIL image (handle DICOM)
-    if filename and filename.lower().endswith(".dcm"):
-        pil = _dicom_to_pil(img_bytes)
-    else:
-        pil = Image.open(io.BytesIO(img_bytes))
+    arr, (w, h) = preprocess_image_bytes(img_bytes, filename)
 
-    w, h = pil.size
+    # Inference (micro-batched with concurrent callers when enabled)
+    labels = _get_backend().labels
+    batcher = _get_batcher()
+    row = batcher(arr) if batcher is not None else _forward_batch(arr[None])[0]
+    return format_result(row.tolist(), labels, (w, h))
 
-    # Prepare tensor
-    arr = _load_as_float32_grayscale(pil)         # HxW in 0..1
-    img_tensor = torch.from_numpy(arr)[None, None, :, :]  # [B, C, H, W]
-    img_tensor = (img_tensor - img_tensor.mean()) / (img_tensor.std() + 1e-8)  # z-norm
-
-    # Inference
-    model, _, labels = _init_model()
-    with torch.no_grad():
-        out = model(img_tensor)                   # logits
-        probs = torch.sigmoid(out)[0].cpu().numpy().tolist()
+def format_result(probs, labels, size) -> Dict[str, Any]:
+    """Shape shared by /images/analyze, study results and whatever feeds summarize_notes."""
+    w, h = size if size else (None, None)
 
     # Create label→prob mapping and top-5 findings (threshold 0.5 for MVP)
     findings = [{ "label": l, "prob": float(p) } for l, p in zip(labels, probs)]
@@ -78,8 +189,27 @@ def analyze_image_bytes(img_bytes: bytes, filename: str | None = None) -> Dict[s
 
     return {
         "modality": "chest-xray (inferred)",
-        "shape": [w, h],
+        "shape": [w, h] if size else [],
         "top5": top,
         "positive": pos,
         "findings": textual if textual else ["No strong positive findings"],
     }
+
+def image_cache_key(img_bytes: bytes) -> str:
+    """Content address of an upload under the current model weights and engine (INT8 output differs)."""
+    h = hashlib.sha256(f"{MODEL_WEIGHTS}\0{settings.inference_backend}".encode())
+    h.update(b"\0")
+    h.update(img_bytes)
+    return h.hexdigest()
+
+def get_result_cache() -> TieredCache:
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = TieredCache(
+            "image_cache",
+            max_items=settings.image_cache_max_items,
+            ttl_s=settings.image_cache_ttl_s,
+            disk_path=settings.image_cache_path,
+            disk_max_bytes=settings.image_cache_max_bytes,
+        )
+    return _result_cache
@@ -0,0 +1,148 @@
+import json
+import os
+from typing import List
+
+import numpy as np
+import torch
+
+# Engines a CPU node can pick via INFERENCE_BACKEND. All of them take a
+# [B, 224, 224] z-normed float32 batch and return [B, n_labels] probabilities,
+# so the rest of the analyzer does not care which one is active.
+BACKENDS = ("eager", "torchscript", "onnx", "int8")
+
+TORCHSCRIPT_FILE = "densenet.ts"
+ONNX_FILE = "densenet.onnx"
+INT8_FILE = "densenet.int8.ts"
+LABELS_FILE = "labels.json"
+
+
+def configure_threads(n: int) -> None:
+    """Pin torch intra-op threads (0 keeps torch's default)."""
+    if n > 0:
+        torch.set_num_threads(n)
+
+
+class InferenceBackend:
+    name = "base"
+
+    def __init__(self, labels: List[str]):
+        self.labels = labels
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class EagerBackend(InferenceBackend):
+    name = "eager"
+
+    def __init__(self, model: torch.nn.Module, labels: List[str]):
+        super().__init__(labels)
+        self.model = model.eval()
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        with torch.inference_mode():
+            out = self.model(torch.from_numpy(batch)[:, None, :, :])
+            return torch.sigmoid(out).cpu().numpy()
+
+
+class TorchScriptBackend(EagerBackend):
+    name = "torchscript"
+    optimize = True
+
+    @classmethod
+    def load(cls, path: str, labels: List[str]) -> "TorchScriptBackend":
+        module = torch.jit.load(path, map_location="cpu").eval()
+        if cls.optimize:
+            module = torch.jit.optimize_for_inference(module)
+        return cls(module, labels)
+
+
+class Int8Backend(TorchScriptBackend):
+    name = "int8"
+    optimize = False  # freezing passes do not handle dynamic-quantized linears
+
+
+class OnnxBackend(InferenceBackend):
+    name = "onnx"
+
+    def __init__(self, path: str, labels: List[str], threads: int = 0):
+        super().__init__(labels)
+        import onnxruntime as ort  # optional: pip install onnxruntime
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        (out,) = self.session.run(None, {self.input_name: np.ascontiguousarray(batch[:, None, :, :])})
+        return 1.0 / (1.0 + np.exp(-out))
+
+
+# -------------------------------------------------------------------
+# Offline export (see backend/scripts/export_models.py)
+# -------------------------------------------------------------------
+def _example(batch: int = 1) -> torch.Tensor:
+    return torch.randn(batch, 1, 224, 224)
+
+
+def quantize_int8(model: torch.nn.Module) -> torch.nn.Module:
+    # Dynamic quantization rewrites nn.Linear (DenseNet's classifier head);
+    # the conv trunk stays float, so expect a modest, not 4x, speedup.
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def export_artifacts(model: torch.nn.Module, labels: List[str], out_dir: str) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    model = model.eval()
+    paths = {}
+    with torch.inference_mode():
+        traced = torch.jit.trace(model, _example(), check_trace=False)
+        paths["torchscript"] = os.path.join(out_dir, TORCHSCRIPT_FILE)
+        torch.jit.save(traced, paths["torchscript"])
+
+        int8 = torch.jit.trace(quantize_int8(model), _example(), check_trace=False)
+        paths["int8"] = os.path.join(out_dir, INT8_FILE)
+        torch.jit.save(int8, paths["int8"])
+
+    paths["onnx"] = os.path.join(out_dir, ONNX_FILE)
+    torch.onnx.export(
+        model, _example(), paths["onnx"],
+        input_names=["image"], output_names=["logits"],
+        dynamic_axes={"image": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=17,
+    )
+    with open(os.path.join(out_dir, LABELS_FILE), "w") as f:
+        json.dump(labels, f)
+    return paths
+
+
+def build_backend(name: str, model_loader, artifact_dir: str, threads: int = 0) -> InferenceBackend:
+    """
+    `model_loader` returns (eager_model, labels); it is only called when the
+    engine needs the eager weights, so ONNX nodes never import the xrv model.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {name!r}; expected one of {BACKENDS}")
+    configure_threads(threads)
+
+    if name == "eager":
+        return EagerBackend(*model_loader())
+
+    labels_path = os.path.join(artifact_dir, LABELS_FILE)
+    files = {"torchscript": TORCHSCRIPT_FILE, "int8": INT8_FILE, "onnx": ONNX_FILE}
+    path = os.path.join(artifact_dir, files[name])
+    if not (os.path.exists(path) and os.path.exists(labels_path)):
+        raise RuntimeError(
+            f"{name} artifact missing at {path}; run `python -m backend.scripts.export_models`"
+        )
+    with open(labels_path) as f:
+        labels = json.load(f)
+
+    if name == "onnx":
+        return OnnxBackend(path, labels, threads=threads)
+    if name == "int8":
+        return Int8Backend.load(path, labels)
+    return TorchScriptBackend.load(path, labels)
@@ -0,0 +1,110 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the admission queue is full; carries a Retry-After hint."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"inference queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    """
+    Dedicated executor for CPU-bound imaging work (decode, resize, inference).
+
+    Threads rather than processes: torch and the image codecs release the GIL,
+    and staying in-process lets concurrent calls share one model and one
+    micro-batcher. At most `workers + max_queue` calls are admitted; the rest
+    are rejected immediately so the event loop never piles up waiters. A
+    call keeps its admission slot until its thread finishes, even if the
+    caller has given up on it.
+    """
+
+    def __init__(self, workers: int, max_queue: int, name: str = "inference"):
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, max_queue)
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._freed = threading.Condition(self._lock)
+        self._admitted = 0
+        self._avg_s = 1.0  # EWMA of call duration, seeds the Retry-After hint
+
+    def retry_after(self) -> int:
+        waves = math.ceil(self.capacity / self.workers)
+        return max(1, math.ceil(waves * self._avg_s))
+
+    def _take(self, wait: bool = False) -> bool:
+        with self._lock:
+            while self._admitted >= self.capacity:
+                if not wait:
+                    return False
+                self._freed.wait()
+            self._admitted += 1
+            metrics.observe(f"{self.name}.admitted", self._admitted)
+            return True
+
+    def admit(self) -> None:
+        """Take an admission slot or raise InferenceQueueFull; pair with `release`."""
+        if not self._take():
+            metrics.inc(f"{self.name}.rejected")
+            raise InferenceQueueFull(self.retry_after())
+
+    def release(self, took: float | None = None) -> None:
+        with self._lock:
+            self._admitted -= 1
+            if took is not None:
+                self._avg_s = 0.8 * self._avg_s + 0.2 * took
+            self._freed.notify()
+        if took is not None:
+            metrics.observe(f"{self.name}.latency_ms", took * 1000.0)
+
+    def _submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Run `fn` on the pool under an admission slot already taken; the slot is freed when it finishes."""
+        start = time.perf_counter()
+        try:
+            fut = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self.release()
+            raise
+        fut.add_done_callback(lambda _: self.release(time.perf_counter() - start))
+        return fut
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Admit (or raise InferenceQueueFull) and schedule `fn`."""
+        self.admit()
+        return self._submit(fn, *args, **kwargs)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        # Cancelling the await abandons the result, not the thread: the slot
+        # stays taken until the call really ends.
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Blocking `run` for background threads (jobs): waits for admission instead of raising."""
+        self._take(wait=True)
+        return self._submit(fn, *args, **kwargs).result()
+
+
+def pool_workers() -> int:
+    """Pool threads: at least one per batch slot, or the micro-batcher never sees a full batch."""
+    return max(settings.inference_workers, settings.inference_max_batch_size)
+
+
+_pool: InferencePool | None = None
+
+
+def get_inference_pool() -> InferencePool:
+    global _pool
+    if _pool is None:
+        _pool = InferencePool(pool_workers(), settings.inference_max_queue)
+    return _pool
@@ -0,0 +1,379 @@
+import hashlib
+import importlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+from backend.app.utils.uploads import mapped
+from .scheduler import Overloaded, get_scheduler, priority
+
+logger = logging.getLogger("jobs")
+
+# kind -> "module:function". Resolved on first use so submitting a job never
+# imports torch or the LLM client in the web process' request path.
+HANDLERS: Dict[str, str] = {
+    "image.analyze": "backend.app.services.jobs:_run_image_analyze",
+    "records.summarize": "backend.app.services.jobs:_run_summarize",
+}
+
+# Jobs also run under the role scheduler (waiting, never shed), so background
+# work competes for inference/LLM capacity at its submitter's priority.
+SCHEDULERS: Dict[str, str] = {
+    "image.analyze": "inference",
+    "records.summarize": "llm",
+}
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+MAX_ATTEMPTS = 3  # a job whose worker keeps dying is eventually failed, not retried forever
+
+
+class JobError(Exception):
+    """A handler failure with the HTTP status its result endpoint should report."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+
+
+def _run_image_analyze(payload: Dict[str, Any], blob: Optional[bytes]) -> Any:
+    """Same path as /images/analyze: result cache, then the inference pool."""
+    from backend.app.services.image_analyzer import analyze_image_bytes, get_result_cache, image_cache_key
+    from backend.app.services.inference_pool import get_inference_pool
+    from backend.app.utils.common import UnsupportedDicom
+    cache = get_result_cache()
+    key = image_cache_key(blob)
+    result, _ = cache.get(key)
+    if result is not None:
+        return result
+    try:
+        result = get_inference_pool().call(analyze_image_bytes, blob, filename=payload.get("filename"))
+    except UnsupportedDicom as e:
+        raise JobError(415, str(e))
+    cache.set(key, result)
+    return result
+
+
+def _run_summarize(payload: Dict[str, Any], blob: Optional[bytes]) -> Any:
+    from backend.app.services.summarizer import summarize_notes
+    return summarize_notes(payload["text"], payload.get("imaging_findings") or [])
+
+
+def dedup_key(kind: str, payload: Dict[str, Any], blob: Optional[bytes] = None,
+              owner: Optional[str] = None) -> str:
+    h = hashlib.sha256(kind.encode())
+    h.update(b"\0" + (owner or "").encode() + b"\0")
+    h.update(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode())
+    if blob is not None:
+        h.update(blob)
+    return h.hexdigest()
+
+
+class JobQueue:
+    """
+    Persistent job queue on SQLite (WAL), shared by every worker process on
+    the host. Jobs are claimed atomically, so any process may run any job; a
+    job whose lease lapses (the process died mid-run) is queued again.
+    Identical queued/running/done jobs of the same owner are deduplicated by
+    content key, and finished jobs are removed once their TTL passes. A
+    running job's lease is renewed while its worker is alive; a job left
+    queued for `queued_ttl_s` fails instead of waiting forever.
+    """
+
+    def __init__(self, path: str, workers: int = 2, ttl_s: float = 3600.0, lease_s: float = 300.0,
+                 queued_ttl_s: float = 24 * 3600.0):
+        self.path = path
+        self.blob_dir = os.path.join(os.path.dirname(os.path.abspath(path)), "job_blobs")
+        self.workers = workers
+        self.ttl_s = ttl_s
+        self.lease_s = lease_s
+        self.queued_ttl_s = queued_ttl_s
+        self._local = threading.local()
+        self._started = False
+        self._kinds = tuple(HANDLERS)
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._conn().executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, dedup TEXT NOT NULL, status TEXT NOT NULL,"
+            " payload TEXT NOT NULL, blob TEXT, result TEXT, error TEXT,"
+            " created REAL NOT NULL, updated REAL NOT NULL, lease REAL, expires REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0);"
+            "CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs(dedup);"
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created);"
+        )
+        cols = {r["name"] for r in self._conn().execute("PRAGMA table_info(jobs)")}
+        if "role" not in cols:  # databases created before role scheduling
+            self._conn().executescript(
+                "ALTER TABLE jobs ADD COLUMN role TEXT;"
+                "ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 1;"
+            )
+        if "owner" not in cols:  # databases created before per-user jobs
+            self._conn().executescript(
+                "ALTER TABLE jobs ADD COLUMN owner TEXT;"
+                "ALTER TABLE jobs ADD COLUMN code INTEGER;"
+            )
+        if "delivered" not in cols:
+            self._conn().execute("ALTER TABLE jobs ADD COLUMN delivered REAL")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    # --- client side ----------------------------------------------------
+    def submit(self, kind: str, payload: Dict[str, Any], blob: Optional[bytes] = None,
+               role: Optional[str] = None, owner: Optional[str] = None) -> Dict[str, Any]:
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind {kind!r}")
+        self.start()
+        key = dedup_key(kind, payload, blob, owner)
+        now = time.time()
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            row = c.execute(
+                "SELECT id, status FROM jobs WHERE dedup = ? AND status != ? "
+                "AND (expires IS NULL OR expires > ?) ORDER BY created DESC LIMIT 1",
+                (key, FAILED, now),
+            ).fetchone()
+            if row is not None:
+                c.execute("COMMIT")
+                metrics.inc("jobs.deduplicated")
+                return {"job_id": row["id"], "status": row["status"], "deduplicated": True}
+
+            job_id = uuid.uuid4().hex
+            blob_path = None
+            if blob is not None:
+                blob_path = os.path.join(self.blob_dir, f"{job_id}.bin")
+                with open(blob_path, "wb") as f:
+                    f.write(blob)
+            c.execute(
+                "INSERT INTO jobs (id, kind, dedup, status, payload, blob, created, updated, expires, role, priority, "
+                "owner) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, key, QUEUED, json.dumps(payload), blob_path, now, now, now + self.queued_ttl_s,
+                 role, priority(role), owner),
+            )
+            c.execute("COMMIT")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+        metrics.inc(f"jobs.submitted.{kind}")
+        self._wake.set()
+        return {"job_id": job_id, "status": QUEUED, "deduplicated": False}
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The job, or None if it is unknown, expired or not `owner`'s."""
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["owner"] != owner:
+            return None
+        out = {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "created": row["created"],
+            "updated": row["updated"],
+        }
+        if row["status"] == DONE:
+            out["result"] = json.loads(row["result"])
+        if row["status"] == FAILED:
+            out["error"] = row["error"]
+            out["code"] = row["code"] or 500
+        return out
+
+    def serves(self, kind: str) -> bool:
+        """Whether this process' workers run `kind` jobs (all kinds until `start` narrows them)."""
+        return kind in self._kinds
+
+    def mark_delivered(self, job_id: str) -> bool:
+        """Note that a finished job's result was read; -> True only the first time."""
+        cur = self._conn().execute("UPDATE jobs SET delivered = ? WHERE id = ? AND status = ? AND delivered IS NULL",
+                                   (time.time(), job_id, DONE))
+        return cur.rowcount == 1
+
+    # --- worker side ----------------------------------------------------
+    def start(self, kinds: Optional[Iterable[str]] = None) -> None:
+        """
+        Start this process' worker threads (idempotent), claiming only jobs of
+        `kinds` (default: all); other kinds are left to the pods that serve them.
+        """
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            if kinds is not None:
+                self._kinds = tuple(k for k in kinds if k in HANDLERS)
+            for i in range(self.workers if self._kinds else 0):
+                threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+            threading.Thread(target=self._janitor, name="job-janitor", daemon=True).start()
+            self._started = True
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        now = time.time()
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            row = c.execute(
+                "SELECT * FROM jobs WHERE (status = ? OR (status = ? AND lease < ?)) "
+                f"AND kind IN ({','.join('?' * len(self._kinds))}) "
+                "ORDER BY priority DESC, created LIMIT 1",
+                (QUEUED, RUNNING, now, *self._kinds),
+            ).fetchone()
+            if row is not None:
+                if row["attempts"] >= MAX_ATTEMPTS:
+                    c.execute(
+                        "UPDATE jobs SET status = ?, error = ?, updated = ?, lease = NULL, expires = ? "
+                        "WHERE id = ?",
+                        (FAILED, "worker lost too many times", now, now + self.ttl_s, row["id"]),
+                    )
+                    row = None
+                else:
+                    c.execute(
+                        "UPDATE jobs SET status = ?, lease = ?, updated = ?, expires = NULL, "
+                        "attempts = attempts + 1 WHERE id = ?",
+                        (RUNNING, now + self.lease_s, now, row["id"]),
+                    )
+            c.execute("COMMIT")
+            return row
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None,
+                code: Optional[int] = None) -> None:
+        now = time.time()
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, code = ?, updated = ?, lease = NULL, expires = ? "
+            "WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, code, now, now + self.ttl_s,
+             job_id),
+        )
+
+    def _requeue(self, job_id: str) -> None:
+        """Hand a claimed job back untouched (its attempt is not counted)."""
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, lease = NULL, updated = ?, expires = ?, attempts = attempts - 1 "
+            "WHERE id = ?",
+            (QUEUED, time.time(), time.time() + self.queued_ttl_s, job_id),
+        )
+
+    def _heartbeat(self, job_id: str, stop: threading.Event) -> None:
+        """Keep a running job's lease ahead of the clock until `stop` is set."""
+        while not stop.wait(self.lease_s / 3):
+            try:
+                self._conn().execute("UPDATE jobs SET lease = ? WHERE id = ? AND status = ?",
+                                     (time.time() + self.lease_s, job_id, RUNNING))
+            except sqlite3.Error as e:
+                logger.warning("job %s lease renewal failed: %s", job_id, e)
+
+    def _execute(self, row: sqlite3.Row) -> None:
+        started = time.perf_counter()
+        stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(row["id"], stop), name=f"job-lease-{row['id'][:8]}",
+                         daemon=True).start()
+        try:
+            module, _, fn = HANDLERS[row["kind"]].partition(":")
+            handler: Callable = getattr(importlib.import_module(module), fn)
+            payload = json.loads(row["payload"])
+            with ExitStack() as stack:
+                blob = None
+                if row["blob"]:
+                    blob = stack.enter_context(mapped(stack.enter_context(open(row["blob"], "rb"))))
+                sched = SCHEDULERS.get(row["kind"])
+                if sched and settings.sched_enabled:
+                    # Bounded, so a saturated scheduler cannot pin this worker
+                    # (and its lease) indefinitely; the job goes back in line.
+                    stack.enter_context(get_scheduler(sched).slot(row["role"], timeout=self.lease_s))
+                result = handler(payload, blob)
+        except Overloaded:
+            stop.set()
+            metrics.inc(f"jobs.requeued.{row['kind']}")
+            self._requeue(row["id"])  # keeps its blob
+            return
+        except Exception as e:
+            logger.warning("job %s (%s) failed: %s", row["id"], row["kind"], e)
+            metrics.inc(f"jobs.failed.{row['kind']}")
+            self._finish(row["id"], FAILED, error=str(e), code=getattr(e, "status_code", None))
+        else:
+            self._finish(row["id"], DONE, result=result)
+        finally:
+            stop.set()
+        if row["blob"]:
+            try:
+                os.remove(row["blob"])
+            except OSError:
+                pass
+        metrics.observe(f"jobs.run_ms.{row['kind']}", (time.perf_counter() - started) * 1000.0)
+        metrics.observe(f"jobs.wait_ms.{row['kind']}", (time.time() - row["created"]) * 1000.0)
+
+    def _worker(self) -> None:
+        while True:
+            try:
+                row = self._claim()
+            except sqlite3.Error as e:
+                logger.warning("job claim failed: %s", e)
+                row = None
+            if row is None:
+                self._wake.wait(timeout=1.0)  # other processes' submits are seen on the next poll
+                self._wake.clear()
+                continue
+            self._execute(row)
+
+    def _janitor(self) -> None:
+        while True:
+            time.sleep(60)
+            try:
+                self._cleanup(time.time())
+            except sqlite3.Error as e:
+                logger.warning("job cleanup failed: %s", e)
+
+    def _cleanup(self, now: float) -> None:
+        """Fail jobs no worker claimed in time; remove finished jobs past their TTL."""
+        c = self._conn()
+        failed = c.execute(
+            "UPDATE jobs SET status = ?, code = 503, error = ?, updated = ?, expires = ? "
+            "WHERE status = ? AND expires < ?",
+            (FAILED, "no worker picked the job up in time", now, now + self.ttl_s, QUEUED, now),
+        ).rowcount
+        if failed:
+            metrics.inc("jobs.unclaimed", failed)
+        args = (DONE, FAILED, now)
+        for (blob,) in c.execute(
+            "SELECT blob FROM jobs WHERE status IN (?, ?) AND expires < ? AND blob IS NOT NULL", args
+        ).fetchall():
+            try:
+                os.remove(blob)
+            except OSError:
+                pass
+        c.execute("DELETE FROM jobs WHERE status IN (?, ?) AND expires < ?", args)
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        os.makedirs(os.path.dirname(os.path.abspath(settings.jobs_db_path)), exist_ok=True)
+        _queue = JobQueue(
+            settings.jobs_db_path,
+            workers=settings.jobs_workers,
+            ttl_s=settings.jobs_result_ttl_s,
+            lease_s=settings.jobs_lease_s,
+            queued_ttl_s=settings.jobs_queued_ttl_s,
+        )
+    return _queue
@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+from backend.app.utils.cache import TieredCache
+
+# Cached value: {"text": str, "tokens": int, "ms": float} -- tokens and ms are
+# what the original call cost, so every hit can report what it saved.
+Completion = Tuple[str, int]
+
+_cache: Optional[TieredCache] = None
+_inflight_sync: Dict[str, Future] = {}
+_inflight_async: Dict[str, "asyncio.Future"] = {}
+_lock = threading.Lock()
+
+
+def get_llm_cache() -> TieredCache:
+    global _cache
+    if _cache is None:
+        _cache = TieredCache(
+            "llm_cache",
+            max_items=settings.llm_cache_max_items,
+            ttl_s=settings.llm_cache_ttl_s,
+            disk_path=settings.llm_cache_path,
+            disk_max_bytes=settings.llm_cache_max_bytes,
+        )
+    return _cache
+
+
+def cache_key(provider: str, model: str, system: str, user: str, temperature: float) -> str:
+    raw = json.dumps([provider, model, system, user, round(float(temperature), 4)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def enabled_for(route: str) -> bool:
+    return settings.llm_cache_enabled and route not in settings.llm_cache_bypass_routes
+
+
+def lookup(key: str) -> Optional[str]:
+    value, _ = get_llm_cache().get(key)
+    if value is None:
+        return None
+    metrics.inc("llm_cache.saved_tokens", value.get("tokens", 0))
+    metrics.inc("llm_cache.saved_ms", value.get("ms", 0.0))
+    return value["text"]
+
+
+def store(key: str, text: str, tokens: int, ms: float) -> None:
+    get_llm_cache().set(key, {"text": text, "tokens": tokens, "ms": ms})
+
+
+def cached_call(key: str, fn: Callable[[], Completion]) -> str:
+    """Blocking: cache hit, or join an identical in-flight call, or make it."""
+    hit = lookup(key)
+    if hit is not None:
+        return hit
+    with _lock:
+        fut = _inflight_sync.get(key)
+        leader = fut is None
+        if leader:
+            fut = Future()
+            _inflight_sync[key] = fut
+    if not leader:
+        metrics.inc("llm_cache.coalesced")
+        return fut.result()
+
+    started = time.perf_counter()
+    try:
+        text, tokens = fn()
+        store(key, text, tokens, (time.perf_counter() - started) * 1000.0)
+        fut.set_result(text)
+        return text
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            _inflight_sync.pop(key, None)
+
+
+async def acached_call(key: str, fn: Callable[[], Awaitable[Completion]]) -> str:
+    """
+    Async twin of `cached_call`; followers await the leader's future. If the
+    leader is cancelled (its client went away) a follower takes over the call
+    rather than failing with it.
+    """
+    hit = await asyncio.to_thread(lookup, key) if get_llm_cache().disk else lookup(key)
+    if hit is not None:
+        return hit
+    fut = _inflight_async.get(key)
+    while fut is not None:
+        metrics.inc("llm_cache.coalesced")
+        await asyncio.wait({fut})  # raises only if *we* are cancelled, not the leader
+        if not fut.cancelled():
+            return fut.result()
+        fut = _inflight_async.get(key)
+
+    fut = asyncio.get_running_loop().create_future()
+    _inflight_async[key] = fut
+    started = time.perf_counter()
+    try:
+        text, tokens = await fn()
+        ms = (time.perf_counter() - started) * 1000.0
+        if get_llm_cache().disk:
+            await asyncio.to_thread(store, key, text, tokens, ms)
+        else:
+            store(key, text, tokens, ms)
+        fut.set_result(text)
+        return text
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # mark retrieved so a follower-less failure is not logged as unhandled
+        raise
+    finally:
+        if _inflight_async.get(key) is fut:
+            del _inflight_async[key]
+
+
+def stats() -> Dict[str, Any]:
+    c = metrics.snapshot()["counters"]
+    hits = c.get("llm_cache.hit.memory", 0) + c.get("llm_cache.hit.disk", 0)
+    misses = c.get("llm_cache.miss", 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "coalesced": c.get("llm_cache.coalesced", 0),
+        "saved_tokens": c.get("llm_cache.saved_tokens", 0),
+        "saved_ms": c.get("llm_cache.saved_ms", 0),
+    }
@@ -1,4 +1,16 @@
+import asyncio
+import json
+import logging
+import time
+import weakref
+from typing import AsyncIterator
+
 from backend.app.core.config import settings  # read from Pydantic .env
+from backend.app.utils import metrics
+from backend.app.utils.tokens import count_tokens
+from . import llm_cache, llm_limiter, llm_resilience
+
+logger = logging.getLogger("llm")
 
 PROVIDER = (settings.llm_provider or "openai").lower()
 
@@ -6,51 +18,339 @@ _openai_client = None
 _nim_session = None
 _base_url = None
 
+# One pooled async HTTP client (and AsyncOpenAI wrapper) per event loop.
+# uvicorn runs a single loop per worker, so in practice this is one pool.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+def _messages(system: str, user: str) -> list:
+    return [{"role":"system","content":system},{"role":"user","content":user}]
+
+def _nim_model() -> str:
+    return settings.nim_model or "meta/llama-3.1-70b-instruct"
+
 def _init_openai():
     from openai import OpenAI  # pip install openai
     api_key = settings.openai_api_key
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY missing in .env")
-    return OpenAI(api_key=api_key)
+    # Retries and timeouts belong to llm_resilience, not the SDK.
+    return OpenAI(api_key=api_key, base_url=settings.openai_base_url, max_retries=0)
 
 def _init_nim():
-    import os, requests
-    api_key = os.getenv("NIM_API_KEY")
-    base = os.getenv("NIM_API_BASE")
+    import requests
+    api_key = settings.nim_api_key
+    base = settings.nim_api_base
     if not api_key or not base:
         raise RuntimeError("NIM_API_KEY/NIM_API_BASE missing in .env")
     s = requests.Session()
     s.headers.update({"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"})
     return s, base.rstrip("/")
 
-def chat_complete(system: str, user: str, temperature: float = 0.2) -> str:
+def _model_name(provider: str = PROVIDER) -> str:
+    if provider == "openai":
+        return settings.openai_model or "gpt-4o-mini"
+    if provider == "nim":
+        return _nim_model()
+    return ""
+
+def _providers() -> list:
+    """Configured provider first, then (LLM_FAILOVER) the other one if it has credentials."""
+    configured = {
+        "openai": bool(settings.openai_api_key),
+        "nim": bool(settings.nim_api_key and settings.nim_api_base),
+    }
+    out = [PROVIDER]
+    if settings.llm_failover:
+        out += [p for p in ("openai", "nim") if p != PROVIDER and configured[p]]
+    return out
+
+def _usage_tokens(usage) -> int:
+    if usage is None:
+        return 0
+    if isinstance(usage, dict):
+        return int(usage.get("total_tokens") or 0)
+    return int(getattr(usage, "total_tokens", 0) or 0)
+
+def _estimate_tokens(system: str, user: str) -> int:
+    """
+    Up-front charge against the limiter's tokens-per-minute bucket; 0 (without
+    tokenizing) when the limiter is off. Computed once per call, not per attempt.
+    """
+    if not settings.llm_limiter_enabled:
+        return 0
+    return count_tokens(system) + count_tokens(user) + settings.llm_limiter_completion_tokens
+
+async def _aestimate_tokens(system: str, user: str) -> int:
+    """`_estimate_tokens` off the event loop: a long prompt takes milliseconds to tokenize."""
+    if not settings.llm_limiter_enabled:
+        return 0
+    return await asyncio.to_thread(_estimate_tokens, system, user)
+
+def _complete_once(attempt: llm_resilience.Attempt, system: str, user: str, temperature: float, est: int):
+    """One upstream call through the host-wide limiter -> (text, total tokens billed)."""
+    provider = attempt.provider
+    lease = llm_limiter.acquire(provider, est)
+    attempt.begin()
+    used, throttled = 0, False
+    try:
+        text, used = _complete_upstream(provider, system, user, temperature, attempt.timeout)
+        return text, used
+    except Exception as e:
+        throttled = llm_resilience.is_throttle(e)
+        raise
+    finally:
+        llm_limiter.release(lease, provider, est, used, time.perf_counter() - attempt.started, throttled)
+
+def _complete_upstream(provider: str, system: str, user: str, temperature: float, timeout: float):
     global _openai_client, _nim_session, _base_url
 
-    if PROVIDER == "openai":
+    if provider == "openai":
         if _openai_client is None:
             _openai_client = _init_openai()
-        model = settings.openai_model or "gpt-4o-mini"
-        resp = _openai_client.chat.completions.create(
-            model=model,
-            messages=[{"role":"system","content":system},{"role":"user","content":user}],
+        resp = _openai_client.with_options(timeout=timeout).chat.completions.create(
+            model=_model_name(provider),
+            messages=_messages(system, user),
+            temperature=temperature,
+        )
+        return (resp.choices[0].message.content or "").strip(), _usage_tokens(resp.usage)
+
+    if _nim_session is None:
+        _nim_session, _base_url = _init_nim()
+    url = f"{_base_url}/v1/chat/completions"
+    payload = {
+        "model": _model_name(provider),
+        "messages": _messages(system, user),
+        "temperature": temperature,
+    }
+    r = _nim_session.post(url, json=payload, timeout=timeout)
+    r.raise_for_status()
+    data = r.json()
+    return (data["choices"][0]["message"]["content"] or "").strip(), _usage_tokens(data.get("usage"))
+
+def _chat_complete_uncached(system: str, user: str, temperature: float):
+    """-> (text, tokens), retried and failed over by `llm_resilience`."""
+    est = _estimate_tokens(system, user)
+    return llm_resilience.call(
+        lambda attempt: _complete_once(attempt, system, user, temperature, est), _providers()
+    )
+
+def chat_complete(system: str, user: str, temperature: float = 0.2, route: str = "llm") -> str:
+    """Blocking variant, for worker threads and scripts. Request handlers use `achat_complete`."""
+    if PROVIDER not in ("openai", "nim"):
+        return "(LLM disabled) " + user[:200]
+    if not llm_cache.enabled_for(route):
+        return _chat_complete_uncached(system, user, temperature)[0]
+    key = llm_cache.cache_key(PROVIDER, _model_name(), system, user, temperature)
+    return llm_cache.cached_call(key, lambda: _chat_complete_uncached(system, user, temperature))
+
+# -------------------------------------------------------------------
+# Async client: shared keep-alive pool, no threadpool thread per call
+# -------------------------------------------------------------------
+def _async_state() -> dict:
+    import httpx
+    loop = asyncio.get_running_loop()
+    state = _async_clients.get(loop)
+    if state is None:
+        http = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.llm_timeout_s, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_connections,
+                max_keepalive_connections=settings.llm_max_keepalive,
+                keepalive_expiry=settings.llm_keepalive_s,
+            ),
+        )
+        state = {"http": http, "openai": None}
+        _async_clients[loop] = state
+    return state
+
+def _async_openai(state: dict):
+    if state["openai"] is None:
+        from openai import AsyncOpenAI
+        if not settings.openai_api_key:
+            raise RuntimeError("OPENAI_API_KEY missing in .env")
+        state["openai"] = AsyncOpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url,
+                                      http_client=state["http"], max_retries=0)
+    return state["openai"]
+
+def _nim_url_headers():
+    if not settings.nim_api_key or not settings.nim_api_base:
+        raise RuntimeError("NIM_API_KEY/NIM_API_BASE missing in .env")
+    url = f"{settings.nim_api_base.rstrip('/')}/v1/chat/completions"
+    return url, {"Authorization": f"Bearer {settings.nim_api_key}"}
+
+async def _acomplete_once(attempt: llm_resilience.Attempt, system: str, user: str, temperature: float, est: int):
+    provider = attempt.provider
+    lease = await llm_limiter.aacquire(provider, est)
+    attempt.begin()
+    used, throttled = 0, False
+    try:
+        text, used = await attempt.run(_acomplete_upstream(provider, system, user, temperature, attempt.timeout))
+        return text, used
+    except Exception as e:
+        throttled = llm_resilience.is_throttle(e)
+        raise
+    finally:
+        await asyncio.shield(asyncio.to_thread(
+            llm_limiter.release, lease, provider, est, used, time.perf_counter() - attempt.started, throttled
+        ))
+
+async def _acomplete_upstream(provider: str, system: str, user: str, temperature: float, timeout: float):
+    state = _async_state()
+
+    if provider == "openai":
+        resp = await _async_openai(state).with_options(timeout=timeout).chat.completions.create(
+            model=_model_name(provider),
+            messages=_messages(system, user),
             temperature=temperature,
         )
-        return (resp.choices[0].message.content or "").strip()
-
-    if PROVIDER == "nim":
-        import os
-        if _nim_session is None:
-            _nim_session, _base_url = _init_nim()
-        url = f"{_base_url}/v1/chat/completions"
-        model = os.getenv("NIM_MODEL", "meta/llama-3.1-70b-instruct")
-        payload = {
-            "model": model,
-            "messages": [{"role":"system","content":system},{"role":"user","content":user}],
-            "temperature": temperature,
-        }
-        r = _nim_session.post(url, json=payload, timeout=120)
-        r.raise_for_status()
-        data = r.json()
-        return (data["choices"][0]["message"]["content"] or "").strip()
-
-    return "(LLM disabled) " + user[:200]
+        return (resp.choices[0].message.content or "").strip(), _usage_tokens(resp.usage)
+
+    url, headers = _nim_url_headers()
+    r = await state["http"].post(
+        url,
+        json={"model": _model_name(provider), "messages": _messages(system, user), "temperature": temperature},
+        headers=headers,
+        timeout=timeout,
+    )
+    r.raise_for_status()
+    data = r.json()
+    return (data["choices"][0]["message"]["content"] or "").strip(), _usage_tokens(data.get("usage"))
+
+async def _achat_complete_uncached(system: str, user: str, temperature: float):
+    est = await _aestimate_tokens(system, user)
+    return await llm_resilience.acall(
+        lambda attempt: _acomplete_once(attempt, system, user, temperature, est), _providers()
+    )
+
+async def achat_complete(system: str, user: str, temperature: float = 0.2, route: str = "llm") -> str:
+    """
+    Cached (LLM_CACHE_*) and single-flight: concurrent identical requests
+    share one upstream call. Routes in LLM_CACHE_BYPASS_ROUTES always go upstream.
+    Upstream calls are retried, hedged and failed over by `llm_resilience`.
+    """
+    if PROVIDER not in ("openai", "nim"):
+        return "(LLM disabled) " + user[:200]
+    if not llm_cache.enabled_for(route):
+        return (await _achat_complete_uncached(system, user, temperature))[0]
+    key = llm_cache.cache_key(PROVIDER, _model_name(), system, user, temperature)
+    return await llm_cache.acached_call(key, lambda: _achat_complete_uncached(system, user, temperature))
+
+async def _provider_deltas(provider: str, system: str, user: str, temperature: float,
+                           timeout: float) -> AsyncIterator[str]:
+    if provider == "openai":
+        stream = await _async_openai(_async_state()).with_options(timeout=timeout).chat.completions.create(
+            model=_model_name(provider),
+            messages=_messages(system, user),
+            temperature=temperature,
+            stream=True,
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        return
+
+    if provider == "nim":
+        url, headers = _nim_url_headers()
+        payload = {"model": _model_name(provider), "messages": _messages(system, user),
+                   "temperature": temperature, "stream": True}
+        async with _async_state()["http"].stream("POST", url, json=payload, headers=headers, timeout=timeout) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                text = (choices[0].get("delta") or {}).get("content") if choices else None
+                if text:
+                    yield text
+        return
+
+    yield "(LLM disabled) " + user[:200]
+
+async def _open_stream(system: str, user: str, temperature: float):
+    """
+    -> (provider, deltas, first delta, release, renew). Retries and failover apply until the
+    first token arrives (the attempt deadline is a time-to-first-token
+    deadline, counted from when the limiter grants the lease); after that a
+    broken stream is the caller's error.
+    Streams are never hedged.
+    """
+    est = await _aestimate_tokens(system, user)
+
+    async def first(attempt: llm_resilience.Attempt):
+        provider = attempt.provider
+        lease = await llm_limiter.aacquire(provider, est)
+        attempt.begin()
+        started = attempt.started
+        deltas = _provider_deltas(provider, system, user, temperature, attempt.timeout)
+        try:
+            delta = await attempt.run(deltas.__anext__())
+        except StopAsyncIteration:
+            delta = None
+        except BaseException as e:
+            await deltas.aclose()
+            throttled = isinstance(e, Exception) and llm_resilience.is_throttle(e)
+            await asyncio.shield(asyncio.to_thread(
+                llm_limiter.release, lease, provider, est, 0, time.perf_counter() - started, throttled
+            ))
+            raise
+        # The lease is held (and renewed) until the stream ends; its latency signal is time to first token.
+        ttft_s = time.perf_counter() - started
+        return (provider, deltas, delta, (lambda: llm_limiter.release(lease, provider, est, 0, ttft_s, False)),
+                (lambda: llm_limiter.renew(lease)))
+
+    if PROVIDER not in ("openai", "nim"):
+        return await first(llm_resilience.Attempt(PROVIDER, settings.llm_timeout_s))
+    return await llm_resilience.acall(first, _providers(), hedge=False)
+
+async def astream_chat_complete(system: str, user: str, temperature: float = 0.2,
+                                route: str = "llm") -> AsyncIterator[str]:
+    """
+    Yield completion text as the provider produces it; logs time-to-first-token.
+    A cached completion is replayed as a single chunk, and a finished stream
+    fills the cache (streams are not coalesced).
+    """
+    use_cache = PROVIDER in ("openai", "nim") and llm_cache.enabled_for(route)
+    key = llm_cache.cache_key(PROVIDER, _model_name(), system, user, temperature) if use_cache else None
+    if use_cache:
+        hit = await asyncio.to_thread(llm_cache.lookup, key)
+        if hit is not None:
+            yield hit
+            return
+
+    started = time.perf_counter()
+    provider, deltas, delta, release, renew = await _open_stream(system, user, temperature)
+    ttft_ms = (time.perf_counter() - started) * 1000.0
+    metrics.observe(f"{route}.ttft_ms", ttft_ms)
+    logger.info("route=%s provider=%s ttft_ms=%d", route, provider, ttft_ms)
+    parts = []
+    try:
+        if delta is not None:
+            parts.append(delta)
+            yield delta
+        renewed = time.monotonic()
+        async for delta in deltas:
+            parts.append(delta)
+            if time.monotonic() - renewed >= llm_limiter.lease_s() / 2:
+                renewed = time.monotonic()
+                await asyncio.to_thread(renew)
+            yield delta
+    finally:
+        await deltas.aclose()
+        await asyncio.shield(asyncio.to_thread(release))
+    took_ms = (time.perf_counter() - started) * 1000.0
+    metrics.observe(f"{route}.stream_ms", took_ms)
+    if use_cache:
+        # Streams carry no usage block; tokens are only known for non-streamed fills.
+        await asyncio.to_thread(llm_cache.store, key, "".join(parts).strip(), 0, took_ms)
+
+async def aclose() -> None:
+    """Close this loop's pooled connections (app shutdown)."""
+    try:
+        state = _async_clients.pop(asyncio.get_running_loop(), None)
+    except RuntimeError:
+        return
+    if state is not None:
+        await state["http"].aclose()
@@ -0,0 +1,299 @@
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+
+logger = logging.getLogger("llm")
+
+HEARTBEAT_S = 2.0  # a waiter that stops polling this long (its process died) leaves the queue
+
+
+def lease_s() -> float:
+    """How long a lease lives unless renewed (its process died, or it leaked)."""
+    return settings.llm_timeout_s + 30.0
+
+
+class LimiterTimeout(Exception):
+    """No provider capacity within LLM_LIMITER_MAX_WAIT_S; carries a Retry-After hint."""
+
+    def __init__(self, provider: str, retry_after: int):
+        super().__init__(f"{provider} capacity exhausted, retry after {retry_after}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class OutboundLimiter:
+    """
+    Host-wide limiter for provider calls, kept in SQLite (WAL) so every worker
+    process on the host draws from the same budget.
+
+    * In-flight cap: a call holds a lease row; leases of dead processes lapse.
+    * Tokens per minute: a token bucket charged with the estimated prompt +
+      completion tokens up front and corrected with the real usage after.
+    * AIMD: the in-flight cap grows by 1/cap per fast success and is cut
+      (x0.5 on a 429, x0.9 on latency above target) at most once per window.
+    * Fairness: waiters take FIFO tickets across processes; only the oldest
+      live ticket may acquire, and a ticket older than the max wait gives up.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " provider TEXT PRIMARY KEY, lim REAL NOT NULL, tokens REAL NOT NULL,"
+            " refilled REAL NOT NULL, last_cut REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, provider TEXT NOT NULL, tokens INTEGER NOT NULL,"
+            " expires REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS waiters ("
+            " ticket INTEGER PRIMARY KEY AUTOINCREMENT, provider TEXT NOT NULL, expires REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS leases_provider ON leases(provider);"
+            "CREATE INDEX IF NOT EXISTS waiters_provider ON waiters(provider, ticket);"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _capacity() -> float:
+        return float(settings.llm_limiter_tpm)
+
+    def _state(self, c: sqlite3.Connection, provider: str, now: float) -> Tuple[float, float, float]:
+        """-> (limit, tokens after refill, last_cut)."""
+        row = c.execute("SELECT lim, tokens, refilled, last_cut FROM state WHERE provider = ?", (provider,)).fetchone()
+        if row is None:
+            row = (float(settings.llm_limiter_initial), self._capacity(), now, 0.0)
+            c.execute("INSERT INTO state VALUES (?, ?, ?, ?, ?)", (provider, row[0], row[1], now, 0.0))
+        lim, tokens, refilled, last_cut = row
+        if self._capacity() > 0:
+            tokens = min(self._capacity(), tokens + (now - refilled) * self._capacity() / 60.0)
+        return lim, tokens, last_cut
+
+    # --- queue ------------------------------------------------------------
+    def enqueue(self, provider: str) -> int:
+        c = self._conn()
+        cur = c.execute("INSERT INTO waiters (provider, expires) VALUES (?, ?)",
+                        (provider, time.time() + HEARTBEAT_S))
+        return cur.lastrowid
+
+    def dequeue(self, ticket: int) -> None:
+        try:
+            self._conn().execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+        except sqlite3.Error:
+            pass  # it lapses after HEARTBEAT_S anyway
+
+    def try_acquire(self, ticket: int, provider: str, tokens: int) -> Tuple[Optional[int], int]:
+        """-> (lease id or None, tickets ahead of this one)."""
+        now = time.time()
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute("DELETE FROM leases WHERE expires < ?", (now,))
+            c.execute("DELETE FROM waiters WHERE expires < ?", (now,))
+            c.execute("UPDATE waiters SET expires = ? WHERE ticket = ?", (now + HEARTBEAT_S, ticket))
+            ahead = c.execute("SELECT COUNT(*) FROM waiters WHERE provider = ? AND ticket < ?",
+                              (provider, ticket)).fetchone()[0]
+            if ahead:
+                c.execute("COMMIT")
+                return None, ahead
+            lim, bucket, _ = self._state(c, provider, now)
+            inflight = c.execute("SELECT COUNT(*) FROM leases WHERE provider = ?", (provider,)).fetchone()[0]
+            cost = min(tokens, self._capacity()) if self._capacity() > 0 else 0
+            lease = None
+            if inflight < max(1, math.floor(lim)) and bucket >= cost:
+                bucket -= cost
+                lease = c.execute(
+                    "INSERT INTO leases (provider, tokens, expires) VALUES (?, ?, ?)",
+                    (provider, tokens, now + lease_s()),
+                ).lastrowid
+                c.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+            c.execute("UPDATE state SET tokens = ?, refilled = ? WHERE provider = ?", (bucket, now, provider))
+            c.execute("COMMIT")
+            return lease, 0
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+
+    def release(self, lease: int, provider: str, est_tokens: int, used_tokens: int,
+                latency_s: float, throttled: bool) -> float:
+        """Return the lease, settle the token charge and adapt the limit; -> new limit."""
+        now = time.time()
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute("DELETE FROM leases WHERE id = ?", (lease,))
+            lim, bucket, last_cut = self._state(c, provider, now)
+            if used_tokens and self._capacity() > 0:
+                bucket = max(-self._capacity(), min(self._capacity(), bucket + est_tokens - used_tokens))
+            slow = latency_s > settings.llm_limiter_latency_target_s
+            if throttled or slow:
+                if now - last_cut >= settings.llm_limiter_cut_window_s:
+                    lim = max(float(settings.llm_limiter_min), lim * (0.5 if throttled else 0.9))
+                    last_cut = now
+                    metrics.inc("llm_limiter.cut_429" if throttled else "llm_limiter.cut_latency")
+            else:
+                lim = min(float(settings.llm_limiter_max), lim + 1.0 / max(1.0, lim))
+            c.execute("UPDATE state SET lim = ?, tokens = ?, refilled = ?, last_cut = ? WHERE provider = ?",
+                      (lim, bucket, now, last_cut, provider))
+            c.execute("COMMIT")
+            return lim
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+
+    def renew(self, lease: int) -> bool:
+        """Push a held lease's expiry out by another `lease_s()`; False if it already lapsed."""
+        cur = self._conn().execute("UPDATE leases SET expires = ? WHERE id = ?", (time.time() + lease_s(), lease))
+        return cur.rowcount > 0
+
+    def cancel(self, lease: int, provider: str) -> None:
+        """Give back a lease that was never used, refunding its token charge."""
+        now = time.time()
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            row = c.execute("SELECT tokens FROM leases WHERE id = ?", (lease,)).fetchone()
+            if row is not None:
+                c.execute("DELETE FROM leases WHERE id = ?", (lease,))
+                lim, bucket, _ = self._state(c, provider, now)
+                if self._capacity() > 0:
+                    bucket = min(self._capacity(), bucket + min(row[0], self._capacity()))
+                c.execute("UPDATE state SET tokens = ?, refilled = ? WHERE provider = ?", (bucket, now, provider))
+            c.execute("COMMIT")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+
+    def snapshot(self):
+        now = time.time()
+        c = self._conn()
+        out = {}
+        for provider, lim, tokens in c.execute("SELECT provider, lim, tokens FROM state").fetchall():
+            out[provider] = {
+                "limit": round(lim, 2),
+                "tokens": round(tokens),
+                "in_flight": c.execute("SELECT COUNT(*) FROM leases WHERE provider = ? AND expires >= ?",
+                                       (provider, now)).fetchone()[0],
+                "waiting": c.execute("SELECT COUNT(*) FROM waiters WHERE provider = ? AND expires >= ?",
+                                     (provider, now)).fetchone()[0],
+            }
+        return out
+
+
+_limiter: Optional[OutboundLimiter] = None
+
+
+def get_limiter() -> Optional[OutboundLimiter]:
+    global _limiter
+    if not settings.llm_limiter_enabled:
+        return None
+    if _limiter is None:
+        _limiter = OutboundLimiter(settings.llm_limiter_path)
+    return _limiter
+
+
+def _poll_s(ahead: int) -> float:
+    # Waiters far back in the queue poll less often; the head polls fastest.
+    return min(0.25, 0.01 * (1 + ahead))
+
+
+def _retry_after() -> int:
+    return max(1, math.ceil(settings.llm_limiter_max_wait_s))
+
+
+def _cancel_granted(limiter: OutboundLimiter, provider: str, fut: "asyncio.Future") -> None:
+    """Done-callback for a `try_acquire` whose caller was cancelled meanwhile."""
+    if fut.cancelled() or fut.exception() is not None:
+        return
+    lease, _ = fut.result()
+    if lease is not None:
+        metrics.inc("llm_limiter.cancelled_leases")
+        asyncio.get_running_loop().run_in_executor(None, limiter.cancel, lease, provider)
+
+
+async def aacquire(provider: str, tokens: int) -> Optional[int]:
+    limiter = get_limiter()
+    if limiter is None:
+        return None
+    started = time.monotonic()
+    ticket = await asyncio.to_thread(limiter.enqueue, provider)
+    try:
+        while True:
+            # The thread cannot be interrupted: if we are cancelled while it
+            # runs, let it finish and hand back any lease it was granted.
+            poll = asyncio.ensure_future(asyncio.to_thread(limiter.try_acquire, ticket, provider, tokens))
+            try:
+                lease, ahead = await asyncio.shield(poll)
+            except asyncio.CancelledError:
+                poll.add_done_callback(lambda fut: _cancel_granted(limiter, provider, fut))
+                raise
+            if lease is not None:
+                metrics.observe("llm_limiter.wait_ms", (time.monotonic() - started) * 1000.0)
+                return lease
+            if time.monotonic() - started >= settings.llm_limiter_max_wait_s:
+                metrics.inc("llm_limiter.timeouts")
+                raise LimiterTimeout(provider, _retry_after())
+            await asyncio.sleep(_poll_s(ahead))
+    except BaseException:
+        await asyncio.shield(asyncio.to_thread(limiter.dequeue, ticket))
+        raise
+
+
+def acquire(provider: str, tokens: int) -> Optional[int]:
+    limiter = get_limiter()
+    if limiter is None:
+        return None
+    started = time.monotonic()
+    ticket = limiter.enqueue(provider)
+    try:
+        while True:
+            lease, ahead = limiter.try_acquire(ticket, provider, tokens)
+            if lease is not None:
+                metrics.observe("llm_limiter.wait_ms", (time.monotonic() - started) * 1000.0)
+                return lease
+            if time.monotonic() - started >= settings.llm_limiter_max_wait_s:
+                metrics.inc("llm_limiter.timeouts")
+                raise LimiterTimeout(provider, _retry_after())
+            time.sleep(_poll_s(ahead))
+    except BaseException:
+        limiter.dequeue(ticket)
+        raise
+
+
+def renew(lease: Optional[int]) -> None:
+    """Keep a long-held lease (an open stream) from lapsing under its holder."""
+    limiter = get_limiter()
+    if limiter is None or lease is None:
+        return
+    try:
+        if not limiter.renew(lease):
+            metrics.inc("llm_limiter.lapsed_leases")
+    except sqlite3.Error as e:
+        logger.warning("limiter renew failed: %s", e)
+
+
+def release(lease: Optional[int], provider: str, est_tokens: int, used_tokens: int,
+            latency_s: float, throttled: bool) -> None:
+    limiter = get_limiter()
+    if limiter is None or lease is None:
+        return
+    try:
+        lim = limiter.release(lease, provider, est_tokens, used_tokens, latency_s, throttled)
+        metrics.observe(f"llm_limiter.limit.{provider}", lim)
+    except sqlite3.Error as e:
+        logger.warning("limiter release failed (lease lapses on its own): %s", e)
@@ -0,0 +1,373 @@
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+from .llm_limiter import LimiterTimeout
+
+logger = logging.getLogger("llm")
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class ProvidersUnavailable(RuntimeError):
+    """Every provider's circuit is open, or the retry budget ran out; carries a Retry-After hint."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. After `failures` errors in a row the circuit
+    opens for `cooldown_s`; then one trial call is let through (half-open)
+    and its outcome closes or re-opens it.
+    """
+
+    def __init__(self, name: str, failures: int, cooldown_s: float):
+        self.name = name
+        self.failures = max(1, failures)
+        self.cooldown_s = cooldown_s
+        self._errors = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self.cooldown_s else "open"
+
+    def reopens_in(self) -> float:
+        """Seconds until the circuit lets a trial call through (0 unless open)."""
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown_s - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def abandon(self) -> None:
+        """The admitted call ended without a verdict (cancelled, or never reached the provider)."""
+        with self._lock:
+            self._trial = False
+
+    def success(self) -> None:
+        with self._lock:
+            self._errors = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self._errors += 1
+            if self._trial or self._errors >= self.failures:
+                if self._opened_at is None or self._trial:
+                    logger.warning("circuit for provider %s opened after %d failures", self.name, self._errors)
+                    metrics.inc(f"llm.breaker_open.{self.name}")
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+class LatencyWindow:
+    """Recent successful call latencies (seconds) for the hedging threshold."""
+
+    def __init__(self, size: int = 256):
+        self._values: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._values.append(seconds)
+
+    def percentile(self, p: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._values)
+        if len(values) < max(1, min_samples):
+            return None
+        return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latency: Dict[str, LatencyWindow] = {}
+
+
+def breaker(provider: str) -> CircuitBreaker:
+    b = _breakers.get(provider)
+    if b is None:
+        b = _breakers.setdefault(
+            provider, CircuitBreaker(provider, settings.llm_breaker_failures, settings.llm_breaker_cooldown_s)
+        )
+    return b
+
+
+def latency(provider: str) -> LatencyWindow:
+    return _latency.setdefault(provider, LatencyWindow())
+
+
+class Attempt:
+    """
+    One try against one provider. The provider's clock (its latency sample
+    and the attempt timeout) starts at `begin()`, which callers invoke once
+    the limiter has granted a lease: queueing for our own capacity is not
+    the provider being slow.
+    """
+
+    def __init__(self, provider: str, timeout: float):
+        self.provider = provider
+        self.timeout = timeout
+        self.started: Optional[float] = None
+
+    def begin(self) -> None:
+        if self.started is None:
+            self.started = time.perf_counter()
+
+    async def run(self, aw: Awaitable[T]) -> T:
+        """Await the upstream call within the attempt timeout, starting the clock now."""
+        self.begin()
+        return await asyncio.wait_for(aw, self.timeout)
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_throttle(exc: BaseException) -> bool:
+    return _status(exc) == 429
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, connection errors, 429 and 5xx; other 4xx are the caller's fault."""
+    code = _status(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    for mod, names in (("httpx", ("TransportError",)),
+                       ("openai", ("APIConnectionError",)),
+                       ("requests", ("ConnectionError", "Timeout"))):
+        try:
+            lib = __import__(mod)
+        except ImportError:
+            continue
+        errors = tuple(e for e in (getattr(lib, n, None) for n in names) if e is not None)
+        if errors and isinstance(exc, errors):
+            return True
+    return False
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_s(attempt: int, exc: Optional[BaseException] = None) -> float:
+    """Full-jitter exponential backoff; a server's Retry-After wins when larger."""
+    cap = min(settings.llm_backoff_max_s, settings.llm_backoff_base_s * (2 ** attempt))
+    delay = random.uniform(0, cap)
+    hinted = _retry_after(exc) if exc is not None else None
+    return max(delay, min(hinted, settings.llm_backoff_max_s)) if hinted else delay
+
+
+def _next_provider(providers: List[str], after: Optional[str]) -> Optional[str]:
+    """First provider whose circuit admits a call, starting after the one that just failed."""
+    start = providers.index(after) + 1 if after in providers else 0
+    for i in range(len(providers)):
+        p = providers[(start + i) % len(providers)]
+        if breaker(p).allow():
+            return p
+    return None
+
+
+def _unavailable(providers: List[str], last: Optional[BaseException]) -> ProvidersUnavailable:
+    """The give-up error; retry once the first circuit half-opens (or after a second if none is open)."""
+    wait = min((breaker(p).reopens_in() for p in providers), default=0.0)
+    return ProvidersUnavailable(
+        f"LLM call failed ({', '.join(providers)}): {last or 'circuit open'}", max(1, math.ceil(wait))
+    )
+
+
+def _record(attempt: Attempt, error: Optional[BaseException] = None) -> None:
+    """
+    Feed an attempt's outcome to the provider's breaker. Only retryable
+    errors count against the provider; a 4xx caused by the request itself
+    says nothing about its health.
+    """
+    provider = attempt.provider
+    if error is None:
+        took = time.perf_counter() - (attempt.started or time.perf_counter())
+        breaker(provider).success()
+        latency(provider).add(took)
+        metrics.observe(f"llm.latency_ms.{provider}", took * 1000.0)
+    elif is_retryable(error):
+        breaker(provider).failure()
+        metrics.inc(f"llm.errors.{provider}")
+    else:
+        breaker(provider).abandon()
+        metrics.inc(f"llm.rejected.{provider}")
+
+
+# --- async ---------------------------------------------------------------
+
+async def _attempt(call: Callable[[Attempt], Awaitable[T]], provider: str, timeout: float) -> T:
+    attempt = Attempt(provider, timeout)
+    metrics.inc(f"llm.attempts.{provider}")
+    try:
+        out = await call(attempt)
+    except (asyncio.CancelledError, LimiterTimeout):
+        breaker(provider).abandon()  # lost hedge, client gone, or our own limiter: not the provider's fault
+        raise
+    except Exception as e:
+        _record(attempt, e)
+        raise
+    _record(attempt)
+    return out
+
+
+async def _hedged(call: Callable[[Attempt], Awaitable[T]], provider: str, timeout: float) -> T:
+    """
+    Run one attempt; if it has not answered by the provider's recent
+    LLM_HEDGE_PERCENTILE latency, start a duplicate and take whichever
+    finishes first.
+    """
+    threshold = latency(provider).percentile(settings.llm_hedge_percentile, settings.llm_hedge_min_samples)
+    if not settings.llm_hedge_enabled or threshold is None or threshold >= timeout:
+        return await _attempt(call, provider, timeout)
+
+    started = time.monotonic()
+    first = asyncio.ensure_future(_attempt(call, provider, timeout))
+    pending = {first}
+    error: Optional[BaseException] = None
+    try:
+        done, _ = await asyncio.wait(pending, timeout=threshold)
+        if done:
+            return first.result()
+        metrics.inc("llm.hedges")
+        second = asyncio.ensure_future(_attempt(call, provider, max(0.001, timeout - (time.monotonic() - started))))
+        pending.add(second)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        metrics.inc("llm.hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def acall(call: Callable[[Attempt], Awaitable[T]], providers: List[str], hedge: bool = True) -> T:
+    """
+    `call(attempt)` with retries inside an overall LLM_TIMEOUT_S
+    budget. Each attempt gets at most LLM_ATTEMPT_TIMEOUT_S; retryable
+    failures back off with jitter and move to the next provider whose
+    circuit is closed.
+    """
+    deadline = time.monotonic() + settings.llm_timeout_s
+    provider: Optional[str] = None
+    last: Optional[BaseException] = None
+    for attempt in range(max(1, settings.llm_max_attempts)):
+        nxt = _next_provider(providers, provider)
+        if nxt is None:
+            break
+        if provider is not None and nxt != provider:
+            metrics.inc("llm.failover")
+            logger.warning("llm failover %s -> %s after: %s", provider, nxt, last)
+        provider = nxt
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            timeout = min(settings.llm_attempt_timeout_s, remaining)
+            if hedge:
+                return await _hedged(call, provider, timeout)
+            return await _attempt(call, provider, timeout)
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            last = e
+        pause = min(backoff_s(attempt, last), deadline - time.monotonic())
+        if attempt + 1 < settings.llm_max_attempts and pause > 0:
+            metrics.inc("llm.retries")
+            await asyncio.sleep(pause)
+    raise _unavailable(providers, last) from last
+
+
+# --- blocking (job workers, scripts): same policy, no hedging ---------------
+
+def call(fn: Callable[[Attempt], T], providers: List[str]) -> T:
+    """Blocking `acall`; `fn` must call `attempt.begin()` before going upstream."""
+    deadline = time.monotonic() + settings.llm_timeout_s
+    provider: Optional[str] = None
+    last: Optional[BaseException] = None
+    for attempt in range(max(1, settings.llm_max_attempts)):
+        nxt = _next_provider(providers, provider)
+        if nxt is None:
+            break
+        if provider is not None and nxt != provider:
+            metrics.inc("llm.failover")
+            logger.warning("llm failover %s -> %s after: %s", provider, nxt, last)
+        provider = nxt
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        current = Attempt(provider, min(settings.llm_attempt_timeout_s, remaining))
+        metrics.inc(f"llm.attempts.{provider}")
+        try:
+            out = fn(current)
+        except LimiterTimeout:
+            breaker(provider).abandon()
+            raise
+        except Exception as e:
+            _record(current, e)
+            if not is_retryable(e):
+                raise
+            last = e
+        except BaseException:
+            breaker(provider).abandon()
+            raise
+        else:
+            _record(current)
+            return out
+        pause = min(backoff_s(attempt, last), deadline - time.monotonic())
+        if attempt + 1 < settings.llm_max_attempts and pause > 0:
+            metrics.inc("llm.retries")
+            time.sleep(pause)
+    raise _unavailable(providers, last) from last
+
+
+def status() -> Dict[str, Dict[str, object]]:
+    return {
+        p: {"circuit": b.state, "p50_ms": _ms(latency(p).percentile(50, 1)), "p95_ms": _ms(latency(p).percentile(95, 1))}
+        for p, b in _breakers.items()
+    }
+
+
+def _ms(v: Optional[float]) -> Optional[float]:
+    return round(v * 1000.0, 1) if v is not None else None
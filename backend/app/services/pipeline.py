@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Tuple
+
+from backend.app.utils import metrics
+
+logger = logging.getLogger("pipeline")
+
+
+class StageSkipped(Exception):
+    """Raised by a stage that has nothing to do with the inputs it got."""
+
+
+class Stage(NamedTuple):
+    name: str
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]   # gets the results of the stages before it
+    after: Tuple[str, ...] = ()
+
+
+async def run_stages(stages: List[Stage]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run a small dependency graph of async stages, each as soon as the
+    stages it comes `after` have finished, and yield one record per stage
+    as it completes: {"stage", "status": ok | error | skipped, "ms",
+    "result" | "detail"}.
+
+    A failed stage does not stop the others: stages after it still run,
+    with its result missing from their inputs. Closing the iterator
+    cancels whatever is still running.
+    """
+    names = {s.name for s in stages}
+    unknown = [d for s in stages for d in s.after if d not in names]
+    if unknown:
+        raise ValueError(f"Unknown stage dependencies {unknown}")
+
+    results: Dict[str, Any] = {}
+    finished: Dict[str, str] = {}
+    tasks: Dict[asyncio.Future, Tuple[Stage, float]] = {}
+
+    def start_ready() -> None:
+        running = {s.name for s, _ in tasks.values()}
+        for s in stages:
+            if s.name not in finished and s.name not in running and all(d in finished for d in s.after):
+                tasks[asyncio.ensure_future(s.run(dict(results)))] = (s, time.perf_counter())
+
+    start_ready()
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(list(tasks), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                stage, started = tasks.pop(task)
+                ms = round((time.perf_counter() - started) * 1000.0, 1)
+                record: Dict[str, Any] = {"stage": stage.name, "ms": ms}
+                exc = task.exception()
+                if exc is None:
+                    results[stage.name] = task.result()
+                    record.update(status="ok", result=results[stage.name])
+                elif isinstance(exc, StageSkipped):
+                    record.update(status="skipped", detail=str(exc))
+                else:
+                    logger.warning("pipeline stage %s failed: %s", stage.name, exc)
+                    metrics.inc(f"pipeline.failed.{stage.name}")
+                    detail = getattr(exc, "detail", None) or str(exc) or type(exc).__name__  # HTTPException: detail
+                    record.update(status="error", detail=detail)
+                finished[stage.name] = record["status"]
+                metrics.observe(f"pipeline.stage_ms.{stage.name}", ms)
+                yield record
+            start_ready()
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+from backend.app.utils.cache import TieredCache
+from backend.app.utils.tokens import count_tokens
+from .scheduler import admit
+
+logger = logging.getLogger("prefetch")
+
+# Speculative work queues as an unknown role, i.e. the scheduler's lowest
+# weight class, so it never gets ahead of a request somebody is waiting on.
+PREFETCH_ROLE = "prefetch"
+SUMMARIZE_ROLES = ("clinician", "admin")  # who may call /records/summarize, so who could claim
+
+_cache: Optional[TieredCache] = None
+_inflight: Dict[str, "asyncio.Task"] = {}
+_superseded: Set[str] = set()
+
+
+def get_prefetch_cache() -> TieredCache:
+    global _cache
+    if _cache is None:
+        _cache = TieredCache(
+            "prefetch_cache",
+            max_items=256,
+            ttl_s=settings.summarize_prefetch_ttl_s,
+            disk_path=settings.summarize_prefetch_path,
+            disk_max_bytes=64 * 1024 * 1024,
+        )
+    return _cache
+
+
+def case_key(notes: Optional[str], findings: Optional[List[str]]) -> str:
+    """Hash of the summarize inputs, as /records/summarize will send them."""
+    raw = json.dumps([(notes or "").strip(), findings or []], ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _tokens(result: Dict[str, Any]) -> int:
+    return int(result.get("usage", {}).get("tokens", {}).get("total", 0))
+
+
+def _waste(key: str) -> None:
+    """A prefetched summary was superseded by newer inputs before anyone claimed it."""
+    entry, _ = get_prefetch_cache().get("sum:" + key)
+    if entry is not None and not entry["claimed"]:
+        metrics.inc("prefetch.wasted")
+        metrics.inc("prefetch.wasted_tokens", _tokens(entry["result"]))
+
+
+async def _run(key: str, notes: str, findings: List[str]) -> Dict[str, Any]:
+    from .summarizer import asummarize_notes  # the LLM client, only once something is prefetched
+    async with admit("llm", PREFETCH_ROLE):
+        result = await asyncio.wait_for(asummarize_notes(notes, findings), settings.summarize_prefetch_timeout_s)
+    await asyncio.to_thread(get_prefetch_cache().set, "sum:" + key, {"result": result, "claimed": False})
+    if key in _superseded:
+        _superseded.discard(key)
+        await asyncio.to_thread(_waste, key)
+    return result
+
+
+def _done(key: str, task: "asyncio.Task") -> None:
+    _inflight.pop(key, None)
+    if not task.cancelled() and task.exception() is not None:
+        _superseded.discard(key)
+        metrics.inc("prefetch.failed")
+        logger.info("prefetch failed: %s", task.exception())
+
+
+async def note_case(owner: Optional[str], role: Optional[str], notes: Optional[str] = None,
+                    findings: Optional[List[str]] = None) -> None:
+    """
+    Record an ingest result (extracted notes or imaging findings) for
+    `owner` and, with SUMMARIZE_PREFETCH on, start summarizing the case
+    (latest notes + latest findings) in the background. Only for roles that
+    can ask for the summary. Bounded by SUMMARIZE_PREFETCH_MAX_INFLIGHT per
+    worker and SUMMARIZE_PREFETCH_MAX_TOKENS of notes; anything over budget
+    is simply not prefetched.
+    """
+    if not settings.summarize_prefetch or not owner or role not in SUMMARIZE_ROLES:
+        return
+    cache = get_prefetch_cache()
+    state, _ = await asyncio.to_thread(cache.get, "case:" + owner)
+    state = dict(state or {})
+    if notes is not None:
+        state["notes"] = notes
+    if findings is not None:
+        state["findings"] = findings
+    key = case_key(state.get("notes"), state.get("findings"))
+    prev, state["key"] = state.get("key"), key
+    await asyncio.to_thread(cache.set, "case:" + owner, state)
+    if prev and prev != key:
+        if prev in _inflight:
+            _superseded.add(prev)
+        else:
+            await asyncio.to_thread(_waste, prev)
+
+    if key in _inflight:
+        return
+    hit, _ = await asyncio.to_thread(cache.get, "sum:" + key)
+    if hit is not None:
+        return
+    if len(_inflight) >= settings.summarize_prefetch_max_inflight:
+        metrics.inc("prefetch.skipped.budget")
+        return
+    text = (state.get("notes") or "").strip()
+    # A token is at least one byte, so short notes need no tokenizer pass;
+    # long ones are counted off the event loop.
+    if (len(text.encode()) > settings.summarize_prefetch_max_tokens
+            and await asyncio.to_thread(count_tokens, text) > settings.summarize_prefetch_max_tokens):
+        metrics.inc("prefetch.skipped.size")
+        return
+    task = asyncio.get_running_loop().create_task(_run(key, text, state.get("findings") or []))
+    _inflight[key] = task
+    task.add_done_callback(lambda t: _done(key, t))
+    metrics.inc("prefetch.started")
+
+
+async def claim(notes: Optional[str], findings: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+    """
+    The prefetched summary for these inputs: from the cache, or by joining
+    the computation still running in this worker. None on a miss (or when
+    prefetching is off); the caller then summarizes as usual.
+    """
+    if not settings.summarize_prefetch:
+        return None
+    key = case_key(notes, findings)
+    cache = get_prefetch_cache()
+    entry, _ = await asyncio.to_thread(cache.get, "sum:" + key)
+    if entry is not None:
+        metrics.inc("prefetch.hit")
+    else:
+        task = _inflight.get(key)
+        if task is None:
+            metrics.inc("prefetch.miss")
+            return None
+        metrics.inc("prefetch.attached")
+        try:
+            await asyncio.shield(task)
+        except Exception:
+            metrics.inc("prefetch.miss")
+            return None
+        entry, _ = await asyncio.to_thread(cache.get, "sum:" + key)
+        if entry is None:
+            return None
+    if not entry["claimed"]:
+        metrics.inc("prefetch.used_tokens", _tokens(entry["result"]))
+        await asyncio.to_thread(cache.set, "sum:" + key, {**entry, "claimed": True})
+    return entry["result"]
+
+
+def stats() -> Dict[str, Any]:
+    c = metrics.snapshot()["counters"]
+    hits = c.get("prefetch.hit", 0) + c.get("prefetch.attached", 0)
+    misses = c.get("prefetch.miss", 0)
+    return {
+        "enabled": settings.summarize_prefetch,
+        "in_flight": len(_inflight),
+        "started": c.get("prefetch.started", 0),
+        "hits": c.get("prefetch.hit", 0),
+        "attached": c.get("prefetch.attached", 0),
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "used_tokens": c.get("prefetch.used_tokens", 0),
+        "wasted": c.get("prefetch.wasted", 0),
+        "wasted_tokens": c.get("prefetch.wasted_tokens", 0),
+        "skipped": {k.rsplit(".", 1)[1]: v for k, v in c.items() if k.startswith("prefetch.skipped.")},
+        "failed": c.get("prefetch.failed", 0),
+    }
@@ -0,0 +1,112 @@
+import hashlib
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+from backend.app.utils.cache import LRUCache
+from backend.app.utils.tokens import count_tokens, split_by_tokens
+
+_WORD = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_STOP = frozenset(
+    "a an and are as at be by do does for from has have how i in is it its me my of on or "
+    "the this that to was were what when where which who why will with you your".split()
+)
+
+_indexes: Optional[LRUCache] = None
+
+
+def _terms(text: str) -> List[str]:
+    return [t for t in _WORD.findall(text.lower()) if t not in _STOP]
+
+
+class NotesIndex:
+    """
+    Okapi BM25 over fixed-size chunks of one case's notes.
+
+    Postings are stored per term as parallel NumPy arrays (chunk ids, BM25
+    weights), so scoring a query is one vector add per query term rather
+    than a Python loop over chunks.
+    """
+
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self, text: str, chunk_tokens: int):
+        self.chunks = split_by_tokens(text, chunk_tokens) if text.strip() else []
+        self.tokens = np.array([count_tokens(c) for c in self.chunks], dtype=np.int32)
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = np.zeros(len(self.chunks), dtype=np.float32)
+        for i, chunk in enumerate(self.chunks):
+            terms = _terms(chunk)
+            lengths[i] = len(terms)
+            for t in terms:
+                row = postings.setdefault(t, {})
+                row[i] = row.get(i, 0) + 1
+        n = max(1, len(self.chunks))
+        avg = float(lengths.mean()) if len(lengths) else 1.0
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(1.0, avg))
+        self._postings: Dict[str, tuple] = {}
+        for t, row in postings.items():
+            ids = np.fromiter(row.keys(), dtype=np.int32, count=len(row))
+            tf = np.fromiter(row.values(), dtype=np.float32, count=len(row))
+            idf = np.log1p((n - len(ids) + 0.5) / (len(ids) + 0.5))
+            # Precompute each posting's full BM25 weight; a query only sums them.
+            self._postings[t] = (ids, (idf * tf * (self.k1 + 1) / (tf + norm[ids])).astype(np.float32))
+
+    def scores(self, query: str) -> np.ndarray:
+        out = np.zeros(len(self.chunks), dtype=np.float32)
+        for t in set(_terms(query)):
+            hit = self._postings.get(t)
+            if hit is not None:
+                out[hit[0]] += hit[1]  # chunk ids are unique within a posting list
+        return out
+
+    def search(self, query: str, k: int, max_tokens: int) -> List[Dict[str, Any]]:
+        """
+        Top-`k` chunks that fit in `max_tokens`, in document order. A query
+        that matches nothing ("summarize this") gets the leading chunks.
+        """
+        if not self.chunks:
+            return []
+        scores = self.scores(query)
+        order = np.argsort(-scores, kind="stable")
+        if scores[order[0]] <= 0:
+            order = np.arange(len(self.chunks))
+        picked: List[int] = []
+        budget = max_tokens
+        for i in order:
+            if len(picked) >= k:
+                break
+            if scores[i] <= 0 and scores[order[0]] > 0:
+                break
+            if self.tokens[i] <= budget:
+                picked.append(int(i))
+                budget -= int(self.tokens[i])
+        return [
+            {"chunk": i, "score": round(float(scores[i]), 3), "tokens": int(self.tokens[i]), "text": self.chunks[i]}
+            for i in sorted(picked)
+        ]
+
+
+def get_index(notes: str) -> NotesIndex:
+    """Index for these notes, built once per distinct text (keyed by its hash)."""
+    global _indexes
+    if _indexes is None:
+        _indexes = LRUCache(max_items=settings.retrieval_cache_items, ttl_s=settings.retrieval_cache_ttl_s,
+                            copy=False)  # indexes are read-only once built
+    key = hashlib.sha256(notes.encode()).hexdigest()
+    index = _indexes.get(key)
+    if index is None:
+        metrics.inc("retrieval.index_built")
+        index = NotesIndex(notes, settings.retrieval_chunk_tokens)
+        _indexes.set(key, index)
+    else:
+        metrics.inc("retrieval.index_hit")
+    return index
+
+
+def retrieve(notes: str, query: str) -> List[Dict[str, Any]]:
+    return get_index(notes).search(query, settings.retrieval_top_k, settings.retrieval_max_tokens)
@@ -0,0 +1,259 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Deque, Dict, Optional
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+from .inference_pool import pool_workers
+
+DEFAULT_CLASS = "default"
+
+
+class Overloaded(Exception):
+    """Request shed by the scheduler; carries a Retry-After hint."""
+
+    def __init__(self, scheduler: str, role: str, retry_after: int):
+        super().__init__(f"{scheduler} is overloaded for role {role!r}, retry after {retry_after}s")
+        self.scheduler = scheduler
+        self.role = role
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """A queued caller: an asyncio future (request handlers) or an event (job threads)."""
+
+    __slots__ = ("cls", "enqueued", "_loop", "_fut", "_event", "granted", "abandoned")
+
+    def __init__(self, cls: str, loop: Optional[asyncio.AbstractEventLoop]):
+        self.cls = cls
+        self.enqueued = time.monotonic()
+        self._loop = loop
+        self._fut = loop.create_future() if loop else None
+        self._event = None if loop else threading.Event()
+        self.granted = False
+        self.abandoned = False
+
+    def grant(self) -> None:
+        self.granted = True
+        if self._fut is not None:
+            self._loop.call_soon_threadsafe(lambda: self._fut.done() or self._fut.set_result(True))
+        else:
+            self._event.set()
+
+
+class PriorityScheduler:
+    """
+    Admission control with one queue per role class.
+
+    At most `capacity` callers run at once, and a class never holds more
+    than its quota share of that. When a slot frees up, the next waiter is
+    picked from the non-empty queues by smooth weighted round robin, so a
+    busy high-weight class gets most slots without ever fully starving the
+    others. Request-path callers are shed up front (Overloaded -> 503) when
+    their queue is full or the expected wait is beyond the max wait;
+    lower-weight classes get proportionally shorter queues, so they are
+    shed first.
+    """
+
+    def __init__(self, name: str, capacity: int, weights: Dict[str, int], quotas: Dict[str, float],
+                 max_queue: int, max_wait_s: float):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.weights = {k: max(1, int(v)) for k, v in weights.items()}
+        self.weights.setdefault(DEFAULT_CLASS, 1)
+        self.quotas = quotas
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque[_Waiter]] = {c: deque() for c in self.weights}
+        self._credit: Dict[str, int] = {c: 0 for c in self.weights}
+        self._running: Dict[str, int] = {c: 0 for c in self.weights}
+        self._avg_s = 1.0  # EWMA of slot hold time, for wait estimates and Retry-After
+
+    def classify(self, role: Optional[str]) -> str:
+        return role if role in self.weights else DEFAULT_CLASS
+
+    def _quota(self, cls: str) -> int:
+        return max(1, math.floor(self.capacity * self.quotas.get(cls, 1.0)))
+
+    def _runnable(self, cls: str) -> bool:
+        return sum(self._running.values()) < self.capacity and self._running[cls] < self._quota(cls)
+
+    def _queue_limit(self, cls: str) -> int:
+        return max(1, self.max_queue * self.weights[cls] // max(self.weights.values()))
+
+    def _expected_wait(self, cls: str) -> float:
+        # Work that would be served before this caller: its own queue, plus
+        # the other queues' share of slots under weighted round robin.
+        total = sum(self.weights[c] for c, q in self._queues.items() if q or c == cls)
+        ahead = len(self._queues[cls]) * total / self.weights[cls]
+        return (ahead + 1) / self._quota(cls) * self._avg_s if ahead else 0.0
+
+    def retry_after(self) -> int:
+        waiting = sum(len(q) for q in self._queues.values())
+        return max(1, math.ceil((waiting + 1) / self.capacity * self._avg_s))
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiters (call with the lock held)."""
+        while sum(self._running.values()) < self.capacity:
+            for q in self._queues.values():
+                while q and q[0].abandoned:
+                    q.popleft()
+            eligible = [c for c, q in self._queues.items() if q and self._runnable(c)]
+            if not eligible:
+                return
+            total = 0
+            for c in eligible:
+                self._credit[c] += self.weights[c]
+                total += self.weights[c]
+            pick = max(eligible, key=lambda c: self._credit[c])
+            self._credit[pick] -= total
+            waiter = self._queues[pick].popleft()
+            self._running[pick] += 1
+            metrics.observe(f"{self.name}.wait_ms.{pick}", (time.monotonic() - waiter.enqueued) * 1000.0)
+            waiter.grant()
+
+    def _enqueue(self, role: Optional[str], loop, shed: bool) -> _Waiter:
+        cls = self.classify(role)
+        with self._lock:
+            waiter = _Waiter(cls, loop)
+            if not any(not w.abandoned for w in self._queues[cls]) and self._runnable(cls):
+                self._running[cls] += 1
+                waiter.granted = True
+                metrics.observe(f"{self.name}.wait_ms.{cls}", 0.0)
+                return waiter
+            if shed and (len(self._queues[cls]) >= self._queue_limit(cls)
+                         or self._expected_wait(cls) > self.max_wait_s):
+                metrics.inc(f"{self.name}.shed.{cls}")
+                raise Overloaded(self.name, cls, self.retry_after())
+            self._queues[cls].append(waiter)
+            metrics.observe(f"{self.name}.queue_depth.{cls}", len(self._queues[cls]))
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Drop a waiter that gave up; -> True if it had been granted a slot meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.abandoned = True
+            return False
+
+    def release(self, cls: str, held_s: float) -> None:
+        with self._lock:
+            self._running[cls] -= 1
+            self._avg_s = 0.8 * self._avg_s + 0.2 * held_s
+            self._dispatch()
+
+    async def aacquire(self, role: Optional[str]) -> str:
+        """Take a slot -> class; raises Overloaded when shed or after the max wait. Pair with `release`."""
+        waiter = self._enqueue(role, asyncio.get_running_loop(), shed=True)
+        if not waiter.granted:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter._fut), self.max_wait_s)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    metrics.inc(f"{self.name}.shed.{waiter.cls}")
+                    raise Overloaded(self.name, waiter.cls, self.retry_after())
+                # granted just as the wait ran out: go ahead
+            except BaseException:
+                if self._abandon(waiter):
+                    self.release(waiter.cls, 0.0)
+                raise
+        return waiter.cls
+
+    @asynccontextmanager
+    async def aslot(self, role: Optional[str]):
+        cls = await self.aacquire(role)
+        started = time.monotonic()
+        try:
+            yield cls
+        finally:
+            self.release(cls, time.monotonic() - started)
+
+    def acquire(self, role: Optional[str], timeout: Optional[float] = None) -> str:
+        """Blocking, unshed acquire for background work; Overloaded after `timeout`. Pair with `release`."""
+        waiter = self._enqueue(role, None, shed=False)
+        if not waiter.granted and not waiter._event.wait(timeout) and not self._abandon(waiter):
+            raise Overloaded(self.name, waiter.cls, self.retry_after())
+        return waiter.cls
+
+    @contextmanager
+    def slot(self, role: Optional[str], timeout: Optional[float] = None):
+        cls = self.acquire(role, timeout)
+        started = time.monotonic()
+        try:
+            yield cls
+        finally:
+            self.release(cls, time.monotonic() - started)
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                c: {"running": self._running[c], "queued": sum(1 for w in q if not w.abandoned),
+                    "quota": self._quota(c), "weight": self.weights[c]}
+                for c, q in self._queues.items()
+            }
+
+
+_schedulers: Dict[str, PriorityScheduler] = {}
+_lock = threading.Lock()
+
+
+def get_scheduler(name: str) -> PriorityScheduler:
+    """"inference" (sized to the inference pool) or "llm"."""
+    with _lock:
+        sched = _schedulers.get(name)
+        if sched is None:
+            capacity = pool_workers() if name == "inference" else settings.sched_llm_capacity
+            sched = PriorityScheduler(
+                name,
+                capacity=capacity,
+                weights=settings.sched_weights,
+                quotas=settings.sched_quotas,
+                max_queue=settings.sched_max_queue,
+                max_wait_s=settings.sched_max_wait_s,
+            )
+            _schedulers[name] = sched
+        return sched
+
+
+@asynccontextmanager
+async def admit(name: str, role: Optional[str]):
+    """`get_scheduler(name).aslot(role)`, or a no-op when SCHED_ENABLED is off."""
+    if not settings.sched_enabled:
+        yield role
+        return
+    async with get_scheduler(name).aslot(role) as cls:
+        yield cls
+
+
+async def hold(name: str, role: Optional[str]) -> Callable[[], None]:
+    """
+    Take a slot that outlives the handler (streamed responses); -> a release
+    callback, safe to call from any thread and more than once.
+    """
+    if not settings.sched_enabled:
+        return lambda: None
+    sched = get_scheduler(name)
+    cls = await sched.aacquire(role)
+    started = time.monotonic()
+    done = threading.Event()
+
+    def release() -> None:
+        if not done.is_set():
+            done.set()
+            sched.release(cls, time.monotonic() - started)
+    return release
+
+
+def snapshot() -> Dict[str, Dict[str, Dict[str, int]]]:
+    return {name: sched.snapshot() for name, sched in _schedulers.items()}
+
+
+def priority(role: Optional[str]) -> int:
+    """Role weight, for ordering persisted work (the job queue)."""
+    return int(settings.sched_weights.get(role or "", 1))
@@ -0,0 +1,145 @@
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, Any, Deque, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+from .image_analyzer import _forward_batch, _get_backend, format_result, is_dicom, preprocess_image_bytes
+
+ZIP_MAGIC = b"PK\x03\x04"
+SKIP_NAMES = {"DICOMDIR"}
+
+
+class ArchiveTooLarge(ValueError):
+    """A zip whose entry count or uncompressed size is over the STUDY_MAX_* limits."""
+
+
+def _is_zip(fp: IO[bytes]) -> bool:
+    fp.seek(0)
+    magic = fp.read(4)
+    fp.seek(0)
+    return magic == ZIP_MAGIC
+
+
+def _members(zf: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """Entries worth analyzing, after checking the archive against the limits."""
+    infos = zf.infolist()
+    if len(infos) > settings.study_max_members:
+        raise ArchiveTooLarge(f"Archive has {len(infos)} entries (limit {settings.study_max_members}).")
+    out, total = [], 0
+    for info in infos:
+        base = info.filename.rsplit("/", 1)[-1]
+        if info.is_dir() or not base or base.upper() in SKIP_NAMES or base.startswith("."):
+            continue
+        # zipfile never inflates an entry past its declared file_size, so the
+        # declared sizes bound what reading the members can cost.
+        if info.file_size > settings.study_max_member_mb * 1024 * 1024:
+            raise ArchiveTooLarge(f"{info.filename} is over {settings.study_max_member_mb} MB uncompressed.")
+        total += info.file_size
+        if total > settings.study_max_total_mb * 1024 * 1024:
+            raise ArchiveTooLarge(f"Archive is over {settings.study_max_total_mb} MB uncompressed.")
+        out.append(info)
+    return out
+
+
+def check_archives(fps: Iterable[IO[bytes]]) -> None:
+    """Raise ArchiveTooLarge (or zipfile.BadZipFile) before any member is read."""
+    for fp in fps:
+        if _is_zip(fp):
+            with zipfile.ZipFile(fp) as zf:
+                _members(zf)
+            fp.seek(0)
+
+
+def iter_upload_items(uploads: Iterable[Tuple[str, IO[bytes]]]) -> Iterator[Tuple[str, bytes]]:
+    """
+    Expand uploads into (name, bytes) one file at a time. Zip archives are
+    read member by member from the (spooled) upload, never unpacked whole.
+    """
+    for name, fp in uploads:
+        if not _is_zip(fp):
+            yield name, fp.read()
+            continue
+        with zipfile.ZipFile(fp) as zf:
+            for info in _members(zf):
+                yield f"{name}/{info.filename}", zf.read(info)
+
+
+def _frame_count(name: str, data: bytes) -> int:
+    if not is_dicom(data, name):
+        return 1
+    from backend.app.utils.dicom_reader import read_header  # pydicom, imported on first use
+    try:
+        ds, _ = read_header(data)
+        return max(1, int(getattr(ds, "NumberOfFrames", 1) or 1))
+    except Exception:
+        return 1  # let the decode step report the real error
+
+
+def aggregate(rows: List[np.ndarray], labels: List[str]) -> Dict[str, Any]:
+    """Study-level view: max probability per pathology across all images."""
+    max_probs = np.max(rows, axis=0) if rows else np.zeros(len(labels), dtype=np.float32)
+    out = format_result(max_probs.tolist(), labels, None)
+    out.update({
+        "type": "study",
+        "count": len(rows),
+        "max_prob": {l: float(p) for l, p in zip(labels, max_probs)},
+    })
+    return out
+
+
+def analyze_study(items: Iterable[Tuple[str, bytes]]) -> Iterator[Dict[str, Any]]:
+    """
+    Decode frames in parallel, run them through the model in batches and
+    yield one record per image as soon as its batch finishes, followed by a
+    study aggregate. Image records reuse the analyze_image_bytes shape.
+    """
+    labels = _get_backend().labels
+    batch_size = max(1, settings.inference_max_batch_size)
+    max_inflight = max(batch_size, 2 * settings.study_decode_workers)
+    pending: Deque[Tuple[str, int, Future]] = deque()
+    ready: List[Tuple[str, int, np.ndarray, Tuple[int, int]]] = []
+    done: List[np.ndarray] = []
+    started = time.perf_counter()
+
+    def run_batch() -> Iterator[Dict[str, Any]]:
+        probs = _forward_batch(np.stack([arr for _, _, arr, _ in ready]))
+        metrics.observe("study.batch_size", len(ready))
+        for (name, frame, _, size), row in zip(ready, probs):
+            rec = format_result(row.tolist(), labels, size)
+            rec.update({"type": "image", "name": name, "frame": frame})
+            done.append(row)
+            yield rec
+        ready.clear()
+
+    def drain_one() -> Iterator[Dict[str, Any]]:
+        name, frame, fut = pending.popleft()
+        try:
+            arr, size = fut.result()
+        except Exception as e:
+            metrics.inc("study.decode_errors")
+            yield {"type": "error", "name": name, "frame": frame, "detail": str(e)}
+            return
+        ready.append((name, frame, arr, size))
+        if len(ready) >= batch_size:
+            yield from run_batch()
+
+    with ThreadPoolExecutor(max_workers=settings.study_decode_workers, thread_name_prefix="study-decode") as ex:
+        for name, data in items:
+            for frame in range(_frame_count(name, data)):
+                pending.append((name, frame, ex.submit(preprocess_image_bytes, data, name, frame)))
+                while len(pending) >= max_inflight:
+                    yield from drain_one()
+        while pending:
+            yield from drain_one()
+        if ready:
+            yield from run_batch()
+
+    study = aggregate(done, labels)
+    study["elapsed_ms"] = int((time.perf_counter() - started) * 1000)
+    metrics.observe("study.images", len(done))
+    yield study
@@ -1,5 +1,16 @@
-from typing import List, Dict, Any
-from .llm_client import chat_complete
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+from backend.app.utils.tokens import count_tokens, split_counted, truncate_tokens
+from .llm_client import achat_complete, astream_chat_complete, chat_complete
+
+logger = logging.getLogger("summarizer")
 
 SYSTEM = (
     "You are a clinical summarization assistant. "
@@ -22,11 +33,232 @@ Imaging Findings (structured):
 {imaging_findings}
 """
 
-def summarize_notes(notes: str, imaging_findings: List[str] | None = None) -> dict:
+# Map step for long records: each chunk is condensed to facts only, so the
+# reduce step can fill TEMPLATE from the extracts instead of the full chart.
+CHUNK_TEMPLATE = """This is part {index} of {total} of a patient's clinical record.
+Extract every clinically relevant fact from it as terse bullet points, grouped under
+whichever apply: Chief complaint & HPI; PMH/PSH/Allergies; Medications; Labs/imaging;
+Assessment & Plan. Keep dates, doses and values exactly as written. Omit empty groups.
+
+Record part {index}/{total}:
+{notes}
+"""
+
+# Incremental update: a stored summary plus only the material added since it
+# was written, so the prompt grows with the new content, not the whole chart.
+UPDATE_TEMPLATE = """Below is the current diagnostic summary of a case, followed by material added since it was written.
+Rewrite the summary so it also reflects the new material. Keep the same sections:
+- Chief complaint & HPI
+- Pertinent PMH/PSH/Allergies
+- Medications
+- Pertinent labs/imaging
+- Assessment & Plan (bullet points)
+Keep every fact in the current summary unless the new material corrects or supersedes it.
+
+Current Summary:
+{summary}
+
+New Clinical Notes:
+{notes}
+
+New Imaging Findings (structured):
+{imaging_findings}
+"""
+
+def _build_prompt(notes: str, imaging_findings: List[str] | None) -> str:
     imaging_findings = imaging_findings or []
-    prompt = TEMPLATE.format(
+    return TEMPLATE.format(
         notes=(notes or "").strip(),
         imaging_findings="\n".join(f"- {f}" for f in imaging_findings) or "- (none provided)"
     )
-    out = chat_complete(SYSTEM, prompt, temperature=0.2)
-    return {"summary": out, "citations": []}
+
+def _build_update_prompt(summary: str, notes: str, imaging_findings: List[str] | None) -> str:
+    return UPDATE_TEMPLATE.format(
+        summary=summary.strip(),
+        notes=(notes or "").strip() or "(none)",
+        imaging_findings="\n".join(f"- {f}" for f in imaging_findings or []) or "- (none)"
+    )
+
+def _join_extracts(extracts: List[str]) -> str:
+    return "\n\n".join(f"[Part {i + 1}]\n{e}" for i, e in enumerate(extracts))
+
+@lru_cache(maxsize=8)
+def _fixed_tokens(text: str) -> int:
+    """Tokens of constant prompt text (SYSTEM, template scaffolding), counted once."""
+    return count_tokens(text)
+
+def _plan(text: str) -> Tuple[int, List[Tuple[str, int]]]:
+    """
+    -> (tokens in `text`, chunk prompts with their token counts), the prompts
+    empty when `text` fits one call. Tokenizes `text` once; CPU-bound, so the
+    async paths run it in a thread.
+    """
+    n = count_tokens(text)
+    if n <= settings.summarize_single_shot_tokens:
+        return n, []
+    chunks = split_counted(text, settings.summarize_chunk_tokens, total=n)
+    scaffold = _fixed_tokens(CHUNK_TEMPLATE.format(index=0, total=0, notes=""))
+    return n, [(CHUNK_TEMPLATE.format(index=i + 1, total=len(chunks), notes=c), scaffold + k)
+               for i, (c, k) in enumerate(chunks)]
+
+def _truncate(text: str, usage: "_Usage") -> Tuple[str, int]:
+    """Extracts still over budget after MAX_MAP_ROUNDS: cut them to fit rather than send an oversized reduce."""
+    usage.truncated = True
+    metrics.inc("summarize.truncated")
+    logger.warning("map extracts still over %d tokens after %d rounds; truncating",
+                   settings.summarize_single_shot_tokens, usage.rounds)
+    return truncate_tokens(text, settings.summarize_single_shot_tokens), settings.summarize_single_shot_tokens
+
+class _Usage:
+    """Per-stage wall time and (tiktoken-counted) prompt/completion tokens."""
+
+    def __init__(self, mode: Optional[str] = None):
+        self.mode = mode  # None: single_shot or map_reduce, depending on whether the map stage ran
+        self.chunks = 0
+        self.rounds = 0
+        self.truncated = False
+        self.stages: Dict[str, float] = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, prompt_tokens: int, out: str) -> None:
+        self.prompt_tokens += _fixed_tokens(SYSTEM) + prompt_tokens
+        self.completion_tokens += count_tokens(out)
+
+    def timed(self, stage: str, started: float) -> None:
+        self.stages[f"{stage}_ms"] = self.stages.get(f"{stage}_ms", 0.0) + (time.perf_counter() - started) * 1000.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        out = {
+            "mode": self.mode or ("map_reduce" if self.rounds else "single_shot"),
+            "chunks": self.chunks,
+            "map_rounds": self.rounds,
+            "stages": {k: round(v, 1) for k, v in self.stages.items()},
+            "tokens": {
+                "prompt": self.prompt_tokens,
+                "completion": self.completion_tokens,
+                "total": self.prompt_tokens + self.completion_tokens,
+            },
+        }
+        if self.truncated:
+            out["truncated"] = True
+        return out
+
+# --- map stage ---------------------------------------------------------
+# Extracts are mapped again until they fit one prompt (a very long chart can
+# need two rounds); each round fans out at most SUMMARIZE_MAX_CONCURRENCY calls.
+# Both return the reduce-ready text and its token count.
+MAX_MAP_ROUNDS = 3
+
+def _map(notes: str, usage: _Usage) -> Tuple[str, int]:
+    text = notes.strip()
+    started = time.perf_counter()
+    n, prompts = _plan(text)
+    with ThreadPoolExecutor(max_workers=max(1, settings.summarize_max_concurrency),
+                            thread_name_prefix="summarize-map") as pool:
+        while prompts and usage.rounds < MAX_MAP_ROUNDS:
+            usage.chunks += len(prompts)
+            usage.rounds += 1
+            outs = list(pool.map(lambda p: chat_complete(SYSTEM, p[0], temperature=0.2, route="summarize"), prompts))
+            for (_, k), o in zip(prompts, outs):
+                usage.add(k, o)
+            text = _join_extracts(outs)
+            n, prompts = _plan(text)
+    if prompts:
+        text, n = _truncate(text, usage)
+    usage.timed("map", started)
+    return text, n
+
+async def _amap(notes: str, usage: _Usage) -> Tuple[str, int]:
+    text = notes.strip()
+    started = time.perf_counter()
+    sem = asyncio.Semaphore(max(1, settings.summarize_max_concurrency))
+
+    async def one(prompt: str, tokens: int) -> str:
+        async with sem:
+            out = await achat_complete(SYSTEM, prompt, temperature=0.2, route="summarize")
+        usage.add(tokens, out)
+        return out
+
+    n, prompts = await asyncio.to_thread(_plan, text)
+    while prompts and usage.rounds < MAX_MAP_ROUNDS:
+        usage.chunks += len(prompts)
+        usage.rounds += 1
+        text = _join_extracts(await asyncio.gather(*(one(p, k) for p, k in prompts)))
+        n, prompts = await asyncio.to_thread(_plan, text)
+    if prompts:
+        text, n = await asyncio.to_thread(_truncate, text, usage)
+    usage.timed("map", started)
+    return text, n
+
+# --- entry points ------------------------------------------------------
+# Short records go to the model in one call; longer ones (by token count,
+# SUMMARIZE_SINGLE_SHOT_TOKENS) are mapped to extracts and reduced into TEMPLATE.
+# Reduce prompt tokens are the notes' count (known from the map stage) plus
+# the small scaffold around them.
+
+def summarize_notes(notes: str, imaging_findings: List[str] | None = None) -> dict:
+    usage = _Usage()
+    text, n = _map(notes or "", usage)
+    prompt = _build_prompt(text, imaging_findings)
+    started = time.perf_counter()
+    out = chat_complete(SYSTEM, prompt, temperature=0.2, route="summarize")
+    usage.timed("reduce", started)
+    usage.add(n + count_tokens(_build_prompt("", imaging_findings)), out)
+    return {"summary": out, "citations": [], "usage": usage.as_dict()}
+
+async def asummarize_notes(notes: str, imaging_findings: List[str] | None = None) -> dict:
+    usage = _Usage()
+    text, n = await _amap(notes or "", usage)
+    prompt = _build_prompt(text, imaging_findings)
+    started = time.perf_counter()
+    out = await achat_complete(SYSTEM, prompt, temperature=0.2, route="summarize")
+    usage.timed("reduce", started)
+    usage.add(n + count_tokens(_build_prompt("", imaging_findings)), out)
+    return {"summary": out, "citations": [], "usage": usage.as_dict()}
+
+async def astream_summary(notes: str, imaging_findings: List[str] | None = None,
+                          usage_out: Dict[str, Any] | None = None) -> AsyncIterator[str]:
+    """
+    Token stream of `asummarize_notes`. The map stage (if any) runs first and
+    only the reduce is streamed; `usage_out` is filled once the stream ends.
+    """
+    usage = _Usage()
+    text, n = await _amap(notes or "", usage)
+    prompt = _build_prompt(text, imaging_findings)
+    started = time.perf_counter()
+    parts = []
+    async for delta in astream_chat_complete(SYSTEM, prompt, temperature=0.2, route="summarize"):
+        parts.append(delta)
+        yield delta
+    usage.timed("reduce", started)
+    usage.add(n + count_tokens(_build_prompt("", imaging_findings)), "".join(parts))
+    if usage_out is not None:
+        usage_out.update(usage.as_dict())
+
+async def aupdate_summary(summary: str, notes: str, imaging_findings: List[str] | None = None) -> dict:
+    """`summary` updated with new notes/findings only; a long delta is mapped to extracts first."""
+    usage = _Usage("incremental")
+    text, n = await _amap(notes or "", usage)
+    prompt = _build_update_prompt(summary, text, imaging_findings)
+    started = time.perf_counter()
+    out = await achat_complete(SYSTEM, prompt, temperature=0.2, route="summarize")
+    usage.timed("reduce", started)
+    usage.add(n + count_tokens(_build_update_prompt(summary, "", imaging_findings)), out)
+    return {"summary": out, "citations": [], "usage": usage.as_dict()}
+
+async def astream_update(summary: str, notes: str, imaging_findings: List[str] | None = None,
+                         usage_out: Dict[str, Any] | None = None) -> AsyncIterator[str]:
+    """Token stream of `aupdate_summary`."""
+    usage = _Usage("incremental")
+    text, n = await _amap(notes or "", usage)
+    prompt = _build_update_prompt(summary, text, imaging_findings)
+    started = time.perf_counter()
+    parts = []
+    async for delta in astream_chat_complete(SYSTEM, prompt, temperature=0.2, route="summarize"):
+        parts.append(delta)
+        yield delta
+    usage.timed("reduce", started)
+    usage.add(n + count_tokens(_build_update_prompt(summary, "", imaging_findings)), "".join(parts))
+    if usage_out is not None:
+        usage_out.update(usage.as_dict())
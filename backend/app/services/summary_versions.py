@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+from backend.app.utils.cache import SqliteStore
+from .prefetch import claim
+from .summarizer import astream_summary, astream_update, asummarize_notes, aupdate_summary
+
+# One row per (owner, case) in a SqliteStore shared by every worker:
+#   {"summary", "version", "updates", "inputs", "notes_len", "notes_hash", "findings", "updated"}
+# notes_len/notes_hash identify the notes prefix the summary covers: notes
+# that still start with it were only appended to, so just the rest (and any
+# new findings) goes to the model together with the stored summary. Edited
+# notes or removed findings mean a full re-summarization.
+
+_store: Optional[SqliteStore] = None
+
+FULL, INCREMENTAL, UNCHANGED = "full", "incremental", "unchanged"
+
+
+def _get_store() -> SqliteStore:
+    global _store
+    if _store is None:
+        _store = SqliteStore(settings.summary_db_path, max_bytes=settings.summary_max_bytes,
+                             ttl_s=settings.summary_ttl_s)
+    return _store
+
+
+def _key(owner: Optional[str], case_id: str) -> str:
+    return hashlib.sha256(json.dumps([owner or "", case_id]).encode()).hexdigest()
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def inputs_hash(notes: str, findings: List[str]) -> str:
+    return _digest(json.dumps([notes, findings], ensure_ascii=False))
+
+
+def plan(prior: Optional[Dict[str, Any]], notes: str, findings: List[str]) -> Tuple[str, str, List[str]]:
+    """-> (mode, notes to send, findings to send) for re-summarizing against `prior`."""
+    if prior is None:
+        return FULL, notes, findings
+    if prior["inputs"] == inputs_hash(notes, findings):
+        return UNCHANGED, "", []
+    n = prior["notes_len"]
+    if len(notes) < n or _digest(notes[:n]) != prior["notes_hash"]:
+        return FULL, notes, findings
+    if any(f not in findings for f in prior["findings"]):
+        return FULL, notes, findings
+    delta_notes, delta_findings = notes[n:].strip(), [f for f in findings if f not in prior["findings"]]
+    if not delta_notes and not delta_findings:
+        return UNCHANGED, "", []  # findings reordered: nothing new to tell the model
+    if prior.get("updates", 0) >= settings.summarize_full_every:
+        return FULL, notes, findings  # a periodic full pass keeps repeated rewrites from drifting
+    return INCREMENTAL, delta_notes, delta_findings
+
+
+def _save(key: str, prior: Optional[Dict[str, Any]], mode: str, summary: str,
+          notes: str, findings: List[str]) -> int:
+    version = (prior or {}).get("version", 0) + 1
+    _get_store().set(key, {
+        "summary": summary,
+        "version": version,
+        "updates": (prior or {}).get("updates", 0) + 1 if mode == INCREMENTAL else 0,
+        "inputs": inputs_hash(notes, findings),
+        "notes_len": len(notes),
+        "notes_hash": _digest(notes),
+        "findings": findings,
+        "updated": time.time(),
+    })
+    metrics.inc(f"summary_versions.{mode}")
+    return version
+
+
+def _unchanged(prior: Dict[str, Any]) -> Dict[str, Any]:
+    metrics.inc(f"summary_versions.{UNCHANGED}")
+    return {"summary": prior["summary"], "citations": [],
+            "usage": {"mode": UNCHANGED, "tokens": {"prompt": 0, "completion": 0, "total": 0}}}
+
+
+async def asummarize_case(owner: Optional[str], case_id: str, notes: str,
+                          findings: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Summary of a case, versioned per (owner, case_id): unchanged inputs
+    return the stored version, appended notes/findings update it from the
+    delta only, anything else is summarized from scratch.
+    """
+    notes, findings = (notes or "").strip(), list(findings or [])
+    key = _key(owner, case_id)
+    prior = await asyncio.to_thread(_get_store().get, key)
+    mode, delta_notes, delta_findings = plan(prior, notes, findings)
+    if mode == UNCHANGED:
+        return {**_unchanged(prior), "version": prior["version"]}
+    if mode == INCREMENTAL:
+        result = await aupdate_summary(prior["summary"], delta_notes, delta_findings)
+    else:
+        result = await claim(notes, findings) or await asummarize_notes(notes, findings)
+    version = await asyncio.to_thread(_save, key, prior, mode, result["summary"], notes, findings)
+    return {**result, "version": version}
+
+
+async def astream_case(owner: Optional[str], case_id: str, notes: str, findings: Optional[List[str]] = None,
+                       usage_out: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """Token stream of `asummarize_case`; `usage_out` also gets the stored `version`."""
+    notes, findings = (notes or "").strip(), list(findings or [])
+    key = _key(owner, case_id)
+    prior = await asyncio.to_thread(_get_store().get, key)
+    mode, delta_notes, delta_findings = plan(prior, notes, findings)
+    usage: Dict[str, Any] = {}
+    if mode == UNCHANGED:
+        done = _unchanged(prior)
+        usage, version = done["usage"], prior["version"]
+        yield done["summary"]
+    else:
+        prefetched = await claim(notes, findings) if mode == FULL else None
+        if prefetched is not None:
+            usage.update(prefetched["usage"], prefetched=True)
+            summary = prefetched["summary"]
+            yield summary
+        else:
+            if mode == INCREMENTAL:
+                stream = astream_update(prior["summary"], delta_notes, delta_findings, usage_out=usage)
+            else:
+                stream = astream_summary(notes, findings, usage_out=usage)
+            parts = []
+            async for delta in stream:
+                parts.append(delta)
+                yield delta
+            summary = "".join(parts)
+        version = await asyncio.to_thread(_save, key, prior, mode, summary, notes, findings)
+    if usage_out is not None:
+        usage_out.update(usage, version=version)
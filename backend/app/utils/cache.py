@@ -0,0 +1,191 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+from backend.app.utils import metrics
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU with a per-entry TTL. Values go in and come out
+    as deep copies, so a caller mutating a result cannot change what others
+    get; `copy=False` shares them (for large read-only objects).
+    """
+
+    def __init__(self, max_items: int = 256, ttl_s: float = 3600.0, copy: bool = True):
+        self.max_items = max_items
+        self.ttl_s = ttl_s
+        self.copy = copy
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+        return copy.deepcopy(value) if self.copy else value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.max_items <= 0:
+            return
+        if self.copy:
+            value = copy.deepcopy(value)
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl_s, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SqliteStore:
+    """
+    Small JSON key/value store on SQLite, safe to share between worker
+    processes on one host (WAL mode). Entries expire after `ttl_s`; once the
+    payload total exceeds `max_bytes` the least recently used rows go first.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, ttl_s: float = 7 * 24 * 3600.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as c:
+            c.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " expires REAL NOT NULL, used REAL NOT NULL)"
+            )
+            c.execute("CREATE INDEX IF NOT EXISTS kv_used ON kv(used)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        try:
+            c = self._conn()
+            row = c.execute("SELECT value, expires FROM kv WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                c.execute("DELETE FROM kv WHERE key = ?", (key,))
+                return None
+            c.execute("UPDATE kv SET used = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+        except sqlite3.Error:
+            return None  # the disk tier is best-effort
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        payload = json.dumps(value, separators=(",", ":"))
+        try:
+            c = self._conn()
+            c.execute(
+                "INSERT OR REPLACE INTO kv (key, value, size, expires, used) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now + self.ttl_s, now),
+            )
+            self._evict(c, now)
+        except sqlite3.Error:
+            pass
+
+    def update(self, key: str, fn: Callable[[Any], Any]) -> Optional[Any]:
+        """
+        Atomic read-modify-write: store `fn(current value)` (restarting its TTL),
+        with concurrent writers from any process serialized. A missing or
+        expired key is left alone; -> the new value, or None.
+        """
+        now = time.time()
+        try:
+            c = self._conn()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                row = c.execute("SELECT value FROM kv WHERE key = ? AND expires >= ?", (key, now)).fetchone()
+                value = None if row is None else fn(json.loads(row[0]))
+                if value is not None:
+                    payload = json.dumps(value, separators=(",", ":"))
+                    c.execute("UPDATE kv SET value = ?, size = ?, expires = ?, used = ? WHERE key = ?",
+                              (payload, len(payload), now + self.ttl_s, now, key))
+                c.execute("COMMIT")
+            except BaseException:
+                c.execute("ROLLBACK")
+                raise
+            if value is not None:
+                self._evict(c, now)
+            return value
+        except sqlite3.Error:
+            return None
+
+    def delete(self, key: str) -> None:
+        try:
+            self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, c: sqlite3.Connection, now: float) -> None:
+        c.execute("DELETE FROM kv WHERE expires < ?", (now,))
+        total = c.execute("SELECT COALESCE(SUM(size), 0) FROM kv").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        for key, size in c.execute("SELECT key, size FROM kv ORDER BY used ASC").fetchall():
+            c.execute("DELETE FROM kv WHERE key = ?", (key,))
+            excess -= size
+            if excess <= 0:
+                break
+
+
+class TieredCache:
+    """Memory LRU in front of an optional shared SqliteStore."""
+
+    def __init__(self, name: str, max_items: int, ttl_s: float,
+                 disk_path: Optional[str] = None, disk_max_bytes: int = 256 * 1024 * 1024):
+        self.name = name
+        self.memory = LRUCache(max_items=max_items, ttl_s=ttl_s)
+        self.disk = SqliteStore(disk_path, max_bytes=disk_max_bytes, ttl_s=ttl_s) if disk_path else None
+
+    def get(self, key: str) -> Tuple[Optional[Any], str]:
+        """Returns (value, tier) where tier is "memory", "disk" or "miss"."""
+        value = self.memory.get(key)
+        if value is not None:
+            metrics.inc(f"{self.name}.hit.memory")
+            return value, "memory"
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+                metrics.inc(f"{self.name}.hit.disk")
+                return value, "disk"
+        metrics.inc(f"{self.name}.miss")
+        return None, "miss"
+
+    def set(self, key: str, value: Any) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def delete(self, key: str) -> None:
+        self.memory.pop(key)
+        if self.disk is not None:
+            self.disk.delete(key)
@@ -0,0 +1,2 @@
+class UnsupportedDicom(ValueError):
+    """The upload is a DICOM we refuse to decode (syntax, modality, size...)."""
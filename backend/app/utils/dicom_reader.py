@@ -0,0 +1,245 @@
+import struct
+from typing import Any, Dict, Tuple
+
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset
+from pydicom.multival import MultiValue
+from pydicom.uid import (
+    DeflatedExplicitVRLittleEndian,
+    ExplicitVRBigEndian,
+    ExplicitVRLittleEndian,
+    ImplicitVRLittleEndian,
+)
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+from backend.app.utils.common import UnsupportedDicom
+from backend.app.utils.uploads import as_stream
+
+# Uncompressed little-endian pixel data can be viewed in place (np.frombuffer)
+# instead of being copied out by pydicom.
+RAW_LITTLE_ENDIAN = {ImplicitVRLittleEndian, ExplicitVRLittleEndian}
+NATIVE = RAW_LITTLE_ENDIAN | {DeflatedExplicitVRLittleEndian, ExplicitVRBigEndian}
+PIXEL_DATA_TAG = b"\xe0\x7f\x10\x00"  # (7FE0,0010), little endian
+
+# Colour images (secondary captures, photos of film) are reduced to luma
+# before the grayscale model sees them. YBR data already carries luma in Y.
+GRAY = ("MONOCHROME1", "MONOCHROME2")
+COLOR = ("RGB", "YBR_FULL", "YBR_FULL_422")
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def read_header(data) -> Tuple[Dataset, int]:
+    """Parse everything up to Pixel Data; returns (header, offset of the Pixel Data tag)."""
+    fp = as_stream(data)
+    try:
+        ds = pydicom.dcmread(fp, stop_before_pixels=True)
+    except Exception as e:
+        raise UnsupportedDicom(f"Not a readable DICOM file: {e}")
+    return ds, fp.tell()
+
+
+def transfer_syntax(ds: Dataset):
+    return getattr(getattr(ds, "file_meta", None), "TransferSyntaxUID", None) or ImplicitVRLittleEndian
+
+
+def _decoder_available(uid) -> bool:
+    try:
+        from pydicom.pixels import get_decoder
+        return get_decoder(uid).is_available
+    except Exception:
+        return False
+
+
+def check_supported(ds: Dataset) -> None:
+    """Reject before any pixel decode if we cannot (or should not) handle it."""
+    tsyntax = transfer_syntax(ds)
+    if tsyntax not in NATIVE and not _decoder_available(tsyntax):
+        raise UnsupportedDicom(f"Unsupported transfer syntax {tsyntax.name} ({tsyntax})")
+
+    modality = str(getattr(ds, "Modality", "") or "").upper()
+    allowed = [m.upper() for m in settings.dicom_modalities]
+    if allowed and modality not in allowed:
+        raise UnsupportedDicom(f"Unsupported modality {modality or '(none)'}; expected one of {allowed}")
+
+    samples = int(getattr(ds, "SamplesPerPixel", 1))
+    photometric = str(getattr(ds, "PhotometricInterpretation", "MONOCHROME2"))
+    if samples not in (1, 3):
+        raise UnsupportedDicom(f"Unsupported samples per pixel ({samples}); expected grayscale or RGB/YBR")
+    if photometric not in (GRAY if samples == 1 else COLOR):
+        raise UnsupportedDicom(f"Unsupported photometric interpretation {photometric} ({samples} samples)")
+    if "Rows" not in ds or "Columns" not in ds:
+        raise UnsupportedDicom("DICOM has no image pixel module")
+
+    frame_bytes = int(ds.Rows) * int(ds.Columns) * samples * int(getattr(ds, "BitsAllocated", 16)) // 8
+    if frame_bytes > settings.dicom_max_frame_mb * 2**20:
+        raise UnsupportedDicom(f"DICOM frame too large ({frame_bytes / 2**20:.0f} MB)")
+
+
+def box_reduce(arr: np.ndarray, factor: int) -> np.ndarray:
+    """Integer block mean -> float32; works on read-only views without copying them."""
+    if factor <= 1:
+        return arr.astype(np.float32)
+    h, w = (arr.shape[0] // factor) * factor, (arr.shape[1] // factor) * factor
+    blocks = arr[:h, :w].reshape(h // factor, factor, w // factor, factor)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def _gray_reduce(px: np.ndarray, photometric: str, factor: int) -> np.ndarray:
+    """
+    `box_reduce` of a (rows, cols, 3) colour frame, per channel, to luma:
+    0.299 R + 0.587 G + 0.114 B, or Y itself for YBR data.
+    """
+    if photometric.startswith("YBR"):
+        return box_reduce(px[..., 0], factor)
+    out = box_reduce(px[..., 0], factor) * LUMA[0]
+    for i in (1, 2):
+        out += box_reduce(px[..., i], factor) * LUMA[i]
+    return out
+
+
+def _raw_frame_view(data, ds: Dataset, offset: int, frame: int) -> np.ndarray | None:
+    """
+    Zero-copy view of one frame of uncompressed LE pixel data, or None when
+    the layout is anything we would rather let pydicom handle. Colour frames
+    come back as (rows, cols, 3) whatever their planar configuration.
+    """
+    tsyntax = transfer_syntax(ds)
+    bits = int(getattr(ds, "BitsAllocated", 16))
+    signed = int(getattr(ds, "PixelRepresentation", 0)) == 1
+    if tsyntax not in RAW_LITTLE_ENDIAN or bits not in (8, 16, 32):
+        return None
+    if signed and int(getattr(ds, "BitsStored", bits)) != bits:
+        return None  # needs sign extension
+    if str(getattr(ds, "PhotometricInterpretation", "")) == "YBR_FULL_422":
+        return None  # chroma-subsampled samples
+
+    buf = memoryview(data)
+    if bytes(buf[offset:offset + 4]) != PIXEL_DATA_TAG:
+        return None
+    if tsyntax.is_implicit_VR:
+        (length,) = struct.unpack_from("<I", buf, offset + 4)
+        start = offset + 8
+    else:
+        (length,) = struct.unpack_from("<I", buf, offset + 8)
+        start = offset + 12
+    if length == 0xFFFFFFFF:
+        return None  # encapsulated
+
+    rows, cols = int(ds.Rows), int(ds.Columns)
+    samples = int(getattr(ds, "SamplesPerPixel", 1))
+    dtype = np.dtype(f"<{'i' if signed else 'u'}{bits // 8}")
+    frame_len = rows * cols * samples * dtype.itemsize
+    begin = start + frame * frame_len
+    if begin + frame_len > start + length or begin + frame_len > len(buf):
+        return None
+    px = np.frombuffer(buf, dtype=dtype, count=rows * cols * samples, offset=begin)
+    if samples == 1:
+        return px.reshape(rows, cols)
+    if int(getattr(ds, "PlanarConfiguration", 0)) == 1:  # RRR...GGG...BBB...
+        return np.moveaxis(px.reshape(samples, rows, cols), 0, -1)
+    return px.reshape(rows, cols, samples)
+
+
+def _apply_voi(arr: np.ndarray, ds: Dataset) -> np.ndarray:
+    """VOI LUT / windowing in NumPy, falling back to min-max when absent. Output 0..1."""
+    if "VOILUTSequence" in ds and len(ds.VOILUTSequence):
+        item = ds.VOILUTSequence[0]
+        desc = item.LUTDescriptor
+        lut = np.asarray(item.LUTData, dtype=np.float32)
+        idx = np.clip(arr - float(desc[1]), 0, len(lut) - 1).astype(np.intp)
+        out = lut[idx]
+        top = float(lut.max())
+        return out / top if top > 0 else out
+
+    if "WindowCenter" in ds and "WindowWidth" in ds:
+        c = ds.WindowCenter
+        w = ds.WindowWidth
+        c = float(c[0] if isinstance(c, MultiValue) else c)
+        w = float(w[0] if isinstance(w, MultiValue) else w)
+        fn = str(getattr(ds, "VOILUTFunction", "LINEAR") or "LINEAR").upper()
+        if w > 1:
+            if fn == "SIGMOID":
+                return 1.0 / (1.0 + np.exp(-4.0 * (arr - c) / w))
+            if fn == "LINEAR_EXACT":
+                lo, hi = c - w / 2.0, c + w / 2.0
+            else:
+                lo, hi = c - 0.5 - (w - 1) / 2.0, c - 0.5 + (w - 1) / 2.0
+            arr -= lo
+            arr /= hi - lo
+            return np.clip(arr, 0.0, 1.0, out=arr)
+
+    return _min_max(arr)
+
+
+def _min_max(arr: np.ndarray) -> np.ndarray:
+    arr -= arr.min()
+    mx = arr.max()
+    if mx > 0:
+        arr /= mx
+    return arr
+
+
+def decode_reduced(data, min_side: int, frame: int = 0) -> Tuple[np.ndarray, Tuple[int, int], Dict[str, Any]]:
+    """
+    Header-first DICOM decode straight to a small float32 image in 0..1.
+
+    The image is block-reduced while decoding so its shorter side stays >=
+    `min_side`. Returns (array, original (w, h), stats), where stats carries
+    the estimated peak bytes held for this request.
+    """
+    ds, pixel_offset = read_header(data)
+    check_supported(ds)
+
+    rows, cols = int(ds.Rows), int(ds.Columns)
+    n_frames = int(getattr(ds, "NumberOfFrames", 1) or 1)
+    if not 0 <= frame < n_frames:
+        raise UnsupportedDicom(f"Frame {frame} out of range (file has {n_frames})")
+    factor = max(1, min(rows, cols) // min_side)
+
+    px = _raw_frame_view(data, ds, pixel_offset, frame)
+    fast = px is not None
+    photometric = str(getattr(ds, "PhotometricInterpretation", ""))
+    if px is None:
+        # Compressed or unusual layout: let pydicom decode just this frame.
+        # Colour comes back as RGB (YBR converted), as it does from pydicom 3.
+        full = pydicom.dcmread(as_stream(data))
+        try:
+            from pydicom.pixels import pixel_array
+            px = pixel_array(full, index=frame, as_rgb=True)
+        except ImportError:
+            px = full.pixel_array if n_frames == 1 else full.pixel_array[frame]
+            if px.ndim == 3 and str(full.PhotometricInterpretation).startswith("YBR"):
+                from pydicom.pixel_data_handlers.util import convert_color_space
+                px = convert_color_space(px, full.PhotometricInterpretation, "RGB")
+        if px.ndim == 3:
+            photometric = "RGB"
+        decoded_bytes = px.nbytes
+    else:
+        decoded_bytes = 0  # view into the upload buffer
+
+    if px.ndim == 3:
+        # Colour: luma, then min-max (rescale and VOI windowing are grayscale-only).
+        arr = _min_max(_gray_reduce(px, photometric, factor))
+    else:
+        arr = box_reduce(px, factor)
+        if "RescaleSlope" in ds and "RescaleIntercept" in ds:
+            arr *= np.float32(ds.RescaleSlope)
+            arr += np.float32(ds.RescaleIntercept)
+        arr = _apply_voi(arr, ds)
+        if photometric == "MONOCHROME1":
+            arr = np.subtract(1.0, arr, out=arr)
+
+    stats = {
+        "transfer_syntax": str(transfer_syntax(ds)),
+        "modality": str(getattr(ds, "Modality", "")),
+        "frames": n_frames,
+        "samples": int(getattr(ds, "SamplesPerPixel", 1)),
+        "zero_copy": fast,
+        "reduce_factor": factor,
+        "peak_bytes": len(data) + decoded_bytes + arr.nbytes,
+    }
+    metrics.observe("dicom.peak_mb", stats["peak_bytes"] / 2**20)
+    metrics.inc("dicom.decoded.zero_copy" if fast else "dicom.decoded.pydicom")
+    return arr.astype(np.float32, copy=False), (cols, rows), stats
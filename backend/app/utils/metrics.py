@@ -0,0 +1,54 @@
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict
+
+# In-process counters and latency summaries. Values are per worker process;
+# scrape every worker (or aggregate in the log pipeline) for a node view.
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_summaries: Dict[str, Dict[str, Any]] = {}
+
+_WINDOW = 1024  # recent samples kept per summary for percentiles
+
+
+def inc(name: str, value: float = 1.0) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, value: float) -> None:
+    """Record one sample (e.g. a batch size or a delay in ms)."""
+    with _lock:
+        s = _summaries.get(name)
+        if s is None:
+            s = {"count": 0, "sum": 0.0, "max": 0.0, "recent": deque(maxlen=_WINDOW)}
+            _summaries[name] = s
+        s["count"] += 1
+        s["sum"] += value
+        s["max"] = max(s["max"], value)
+        s["recent"].append(value)
+
+
+def _percentile(samples: Deque[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        counters = dict(_counters)
+        summaries = {
+            name: {
+                "count": s["count"],
+                "mean": s["sum"] / s["count"] if s["count"] else 0.0,
+                "max": s["max"],
+                "p50": _percentile(s["recent"], 0.50),
+                "p99": _percentile(s["recent"], 0.99),
+            }
+            for name, s in _summaries.items()
+        }
+    return {"counters": counters, "summaries": summaries}
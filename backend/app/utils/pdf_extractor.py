@@ -1,35 +1,418 @@
-from typing import Optional
-import io
-
-def extract_pdf_text_pdfium(pdf_bytes: bytes) -> str:
-    # Primary: PyMuPDF
-    import fitz  # PyMuPDF
-    text_parts = []
-    with fitz.open(stream=io.BytesIO(pdf_bytes), filetype="pdf") as doc:
-        for page in doc:
-            text_parts.append(page.get_text("text"))
-    return "\n".join(text_parts).strip()
-
-def extract_pdf_text_pypdf(pdf_bytes: bytes) -> str:
-    # Fallback: PyPDF
-    from pypdf import PdfReader
-    text_parts = []
-    reader = PdfReader(io.BytesIO(pdf_bytes))
-    for p in reader.pages:
-        text_parts.append(p.extract_text() or "")
-    return "\n".join(text_parts).strip()
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import contextlib
+import functools
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+from backend.app.utils.cache import SqliteStore, TieredCache
+
+_pool: Optional[ProcessPoolExecutor] = None
+_cache: Optional[TieredCache] = None
+_stores: Dict[str, SqliteStore] = {}  # pool workers' handles on the shared disk cache
+_pool_lock = threading.Lock()
+
+# Cache keys; versioned with the digest scheme, so entries written under an
+# older scheme are never read back.
+DOC_KEY = "doc:v2:"     # document hash -> page digests
+PAGE_KEY = "page:v2:"   # page digest -> page text
+
+
+def _pypdf_page(reader, index: int) -> str:
+    try:
+        return reader.pages[index].extract_text() or ""
+    except Exception:
+        return ""
+
+
+def extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    """
+    Text of pages [start, stop) of the PDF at `path`. PyMuPDF first; a page it
+    fails on (or returns nothing for) is retried with pypdf, page by page.
+    Runs in the extraction pool's worker processes.
+    """
+    reader = None
+
+    def fallback(i: int) -> str:
+        nonlocal reader
+        if reader is None:
+            from pypdf import PdfReader
+            reader = PdfReader(path)
+        return _pypdf_page(reader, i)
 
-def extract_pdf_text(pdf_bytes: bytes) -> str:
     try:
-        txt = extract_pdf_text_pdfium(pdf_bytes)
-        if txt.strip():
-            return txt
+        import fitz  # PyMuPDF
+        doc = fitz.open(path)
     except Exception:
-        pass
+        return [fallback(i) for i in range(start, stop)]
+    out = []
+    with doc:
+        for i in range(start, min(stop, doc.page_count)):
+            try:
+                text = doc.load_page(i).get_text("text")
+            except Exception:
+                text = ""
+            out.append(text if text.strip() else fallback(i))
+    return out
+
+
+def page_count(path: str) -> int:
     try:
-        txt = extract_pdf_text_pypdf(pdf_bytes)
-        if txt.strip():
-            return txt
+        import fitz
+        with fitz.open(path) as doc:
+            return doc.page_count
     except Exception:
-        pass
-    return ""
+        from pypdf import PdfReader
+        return len(PdfReader(path).pages)
+
+
+def _workers() -> int:
+    return settings.pdf_workers or max(1, (os.cpu_count() or 2) // 2)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the web worker has live threads (event loop, torch pools)
+            # that fork() would copy in a broken state.
+            _pool = ProcessPoolExecutor(max_workers=_workers(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+_REF = re.compile(r"(\d+) (\d+) R")
+# Page keys that do not change what the page's text extracts to: the page
+# tree (whose other pages would tie every digest to the whole document) and
+# article beads.
+_PAGE_SKIP = ("Parent", "B")
+_INHERITED = ("Resources", "MediaBox", "CropBox", "Rotate")
+
+
+def _fitz_digest(doc, xref: int, memo: Dict[int, str], active: Set[int]) -> str:
+    """
+    Content digest of object `xref` and everything it references: Form and
+    Image XObjects, fonts and their ToUnicode maps, nested resources. Another
+    page it points to (a link destination) counts by name only.
+    """
+    if xref in memo:
+        return memo[xref]
+    if doc.xref_get_key(xref, "Type") == ("name", "/Page"):
+        return "page"
+    if xref in active:
+        return "cycle"
+    active.add(xref)
+    h = hashlib.sha256(_resolve(doc, doc.xref_object(xref, compressed=True), memo, active).encode())
+    if doc.xref_is_stream(xref):
+        h.update(doc.xref_stream_raw(xref) or b"")
+    active.discard(xref)
+    memo[xref] = h.hexdigest()
+    return memo[xref]
+
+
+def _resolve(doc, source: str, memo: Dict[int, str], active: Set[int]) -> str:
+    """Object source with every indirect reference replaced by the referenced object's digest."""
+    return _REF.sub(lambda m: _fitz_digest(doc, int(m.group(1)), memo, active), source)
+
+
+def _fitz_page_digests(path: str, pages: Optional[Iterable[int]] = None) -> List[str]:
+    import fitz
+    out = []
+    memo: Dict[int, str] = {}
+    with fitz.open(path) as doc:
+        for index in range(doc.page_count) if pages is None else pages:
+            page = doc.load_page(index)
+            active = {page.xref}
+            h = hashlib.sha256(repr((tuple(page.rect), page.rotation)).encode())
+            for key in doc.xref_get_keys(page.xref):
+                if key not in _PAGE_SKIP:
+                    h.update(f"/{key} {_resolve(doc, doc.xref_get_key(page.xref, key)[1], memo, active)}".encode())
+            node = doc.xref_get_key(page.xref, "Parent")
+            while node[0] == "xref":  # attributes inherited from the page tree
+                parent = int(node[1].split()[0])
+                for key in _INHERITED:
+                    kind, value = doc.xref_get_key(parent, key)
+                    if kind != "null":
+                        h.update(f"^{key} {_resolve(doc, value, memo, active)}".encode())
+                node = doc.xref_get_key(parent, "Parent")
+            out.append(h.hexdigest())
+    return out
+
+
+def _pypdf_digest(obj, memo: Dict[Tuple[int, int], str], active: Set[Tuple[int, int]]) -> str:
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key in memo:
+            return memo[key]
+        target = obj.get_object()
+        if isinstance(target, DictionaryObject) and target.get("/Type") == "/Page":
+            return "page"
+        if key in active:
+            return "cycle"
+        active.add(key)
+        memo[key] = _pypdf_digest(target, memo, active)
+        active.discard(key)
+        return memo[key]
+    h = hashlib.sha256(type(obj).__name__.encode())
+    if isinstance(obj, DictionaryObject):
+        for k in sorted(obj):
+            h.update(f"{k} {_pypdf_digest(obj.raw_get(k), memo, active)};".encode())
+        if isinstance(obj, StreamObject):
+            h.update(obj.get_data())
+    elif isinstance(obj, ArrayObject):
+        for item in obj:
+            h.update(f"{_pypdf_digest(item, memo, active)};".encode())
+    else:
+        h.update(repr(obj).encode())
+    return h.hexdigest()
+
+
+def _pypdf_page_digests(path: str, pages: Optional[Iterable[int]] = None) -> List[str]:
+    from pypdf import PdfReader
+    out = []
+    memo: Dict[Tuple[int, int], str] = {}
+    reader = PdfReader(path)
+    for index in range(len(reader.pages)) if pages is None else pages:
+        page = reader.pages[index]
+        active = {(page.indirect_reference.idnum, page.indirect_reference.generation)} \
+            if page.indirect_reference is not None else set()
+        h = hashlib.sha256(repr((tuple(page.mediabox), page.rotation)).encode())
+        for key in sorted(page):
+            if key.lstrip("/") not in _PAGE_SKIP:
+                h.update(f"{key} {_pypdf_digest(page.raw_get(key), memo, active)};".encode())
+        node = page.get("/Parent")
+        while node is not None:
+            for key in _INHERITED:
+                if f"/{key}" in node:
+                    h.update(f"^{key} {_pypdf_digest(node.raw_get(f'/{key}'), memo, active)};".encode())
+            node = node.get("/Parent")
+        out.append(h.hexdigest())
+    return out
+
+
+def page_digests(path: str, pages: Optional[Iterable[int]] = None) -> List[str]:
+    """
+    Per-page content digest (of `pages`, default all) over everything the
+    page's text depends on: its content streams and, recursively, every
+    object they reference (XObjects, fonts, ToUnicode maps), plus inherited
+    attributes. Objects are hashed by content, not object number, so an
+    appended version of a document keeps the digests of its old pages and
+    their cached text is reused.
+    """
+    try:
+        return _fitz_page_digests(path, pages)
+    except ImportError:
+        return _pypdf_page_digests(path, pages)
+
+
+def _digested_range(path: str, start: int, stop: int,
+                    lookup: Callable[[str], Optional[str]]) -> List[Tuple[Optional[str], str, bool]]:
+    """
+    (digest, text, reused) per page of [start, stop). Pages whose digest
+    `lookup` finds cached (an earlier version of the document) are not
+    extracted again; digest None means the page tree could not be walked.
+    """
+    pages = range(start, stop)
+    try:
+        digests: List[Optional[str]] = list(page_digests(path, pages))
+    except Exception:
+        digests = [None] * len(pages)  # unreadable page tree: extract without the cache
+    known = {}
+    for i, d in zip(pages, digests):
+        text = lookup(d) if d is not None else None
+        if text is not None:
+            known[i] = text
+    texts: Dict[int, str] = {}
+    for a, b in _ranges([i for i in pages if i not in known], len(pages)):
+        texts.update(enumerate(extract_page_range(path, a, b), a))
+    return [(d, known[i] if i in known else texts.get(i, ""), i in known) for i, d in zip(pages, digests)]
+
+
+def extract_digested_range(path: str, start: int, stop: int,
+                           store_path: Optional[str] = None) -> List[Tuple[Optional[str], str, bool]]:
+    """
+    `_digested_range` in a pool worker, for a document seen for the first
+    time: pages are digested here, a range at a time, rather than serially
+    up front, and not past the ranges the character cap lets through.
+    Cached page texts are looked up in the shared disk cache at `store_path`.
+    """
+    store = None
+    if store_path:
+        store = _stores.get(store_path)
+        if store is None:
+            store = _stores[store_path] = SqliteStore(store_path)
+
+    def lookup(digest: str) -> Optional[str]:
+        return store.get(PAGE_KEY + digest) if store is not None else None
+    return _digested_range(path, start, stop, lookup)
+
+
+def get_pdf_cache() -> Optional[TieredCache]:
+    global _cache
+    if not settings.pdf_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = TieredCache(
+            "pdf_cache",
+            max_items=settings.pdf_cache_max_items,
+            ttl_s=settings.pdf_cache_ttl_s,
+            disk_path=settings.pdf_cache_path,
+            disk_max_bytes=settings.pdf_cache_max_bytes,
+        )
+    return _cache
+
+
+def _cached_pages(cache: TieredCache, digests: List[str]) -> Dict[int, str]:
+    out = {}
+    for i, d in enumerate(digests):
+        text, _ = cache.get(PAGE_KEY + d)
+        if text is not None:
+            out[i] = text
+    return out
+
+
+def _ranges(pages: List[int], step: int) -> List[Tuple[int, int]]:
+    """Runs of consecutive page numbers, each at most `step` long."""
+    out: List[Tuple[int, int]] = []
+    for i in pages:
+        if out and out[-1][1] == i and i - out[-1][0] < step:
+            out[-1] = (out[-1][0], i + 1)
+        else:
+            out.append((i, i + 1))
+    return out
+
+
+def _run_ranges(ranges: List[Tuple[int, int]], task: Callable[[int, int], list],
+                local: Optional[Callable[[int, int], list]] = None) -> Iterator[Tuple[int, list]]:
+    """
+    Yield (start, task(start, stop)) per range, in order. More than one range
+    (and PDF_WORKERS > 1) goes to the process pool (so `task` must pickle)
+    with a bounded window in flight; closing the generator cancels what has
+    not started. Otherwise `local` (default `task`) runs inline.
+    """
+    if len(ranges) <= 1 or _workers() == 1:
+        for start, stop in ranges:
+            yield start, (local or task)(start, stop)
+        return
+
+    pool = _get_pool()
+    window = 2 * _workers()  # ranges in flight; bounds the work wasted past the cap
+    pending = []
+    it = iter(ranges)
+    try:
+        for start, stop in it:
+            pending.append((start, pool.submit(task, start, stop)))
+            if len(pending) >= window:
+                break
+        while pending:
+            start, fut = pending.pop(0)
+            yield start, fut.result()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append((nxt[0], pool.submit(task, *nxt)))
+    finally:
+        for _, fut in pending:
+            fut.cancel()
+
+
+def _capped(pages: Iterator[Tuple[int, str]], max_chars: Optional[int]) -> Iterator[Tuple[int, str]]:
+    chars = 0
+    for i, text in pages:
+        yield i, text
+        chars += len(text)
+        if max_chars is not None and chars >= max_chars:
+            return
+
+
+def iter_pdf_pages(pdf_bytes: bytes, max_chars: Optional[int] = None,
+                   path: Optional[str] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page number, text) in page order; once `max_chars` characters
+    have been yielded the remaining work is cancelled. `path`, if given, is
+    a file holding `pdf_bytes` (an upload spooled to disk) that the workers
+    open directly; otherwise the bytes are written to a temp file once.
+
+    With the PDF cache on, a known document (by hash) is served from cached
+    page texts without parsing it, and only its uncached pages are
+    extracted. A document seen for the first time is digested page by page
+    in the pool workers along with its extraction, reusing cached text for
+    pages it shares with an earlier version. Either way the work runs in
+    ranges of PDF_PAGES_PER_TASK pages on the process pool.
+    """
+    cache = get_pdf_cache()
+    doc_key = DOC_KEY + hashlib.sha256(pdf_bytes).hexdigest()
+    digests: Optional[List[str]] = None
+    known: Dict[int, str] = {}
+    if cache is not None:
+        digests, _ = cache.get(doc_key)
+        known = _cached_pages(cache, digests) if digests is not None else {}
+        if digests is not None and len(known) == len(digests):
+            metrics.inc("pdf_cache.pages_reused", len(known))
+            yield from _capped(((i, known[i]) for i in range(len(known))), max_chars)
+            return
+
+    with contextlib.ExitStack() as stack:
+        if path is None:
+            # Unlinked on exit; a range still running in a worker keeps its
+            # own handle, which is safe on POSIX.
+            tmp = stack.enter_context(tempfile.NamedTemporaryFile(suffix=".pdf"))
+            tmp.write(pdf_bytes)
+            tmp.flush()
+            path = tmp.name
+        try:
+            n = len(digests) if digests is not None else page_count(path)
+        except Exception:
+            return
+        metrics.inc("pdf_cache.pages_reused", len(known))
+        step = max(1, settings.pdf_pages_per_task)
+
+        if digests is not None:
+            runs = _run_ranges(_ranges([i for i in range(n) if i not in known], step),
+                               functools.partial(extract_page_range, path))
+        elif cache is not None:
+            runs = _run_ranges(
+                _ranges(list(range(n)), step),
+                functools.partial(extract_digested_range, path, store_path=settings.pdf_cache_path),
+                local=functools.partial(_digested_range, path, lookup=lambda d: cache.get(PAGE_KEY + d)[0]),
+            )
+        else:
+            runs = _run_ranges(_ranges(list(range(n)), step), functools.partial(extract_page_range, path))
+        seen: List[Optional[str]] = [None] * n  # digests of a first-time document, as its ranges finish
+
+        def pages() -> Iterator[Tuple[int, str]]:
+            fresh: Dict[int, Tuple[Optional[str], str, bool]] = {}
+            for i in range(n):
+                if i not in known and i not in fresh:
+                    start, results = next(runs, (i, []))
+                    if digests is not None or cache is None:
+                        results = [(digests[j] if digests else None, text, False)
+                                   for j, text in enumerate(results, start)]
+                    fresh = dict(enumerate(results, start))
+                    reused = sum(1 for _, _, r in results if r)
+                    metrics.inc("pdf_cache.pages_reused", reused)
+                    metrics.inc("pdf_cache.pages_extracted", len(results) - reused)
+                    for j, (d, text, r) in fresh.items():
+                        seen[j] = d
+                        if d is not None and not r:
+                            cache.set(PAGE_KEY + d, text)
+                yield i, known[i] if i in known else fresh.pop(i, (None, "", False))[1]
+            if digests is None and cache is not None and None not in seen:
+                cache.set(doc_key, seen)  # every page digested: next time, no parsing at all
+
+        try:
+            yield from _capped(pages(), max_chars)
+        finally:
+            runs.close()
+
+
+def extract_pdf_text(pdf_bytes: bytes, max_chars: Optional[int] = None, path: Optional[str] = None) -> str:
+    """All page texts joined by newlines, cut to `max_chars`; "" if nothing could be read."""
+    parts = [text for _, text in iter_pdf_pages(pdf_bytes, max_chars, path)]
+    txt = "\n".join(parts).strip()
+    return txt[:max_chars] if max_chars is not None else txt
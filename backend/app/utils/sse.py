@@ -0,0 +1,25 @@
+import json
+import weakref
+from typing import Any, AsyncIterator, Callable, Optional
+
+from fastapi.responses import StreamingResponse
+
+
+def sse_event(event: str, data: Any) -> str:
+    """One Server-Sent Event frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def sse_response(events: AsyncIterator[str], cleanup: Optional[Callable[[], None]] = None) -> StreamingResponse:
+    """
+    `cleanup` (idempotent) also runs if `events` is dropped without ever being
+    iterated -- the client went away before the response started -- so the
+    generator's own `finally` is not the only way resources get released.
+    """
+    if cleanup is not None:
+        weakref.finalize(events, cleanup)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # no proxy buffering
+    )
@@ -0,0 +1,88 @@
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+# Section breaks, strongest first: page (form feed), blank line, heading line
+# ("MEDICATIONS:", "Assessment and Plan"), then any line.
+_PAGE = re.compile(r"\f+")
+_PARA = re.compile(r"\n\s*\n")
+_HEADING = re.compile(r"\n(?=[A-Z][A-Za-z /&()-]{2,60}:?\s*\n|[A-Z][A-Z /&()-]{2,60}:)")
+_LINE = re.compile(r"\n")
+_SEPARATORS = [_PAGE, _PARA, _HEADING, _LINE]
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # not installed, or the BPE file cannot be fetched offline
+        return None
+
+
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is None:
+        return (len(text) + 3) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def _hard_split(text: str, max_tokens: int) -> List[str]:
+    enc = _encoding()
+    if enc is None:
+        step = max_tokens * 4
+        return [text[i:i + step] for i in range(0, len(text), step)]
+    ids = enc.encode(text, disallowed_special=())
+    return [enc.decode(ids[i:i + max_tokens]) for i in range(0, len(ids), max_tokens)]
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The first `max_tokens` tokens of `text`."""
+    enc = _encoding()
+    if enc is None:
+        return text[:max_tokens * 4]
+    return enc.decode(enc.encode(text, disallowed_special=())[:max_tokens])
+
+
+def _pieces(text: str, max_tokens: int, level: int = 0, n: Optional[int] = None) -> List[Tuple[str, int]]:
+    """-> (piece, its token count) pairs, each piece within `max_tokens`."""
+    n = count_tokens(text) if n is None else n
+    if n <= max_tokens:
+        return [(text, n)]
+    if level >= len(_SEPARATORS):
+        return [(p, count_tokens(p)) for p in _hard_split(text, max_tokens)]
+    out: List[Tuple[str, int]] = []
+    for part in _SEPARATORS[level].split(text):
+        if part.strip():
+            out.extend(_pieces(part, max_tokens, level + 1))
+    return out
+
+
+def split_counted(text: str, max_tokens: int, total: Optional[int] = None) -> List[Tuple[str, int]]:
+    """
+    `split_by_tokens` with each chunk's token count (summed from its pieces,
+    so within a few tokens of a recount). `total`, if already known, saves
+    tokenizing the whole text once more.
+    """
+    chunks: List[Tuple[str, int]] = []
+    cur: List[str] = []
+    cur_tokens = 0
+    text = text.strip()
+    for piece, n in _pieces(text, max_tokens, n=total):
+        if cur and cur_tokens + n + 1 > max_tokens:
+            chunks.append(("\n\n".join(cur), cur_tokens))
+            cur, cur_tokens = [], 0
+        cur.append(piece.strip())
+        cur_tokens += n + 1
+    if cur:
+        chunks.append(("\n\n".join(cur), cur_tokens))
+    return chunks
+
+
+def split_by_tokens(text: str, max_tokens: int) -> List[str]:
+    """
+    Split `text` into chunks of at most `max_tokens`, cutting on page, then
+    paragraph, then heading, then line boundaries; adjacent pieces are packed
+    back together while they fit.
+    """
+    return [chunk for chunk, _ in split_counted(text, max_tokens)]
@@ -0,0 +1,234 @@
+import io
+import mmap
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional, Set, Tuple, Union
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+from backend.app.core.config import settings
+from backend.app.utils import metrics
+
+Buffer = Union[bytes, memoryview, mmap.mmap]
+
+API_PREFIX = "/api/v1"
+
+_open_paths: Set[str] = set()  # from spooled_path, until close_path
+
+# Upload routes (under API_PREFIX) -> UPLOAD_MAX_MB key.
+UPLOAD_ROUTES = {
+    "/images/analyze": "image",
+    "/images/analyze_study": "study",
+    "/jobs/images/analyze": "image",
+    "/records/extract_pdf": "pdf",
+    "/records/extract_pdf/stream": "pdf",
+    "/pipeline/case": "case",
+}
+
+MULTIPART_SLACK = 64 * 1024  # boundaries and part headers around the file itself
+
+MAGIC = (
+    (b"%PDF-", "pdf"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"PK\x03\x04", "zip"),
+)
+SNIFF_BYTES = 1024
+
+
+def max_bytes(kind: str) -> Optional[int]:
+    mb = settings.upload_max_mb.get(kind)
+    return int(mb * 2**20) if mb else None
+
+
+def sniff(head: bytes, filename: Optional[str] = None) -> Optional[str]:
+    """File type from its first bytes: pdf, png, jpeg, zip or dicom; None if unknown."""
+    for magic, kind in MAGIC:
+        if head.startswith(magic):
+            return kind
+    if head[128:132] == b"DICM":
+        return "dicom"
+    if b"%PDF-" in head:
+        return "pdf"  # readers tolerate junk before the header
+    if filename and filename.lower().endswith(".dcm"):
+        return "dicom"  # DICOM without the preamble has no magic
+    return None
+
+
+async def check_upload(upload: UploadFile, limit: str, kinds: Tuple[str, ...]) -> str:
+    """
+    Size (against UPLOAD_MAX_MB[limit]) and sniffed type (one of `kinds`)
+    of a received upload; -> the type. 413, 400 otherwise. The declared
+    content type is not trusted.
+    """
+    size = getattr(upload, "size", None)
+    if size is None:
+        upload.file.seek(0, io.SEEK_END)
+        size = upload.file.tell()
+    cap = max_bytes(limit)
+    if cap is not None and size > cap:
+        metrics.inc(f"uploads.too_large.{limit}")
+        raise HTTPException(status_code=413, detail=f"Upload exceeds the {cap // 2**20} MB limit.")
+    if not size:
+        raise HTTPException(status_code=400, detail="Empty file uploaded.")
+    await upload.seek(0)
+    kind = sniff(await upload.read(SNIFF_BYTES), upload.filename)
+    await upload.seek(0)
+    if kind not in kinds:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type; expected {', '.join(kinds)}.")
+    return kind
+
+
+def map_file(f) -> Buffer:
+    """
+    Read-only view of an upload's spooled bytes. Small uploads still in the
+    in-memory spool come back as bytes (at most the spool size); larger ones,
+    already rolled to disk, are memory-mapped. A mapping stays valid after
+    the upload itself is closed.
+    """
+    raw = getattr(f, "_file", f)  # SpooledTemporaryFile: a BytesIO until it rolls over
+    if isinstance(raw, io.BytesIO):
+        return raw.getvalue()
+    if os.fstat(raw.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def spooled_path(f) -> Optional[str]:
+    """
+    Path other processes (the PDF pool workers) can open an upload by, when it
+    has already rolled to disk; None while it is still in memory. The spool
+    file has no name, so this is /proc/<pid>/fd/<n> of a duplicate descriptor,
+    valid after the upload is closed until `close_path`.
+    """
+    raw = getattr(f, "_file", f)
+    fds = f"/proc/{os.getpid()}/fd"
+    if isinstance(raw, io.BytesIO) or not os.path.isdir(fds):
+        return None
+    path = f"{fds}/{os.dup(raw.fileno())}"
+    _open_paths.add(path)
+    return path
+
+
+def close_path(path: Optional[str]) -> None:
+    """Close a `spooled_path` (idempotent)."""
+    try:
+        _open_paths.remove(path)
+    except KeyError:
+        return
+    os.close(int(path.rsplit("/", 1)[1]))
+
+
+def release(buf: Buffer) -> None:
+    if isinstance(buf, mmap.mmap):
+        try:
+            buf.close()
+        except BufferError:
+            pass  # an array still views it; unmapped with the last reference
+
+
+@contextmanager
+def mapped(f) -> Iterator[Buffer]:
+    buf = map_file(f)
+    try:
+        yield buf
+    finally:
+        release(buf)
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable read-only file over a buffer (bytes, memoryview, mmap), without copying it."""
+
+    def __init__(self, buf: Buffer):
+        self._view = memoryview(buf).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+def as_stream(data: Buffer) -> io.RawIOBase:
+    """File object for the decoders (PIL, pydicom); bytes are shared, not copied, either way."""
+    return io.BytesIO(data) if isinstance(data, bytes) else BufferReader(data)
+
+
+def _too_large(limit: int) -> JSONResponse:
+    return JSONResponse(status_code=413, content={"detail": f"Upload exceeds the {limit // 2**20} MB limit."},
+                        headers={"Connection": "close"})
+
+
+class UploadLimit:
+    """
+    ASGI middleware applying UPLOAD_MAX_MB to the upload routes while the
+    body streams in. A declared Content-Length over the limit is refused
+    before anything is read; a chunked body is cut off with 413 as soon as
+    it crosses the limit, so the multipart parser never spools more.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        kind = UPLOAD_ROUTES.get(scope.get("path", "").removeprefix(API_PREFIX)) if scope["type"] == "http" else None
+        cap = max_bytes(kind) if kind else None
+        if cap is None:
+            await self.app(scope, receive, send)
+            return
+        limit = cap + MULTIPART_SLACK
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > limit:
+            metrics.inc(f"uploads.too_large.{kind}")
+            await _too_large(cap)(scope, receive, send)
+            return
+
+        seen = 0
+        rejected = started = False
+
+        async def limited_receive():
+            nonlocal seen, rejected
+            message = await receive()
+            if message["type"] == "http.request":
+                seen += len(message.get("body", b""))
+                if seen > limit:
+                    rejected = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if rejected:
+                return  # the 413 below replaces whatever the app makes of the cut-off body
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
+        if rejected and not started:
+            metrics.inc(f"uploads.too_large.{kind}")
+            await _too_large(cap)(scope, receive, send)
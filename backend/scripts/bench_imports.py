@@ -0,0 +1,58 @@
+"""
+Import-time benchmark: startup cost of each router and app profile.
+
+    python -m backend.scripts.bench_imports [--repeat 3]
+
+Each target is imported in a fresh interpreter; we report wall time and
+peak RSS of that process. Run it in CI or before/after touching imports
+to keep light profiles (auth, api) light.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from backend.app.main import PROFILES, ROUTERS
+
+_PROBE = r"""
+import json, resource, sys, time
+t = time.perf_counter()
+exec(sys.argv[1])
+dt = time.perf_counter() - t
+heavy = [m for m in ("torch", "torchxrayvision", "skimage", "pydicom", "fitz", "openai") if m in sys.modules]
+print(json.dumps({"s": dt, "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "heavy": heavy}))
+"""
+
+
+def _measure(stmt: str, repeat: int, env: dict | None = None) -> dict:
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", _PROBE, stmt], capture_output=True, text=True,
+                             check=True, env={**os.environ, **(env or {})})
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {
+        "ms": statistics.median(r["s"] for r in runs) * 1000.0,
+        "rss_mb": max(r["rss_kb"] for r in runs) / 1024.0,
+        "heavy": runs[-1]["heavy"],
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    # (label, statement, env): a profile is measured the way a pod boots it.
+    targets = [(f"router:{name}", f"import {module}", {}) for name, module in ROUTERS.items()]
+    targets += [(f"profile:{name}", "import backend.app.main", {"APP_PROFILE": name}) for name in PROFILES]
+    print(f"{'target':18s} {'import ms':>10s} {'peak RSS MiB':>13s}  heavy modules loaded")
+    for label, stmt, env in targets:
+        r = _measure(stmt, args.repeat, env)
+        print(f"{label:18s} {r['ms']:10.0f} {r['rss_mb']:13.0f}  {', '.join(r['heavy']) or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
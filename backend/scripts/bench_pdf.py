@@ -0,0 +1,96 @@
+"""
+Benchmark: legacy serial vs pooled PDF text extraction.
+
+    python -m backend.scripts.bench_pdf [--pages 400] [--repeat 3] [--max-chars 200000]
+
+Generates a synthetic multi-page clinical PDF with PyMuPDF, then times the
+legacy whole-document path, the pooled extractor without a cap, and the
+pooled extractor with the character cap (which stops early). The parity
+check compares the uncapped pooled text with the legacy text. The PDF text
+cache is off for those rows so every run extracts; the "first upload" rows
+turn it on with an empty memory-only cache per run, which adds the page
+digests to the extraction. Nothing is written to the shared cache file.
+"""
+import argparse
+import io
+import sys
+import time
+
+from backend.app.core.config import settings
+from backend.app.utils import pdf_extractor
+
+
+# --- legacy path, kept verbatim as the reference -------------------------
+def legacy_extract(pdf_bytes: bytes) -> str:
+    import fitz  # PyMuPDF
+    text_parts = []
+    with fitz.open(stream=io.BytesIO(pdf_bytes), filetype="pdf") as doc:
+        for page in doc:
+            text_parts.append(page.get_text("text"))
+    return "\n".join(text_parts).strip()
+
+
+# --- synthetic input -----------------------------------------------------
+def _synthetic_pdf(pages: int) -> bytes:
+    import fitz
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        lines = [f"Progress note, day {n + 1}"] + [
+            f"{i:02d}. BP 12{i % 10}/8{i % 7} mmHg, HR {60 + i} bpm, SpO2 9{i % 9}%. Plan unchanged, review labs."
+            for i in range(45)
+        ]
+        page.insert_text((40, 40), "\n".join(lines), fontsize=8)
+    out = doc.tobytes()
+    doc.close()
+    return out
+
+
+def _time(fn, repeat):
+    fn()  # warm-up (also starts the pool's processes)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return out, (time.perf_counter() - t0) / repeat * 1000.0
+
+
+def _first_upload(data: bytes, max_chars=None) -> str:
+    """Cache on, but empty: the path a document takes the first time it is uploaded."""
+    settings.pdf_cache_enabled = True
+    pdf_extractor._cache = None
+    try:
+        return pdf_extractor.extract_pdf_text(data, max_chars)
+    finally:
+        settings.pdf_cache_enabled = False
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pages", type=int, default=400)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--max-chars", type=int, default=200_000)
+    args = ap.parse_args(argv)
+    settings.pdf_cache_enabled = False  # repeats would otherwise time cache hits
+    settings.pdf_cache_path = None      # first-upload rows: memory only
+
+    data = _synthetic_pdf(args.pages)
+    print(f"{args.pages} pages, {len(data) / 2**20:.1f} MiB")
+    ref, t_ref = _time(lambda: legacy_extract(data), args.repeat)
+    full, t_full = _time(lambda: pdf_extractor.extract_pdf_text(data), args.repeat)
+    capped, t_cap = _time(lambda: pdf_extractor.extract_pdf_text(data, args.max_chars), args.repeat)
+    first, t_first = _time(lambda: _first_upload(data), args.repeat)
+    first_cap, t_first_cap = _time(lambda: _first_upload(data, args.max_chars), args.repeat)
+
+    print(f"{'path':24s} {'ms':>9s} {'speedup':>8s} {'chars':>10s}")
+    print(f"{'legacy serial':24s} {t_ref:9.1f} {'1.0x':>8s} {len(ref):10d}")
+    print(f"{'pooled':24s} {t_full:9.1f} {t_ref / t_full:7.1f}x {len(full):10d}")
+    print(f"{'pooled + cap':24s} {t_cap:9.1f} {t_ref / t_cap:7.1f}x {len(capped):10d}")
+    print(f"{'first upload, cache on':24s} {t_first:9.1f} {t_ref / t_first:7.1f}x {len(first):10d}")
+    print(f"{'first upload + cap':24s} {t_first_cap:9.1f} {t_ref / t_first_cap:7.1f}x {len(first_cap):10d}")
+    ok = full == ref == first and capped == first_cap == ref[:args.max_chars]
+    print("text parity", "PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Micro-benchmark: legacy vs current image preprocessing.
+
+    python -m backend.scripts.bench_preprocess [--size 3000] [--repeat 5] [--model]
+
+Builds synthetic large inputs (8-bit JPEG, 8-bit PNG, 16-bit DICOM), times
+both pipelines and reports peak traced allocations. The numerical check
+compares the z-normed 224x224 inputs, and with --model also the DenseNet
+probabilities, against the legacy path.
+"""
+import argparse
+import io
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+from skimage.transform import resize
+
+from backend.app.services import image_analyzer
+
+
+# --- legacy path, kept verbatim as the reference -------------------------
+def _legacy_load_as_float32_grayscale(img: Image.Image) -> np.ndarray:
+    img = img.convert("L")
+    arr = np.asarray(img).astype(np.float32)
+    if arr.max() > 1.0:
+        arr /= 255.0
+    return resize(arr, (224, 224), preserve_range=True, anti_aliasing=True).astype(np.float32)
+
+
+def _legacy_dicom_to_pil(dcm_bytes: bytes) -> Image.Image:
+    import pydicom
+    ds = pydicom.dcmread(io.BytesIO(dcm_bytes))
+    arr = ds.pixel_array.astype(np.float32)
+    if hasattr(ds, "RescaleSlope") and hasattr(ds, "RescaleIntercept"):
+        arr = arr * float(ds.RescaleSlope) + float(ds.RescaleIntercept)
+    arr = arr - arr.min()
+    if arr.max() > 0:
+        arr = arr / arr.max()
+    arr = (arr * 255.0).clip(0, 255).astype(np.uint8)
+    return Image.fromarray(arr)
+
+
+def legacy_preprocess(data: bytes, filename: str) -> np.ndarray:
+    if filename.endswith(".dcm"):
+        pil = _legacy_dicom_to_pil(data)
+    else:
+        pil = Image.open(io.BytesIO(data))
+    arr = _legacy_load_as_float32_grayscale(pil)
+    return (arr - arr.mean()) / (arr.std(ddof=1) + 1e-8)
+
+
+def current_preprocess(data: bytes, filename: str) -> np.ndarray:
+    return image_analyzer.preprocess_image_bytes(data, filename)[0]
+
+
+# --- synthetic inputs ----------------------------------------------------
+def _phantom(size: int) -> np.ndarray:
+    """Smooth chest-like blob plus noise, in 0..1."""
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    body = np.exp(-(((xx - 0.5) / 0.35) ** 2 + ((yy - 0.55) / 0.45) ** 2))
+    lungs = np.exp(-(((np.abs(xx - 0.5) - 0.18) / 0.1) ** 2 + ((yy - 0.5) / 0.25) ** 2))
+    rng = np.random.default_rng(0)
+    img = body - 0.6 * lungs + 0.05 * rng.standard_normal((size, size)).astype(np.float32)
+    img -= img.min()
+    return img / img.max()
+
+
+def _encode(img: np.ndarray, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray((img * 255).astype(np.uint8)).save(buf, format=fmt, quality=92)
+    return buf.getvalue()
+
+
+def _dicom16(img: np.ndarray) -> bytes:
+    import pydicom
+    from pydicom.dataset import FileDataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.1.1"  # DX
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = FileDataset(None, {}, file_meta=meta, preamble=b"\0" * 128)
+    ds.Modality = "DX"
+    ds.Rows, ds.Columns = img.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit = 16, 12, 11
+    ds.PixelRepresentation = 0
+    ds.RescaleSlope, ds.RescaleIntercept = 1, 0
+    ds.PixelData = (img * 4095).astype(np.uint16).tobytes()
+    buf = io.BytesIO()
+    pydicom.dcmwrite(buf, ds, enforce_file_format=True)
+    return buf.getvalue()
+
+
+def _time(fn, data, filename, repeat):
+    fn(data, filename)  # warm-up
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        out = fn(data, filename)
+    elapsed = (time.perf_counter() - t0) / repeat
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed * 1000.0, peak / 2**20
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", type=int, default=3000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--model", action="store_true", help="also compare DenseNet probabilities")
+    ap.add_argument("--tolerance", type=float, default=0.02, help="max |dp| allowed with --model")
+    args = ap.parse_args(argv)
+
+    img = _phantom(args.size)
+    cases = {
+        "x.jpg": _encode(img, "JPEG"),
+        "x.png": _encode(img, "PNG"),
+        "x.dcm": _dicom16(img),
+    }
+    ok = True
+    print(f"{'input':8s} {'legacy ms':>10s} {'new ms':>8s} {'speedup':>8s} {'legacy MiB':>11s} {'new MiB':>8s} {'max|dz|':>8s}")
+    for filename, data in cases.items():
+        ref, t_ref, m_ref = _time(legacy_preprocess, data, filename, args.repeat)
+        new, t_new, m_new = _time(current_preprocess, data, filename, args.repeat)
+        dz = float(np.abs(ref - new).max())
+        print(f"{filename:8s} {t_ref:10.1f} {t_new:8.1f} {t_ref / t_new:7.1f}x {m_ref:11.1f} {m_new:8.1f} {dz:8.3f}")
+        if args.model:
+            forward = image_analyzer._forward_batch
+            dp = float(np.abs(forward(ref[None]) - forward(new[None])).max())
+            passed = dp <= args.tolerance
+            ok &= passed
+            print(f"{'':8s} model max|dp|={dp:.4f} {'PASS' if passed else 'FAIL'} (tol {args.tolerance})")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
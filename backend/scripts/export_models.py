@@ -0,0 +1,83 @@
+"""
+Export the DenseNet to TorchScript / INT8 / ONNX and check parity.
+
+    python -m backend.scripts.export_models                 # export + parity
+    python -m backend.scripts.export_models --parity-only   # re-check existing artifacts
+    python -m backend.scripts.export_models --images a.png b.dcm --tolerance 0.01
+    python -m backend.scripts.export_models --parity-only --skip onnx   # node without onnxruntime
+
+Parity runs every engine on the same inputs (synthetic noise plus any
+`--images`) and fails (exit 1) if any of the 18 pathology probabilities
+drifts from eager by more than the tolerance, or if an engine cannot be
+loaded at all. Engines named in `--skip` are not checked.
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from backend.app.core.config import settings
+from backend.app.services import image_analyzer
+from backend.app.services.inference_backends import BACKENDS, build_backend, export_artifacts
+
+# INT8 is lossy by design, so it gets its own (looser) bound.
+DEFAULT_TOLERANCE = {"torchscript": 1e-4, "onnx": 1e-3, "int8": 2e-2}
+
+
+def _inputs(paths, n_synthetic: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    rows = [rng.standard_normal((224, 224)).astype(np.float32) for _ in range(n_synthetic)]
+    for p in paths:
+        with open(p, "rb") as f:
+            arr, _ = image_analyzer.preprocess_image_bytes(f.read(), filename=p)
+        rows.append(arr)
+    return np.stack(rows)
+
+
+def parity(batch: np.ndarray, artifact_dir: str, tolerance: float | None, skip=()) -> bool:
+    eager = build_backend("eager", image_analyzer._load_eager, artifact_dir)
+    reference = eager(batch)
+    ok = True
+    for name in BACKENDS:
+        if name == "eager":
+            continue
+        if name in skip:
+            print(f"{name:12s} SKIP  (--skip)")
+            continue
+        try:
+            probs = build_backend(name, image_analyzer._load_eager, artifact_dir)(batch)
+        except Exception as e:
+            print(f"{name:12s} FAIL  (could not load: {e})")
+            ok = False
+            continue
+        tol = tolerance if tolerance is not None else DEFAULT_TOLERANCE[name]
+        diff = np.abs(probs - reference)
+        worst = int(diff.max(axis=0).argmax())
+        passed = bool(diff.max() <= tol)
+        ok &= passed
+        print(f"{name:12s} {'PASS' if passed else 'FAIL'}  max|dp|={diff.max():.2e} "
+              f"(tol {tol:.0e}, worst: {eager.labels[worst]})")
+    return ok
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--out", default=settings.inference_artifact_dir)
+    ap.add_argument("--parity-only", action="store_true")
+    ap.add_argument("--images", nargs="*", default=[])
+    ap.add_argument("--synthetic", type=int, default=8)
+    ap.add_argument("--tolerance", type=float, default=None)
+    ap.add_argument("--skip", nargs="*", default=[], choices=[b for b in BACKENDS if b != "eager"],
+                    help="engines to leave out of the parity check")
+    args = ap.parse_args(argv)
+
+    model, labels = image_analyzer._load_eager()
+    if not args.parity_only:
+        for name, path in export_artifacts(model, labels, args.out).items():
+            print(f"exported {name:12s} -> {path}")
+
+    return 0 if parity(_inputs(args.images, args.synthetic), args.out, args.tolerance, args.skip) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
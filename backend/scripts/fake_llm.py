@@ -0,0 +1,188 @@
+"""
+Fake OpenAI-compatible chat provider, and a load driver for the LLM client.
+
+    python -m backend.scripts.fake_llm serve --port 9100 --error-rate 0.2 --slow-rate 0.05
+
+    LLM_PROVIDER=nim NIM_API_KEY=x NIM_API_BASE=http://127.0.0.1:9100 LLM_CACHE_ENABLED=false \\
+        python -m backend.scripts.fake_llm bench --requests 200 --concurrency 20
+
+`serve` answers POST /v1/chat/completions (plain and `stream: true`) with a
+configurable latency, slow tail and error rate; it needs only the standard
+library. The same endpoint serves both providers: point NIM_API_BASE at it,
+or OPENAI_BASE_URL at <server>/v1. Two servers, one with --error-rate 1,
+exercise failover and the circuit breaker. `bench` fires concurrent
+`achat_complete` calls through the configured settings and prints latency
+percentiles, errors and the resilience counters.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _handler(args: argparse.Namespace):
+    lock = threading.Lock()
+    counts = {"requests": 0, "errors": 0, "slow": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *a):  # keep the console for the summary line
+            pass
+
+        def _json(self, status: int, body: dict, headers: dict | None = None) -> None:
+            raw = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._json(404, {"error": {"message": "not found"}})
+                return
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            with lock:
+                counts["requests"] += 1
+
+            if random.random() < args.error_rate:
+                with lock:
+                    counts["errors"] += 1
+                time.sleep(args.error_ms / 1000.0)
+                headers = {"Retry-After": "1"} if args.error_status == 429 else None
+                self._json(args.error_status, {"error": {"message": "injected failure"}}, headers)
+                return
+
+            delay = max(0.0, random.gauss(args.latency_ms, args.jitter_ms)) / 1000.0
+            if random.random() < args.slow_rate:
+                with lock:
+                    counts["slow"] += 1
+                delay += args.slow_ms / 1000.0
+            time.sleep(delay)
+
+            user = next((m["content"] for m in reversed(req.get("messages", [])) if m.get("role") == "user"), "")
+            text = f"[fake {args.name}] {user[:80]}"
+            usage = {"prompt_tokens": len(user) // 4, "completion_tokens": len(text) // 4,
+                     "total_tokens": (len(user) + len(text)) // 4}
+            if not req.get("stream"):
+                self._json(200, {
+                    "id": "fake", "object": "chat.completion", "model": req.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                 "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def chunk(payload: str) -> None:
+                data = f"data: {payload}\n\n".encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            try:
+                for word in text.split(" "):
+                    chunk(json.dumps({
+                        "id": "fake", "object": "chat.completion.chunk", "model": req.get("model"),
+                        "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+                    }))
+                    time.sleep(args.chunk_ms / 1000.0)
+                chunk("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client went away (hedge loser, cancelled stream)
+
+    return Handler, counts
+
+
+def serve(args: argparse.Namespace) -> int:
+    handler, counts = _handler(args)
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"fake provider {args.name!r} on http://{args.host}:{args.port}  "
+          f"(latency {args.latency_ms}±{args.jitter_ms} ms, slow {args.slow_rate:.0%} +{args.slow_ms} ms, "
+          f"errors {args.error_rate:.0%} -> {args.error_status})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"served {counts['requests']} requests, {counts['errors']} errors, {counts['slow']} slow")
+    return 0
+
+
+def bench(args: argparse.Namespace) -> int:
+    import asyncio
+
+    from backend.app.services import llm_client, llm_resilience
+    from backend.app.utils import metrics
+
+    async def run():
+        sem = asyncio.Semaphore(args.concurrency)
+        latencies, errors = [], []
+
+        async def one(i: int):
+            async with sem:
+                started = time.perf_counter()
+                try:
+                    await llm_client.achat_complete("You are a test.", f"request {i} {random.random()}")
+                    latencies.append((time.perf_counter() - started) * 1000.0)
+                except Exception as e:
+                    errors.append(type(e).__name__)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        wall = time.perf_counter() - started
+        await llm_client.aclose()
+        return latencies, errors, wall
+
+    latencies, errors, wall = asyncio.run(run())
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p / 100.0 * len(latencies)))] if latencies else float("nan")
+
+    print(f"{args.requests} requests in {wall:.1f}s, {len(errors)} failed "
+          f"({', '.join(sorted(set(errors))) or '-'})")
+    print(f"latency ms  p50 {pct(50):.0f}  p95 {pct(95):.0f}  p99 {pct(99):.0f}  max {pct(100):.0f}")
+    counters = metrics.snapshot()["counters"]
+    print(json.dumps({k: v for k, v in counters.items() if k.startswith("llm.")}, indent=2, sort_keys=True))
+    print(json.dumps(llm_resilience.status(), indent=2))
+    return 0 if not errors else 1
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("serve", help="run the fake provider")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=9100)
+    s.add_argument("--name", default="provider")
+    s.add_argument("--latency-ms", type=float, default=200.0)
+    s.add_argument("--jitter-ms", type=float, default=50.0)
+    s.add_argument("--slow-rate", type=float, default=0.0, help="fraction of calls given the slow tail")
+    s.add_argument("--slow-ms", type=float, default=5000.0)
+    s.add_argument("--error-rate", type=float, default=0.0)
+    s.add_argument("--error-status", type=int, default=503)
+    s.add_argument("--error-ms", type=float, default=20.0)
+    s.add_argument("--chunk-ms", type=float, default=10.0, help="delay between streamed chunks")
+
+    b = sub.add_parser("bench", help="drive achat_complete with the current settings")
+    b.add_argument("--requests", type=int, default=200)
+    b.add_argument("--concurrency", type=int, default=20)
+
+    args = ap.parse_args(argv)
+    return serve(args) if args.cmd == "serve" else bench(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
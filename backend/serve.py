@@ -0,0 +1,189 @@
+"""
+Preload-and-fork launcher.
+
+    python -m backend.serve --workers 4 --port 8001
+
+The parent process imports the app, loads and warms the DenseNet once,
+freezes it into shared memory and only then forks the uvicorn workers, so
+the weights are mapped once per node instead of once per worker. Every
+worker warms its own intra-op thread pool before taking traffic. Once all
+workers are up (and on SIGUSR1) the parent logs per-worker RSS / PSS /
+shared memory from /proc, which is the number to size nodes by.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List
+
+logger = logging.getLogger("serve")
+
+# A worker that dies this soon after starting is crash-looping (bad config,
+# port or GPU trouble); it is restarted after an exponential backoff instead
+# of being re-forked (and re-warmed) as fast as it can fail.
+CRASH_WINDOW_S = 10.0
+
+
+def restart_delay(crashes: int) -> float:
+    """Seconds to wait before the next restart after `crashes` quick exits in a row."""
+    return 0.0 if crashes <= 0 else min(30.0, 0.5 * 2 ** (crashes - 1))
+
+
+def _smaps_rollup(pid: int) -> Dict[str, int]:
+    """kB figures from /proc/<pid>/smaps_rollup (Linux)."""
+    out: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[2] == "kB":
+                    out[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        pass
+    return out
+
+
+def memory_report(pids: List[int]) -> str:
+    rows = [f"{'pid':>8s} {'RSS MiB':>9s} {'PSS MiB':>9s} {'shared MiB':>11s} {'private MiB':>12s}"]
+    for pid in pids:
+        m = _smaps_rollup(pid)
+        shared = m.get("Shared_Clean", 0) + m.get("Shared_Dirty", 0)
+        private = m.get("Private_Clean", 0) + m.get("Private_Dirty", 0)
+        rows.append(
+            f"{pid:8d} {m.get('Rss', 0) / 1024:9.1f} {m.get('Pss', 0) / 1024:9.1f} "
+            f"{shared / 1024:11.1f} {private / 1024:12.1f}"
+        )
+    return "\n".join(rows)
+
+
+def _preload(workers: int) -> None:
+    import torch
+    from backend.app.core.config import settings
+    from backend.app.services import image_analyzer
+
+    if settings.inference_backend == "onnx":
+        # onnxruntime sessions own thread pools that do not survive fork();
+        # each worker builds its own session in _child.
+        logger.info("onnx backend: model is loaded per worker, not shared")
+        return
+
+    # Warm single-threaded: OpenMP pools started before fork() are not
+    # fork-safe, so the parent must not spin one up.
+    torch.set_num_threads(1)
+    started = time.perf_counter()
+    image_analyzer.warmup()
+    image_analyzer.freeze_for_fork()
+    logger.info("model %s (%s) preloaded in %.1fs", image_analyzer.MODEL_WEIGHTS,
+                settings.inference_backend, time.perf_counter() - started)
+
+
+def _child(sock: socket.socket, app_path: str, workers: int, ready_w: int, imaging: bool) -> None:
+    import uvicorn
+
+    if imaging:
+        import torch
+        from backend.app.core.config import settings
+        from backend.app.services import image_analyzer
+
+        threads = settings.inference_threads or max(1, (os.cpu_count() or 1) // workers)
+        torch.set_num_threads(threads)
+        image_analyzer.warmup()
+    os.write(ready_w, b"1")
+    os.close(ready_w)
+
+    config = uvicorn.Config(app_path, log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+    os._exit(0)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--app", default="backend.app.main:app")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8001)
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    import importlib
+    module, _, attr = args.app.partition(":")
+    getattr(importlib.import_module(module), attr)  # import the app (and its routers) pre-fork
+    imaging = "backend.app.api.v1.images" in sys.modules
+    if imaging:
+        _preload(args.workers)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Objects that exist now live for the whole process; keep the collector
+    # from touching (and so copying) their pages in every child.
+    gc.collect()
+    gc.freeze()
+
+    children: Dict[int, int] = {}
+    started: Dict[int, float] = {}   # slot -> fork time
+    crashes: Dict[int, int] = {}     # slot -> quick exits in a row
+    stopping = False
+
+    def spawn(slot: int) -> None:
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            _child(sock, args.app, args.workers, ready_w, imaging)
+        os.close(ready_w)
+        os.read(ready_r, 1)  # wait for the child's warm-up
+        os.close(ready_r)
+        children[pid] = slot
+        started[slot] = time.monotonic()
+
+    def stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, lambda *_: logger.info("worker memory\n%s", memory_report(list(children))))
+
+    for slot in range(args.workers):
+        spawn(slot)
+    logger.info("%d workers listening on %s:%d\n%s", args.workers, args.host, args.port,
+                memory_report([os.getpid()] + list(children)))
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            quick = time.monotonic() - started[slot] < CRASH_WINDOW_S
+            crashes[slot] = crashes.get(slot, 0) + 1 if quick else 0
+            delay = restart_delay(crashes[slot])
+            logger.warning("worker %d exited (status %d), restarting in %.1fs", pid, status, delay)
+            deadline = time.monotonic() + delay
+            while not stopping and time.monotonic() < deadline:
+                time.sleep(0.1)
+            if not stopping:
+                spawn(slot)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from backend.app.services.batcher import MicroBatcher
+
+
+def _doubling(sizes):
+    def fn(batch):
+        sizes.append(len(batch))
+        return batch * 2
+    return fn
+
+
+def test_concurrent_callers_share_a_forward_pass_and_get_their_own_row():
+    sizes = []
+    batcher = MicroBatcher(_doubling(sizes), max_batch_size=4, max_wait_ms=200)
+    with ThreadPoolExecutor(4) as ex:
+        outs = list(ex.map(lambda i: batcher(np.full(3, i, dtype=np.float32)), range(4)))
+    assert [o.tolist() for o in outs] == [[2.0 * i] * 3 for i in range(4)]
+    assert sum(sizes) == 4 and max(sizes) > 1
+
+
+def test_batches_never_exceed_the_max_size():
+    sizes = []
+    batcher = MicroBatcher(_doubling(sizes), max_batch_size=3, max_wait_ms=50)
+    futs = [batcher.submit(np.zeros(2)) for _ in range(7)]
+    for f in futs:
+        f.result(5)
+    assert max(sizes) <= 3 and sum(sizes) == 7
+
+
+def test_errors_reach_every_caller_in_the_batch():
+    def boom(batch):
+        raise ValueError("model exploded")
+    batcher = MicroBatcher(boom, max_batch_size=4, max_wait_ms=50)
+    futs = [batcher.submit(np.zeros(2)) for _ in range(3)]
+    for f in futs:
+        with pytest.raises(ValueError):
+            f.result(5)
+
+
+def test_cancelled_callers_do_not_kill_the_batcher():
+    gate, seen = threading.Event(), []
+
+    def slow(batch):
+        gate.wait(5)
+        seen.append(len(batch))
+        return batch
+
+    batcher = MicroBatcher(slow, max_batch_size=1, max_wait_ms=0)
+    first = batcher.submit(np.zeros(1))       # occupies the thread
+    doomed = batcher.submit(np.ones(1))
+    assert doomed.cancel()
+    gate.set()
+    first.result(5)
+    assert batcher(np.full(1, 7.0)).tolist() == [7.0]
+    assert seen == [1, 1]                     # the cancelled item never ran
+    assert batcher._thread.is_alive()
+
+
+def test_wrong_row_count_is_an_error_not_a_hang():
+    batcher = MicroBatcher(lambda batch: batch[:0], max_batch_size=2, max_wait_ms=100)
+    futs = [batcher.submit(np.zeros(1)) for _ in range(2)]
+    for f in futs:
+        with pytest.raises(RuntimeError):
+            f.result(5)
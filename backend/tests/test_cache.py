@@ -0,0 +1,78 @@
+import threading
+import time
+
+from backend.app.utils.cache import LRUCache, SqliteStore, TieredCache
+
+
+def test_lru_evicts_least_recently_used():
+    c = LRUCache(max_items=2, ttl_s=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1       # "a" is now the most recent
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert (c.get("a"), c.get("c")) == (1, 3)
+
+
+def test_lru_entries_expire():
+    c = LRUCache(max_items=2, ttl_s=0.01)
+    c.set("a", 1)
+    time.sleep(0.02)
+    assert c.get("a") is None
+
+
+def test_lru_values_are_copies():
+    c = LRUCache(max_items=2, ttl_s=60)
+    value = {"findings": ["Effusion"]}
+    c.set("a", value)
+    value["findings"].append("set after caching")
+    c.get("a")["findings"].append("mutated by a caller")
+    assert c.get("a") == {"findings": ["Effusion"]}
+    shared = LRUCache(max_items=2, ttl_s=60, copy=False)
+    shared.set("a", value)
+    assert shared.get("a") is value
+
+
+def test_sqlite_store_round_trips_and_evicts_by_size(tmp_path):
+    s = SqliteStore(str(tmp_path / "kv.sqlite"), max_bytes=70, ttl_s=60)  # room for two 31-byte rows
+    s.set("a", {"text": "x" * 20})
+    time.sleep(0.01)
+    s.set("b", {"text": "y" * 20})
+    time.sleep(0.01)
+    assert s.get("a") == {"text": "x" * 20}   # touch "a": "b" is now least recently used
+    time.sleep(0.01)
+    s.set("c", {"text": "z" * 20})
+    assert s.get("b") is None
+    assert s.get("a") is not None and s.get("c") is not None
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "kv.sqlite")
+    SqliteStore(path).set("k", [1, 2])
+    assert SqliteStore(path).get("k") == [1, 2]
+
+
+def test_tiered_cache_promotes_disk_hits(tmp_path):
+    path = str(tmp_path / "kv.sqlite")
+    TieredCache("t", max_items=8, ttl_s=60, disk_path=path).set("k", {"v": 1})
+    other_worker = TieredCache("t", max_items=8, ttl_s=60, disk_path=path)
+    assert other_worker.get("k") == ({"v": 1}, "disk")
+    assert other_worker.get("k") == ({"v": 1}, "memory")
+    assert other_worker.get("missing") == (None, "miss")
+
+
+def test_sqlite_store_update_is_atomic(tmp_path):
+    path = str(tmp_path / "kv.sqlite")
+    SqliteStore(path).set("n", {"count": 0})
+
+    def bump(times=25):
+        store = SqliteStore(path)  # one connection per thread, like separate workers
+        for _ in range(times):
+            store.update("n", lambda v: {"count": v["count"] + 1})
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert SqliteStore(path).get("n") == {"count": 100}
+    assert SqliteStore(path).update("missing", lambda v: v) is None
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.services import case_context
+from backend.app.services.case_context import ContextNotFound, get_context, history_block, record_turn
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "context_db_path", str(tmp_path / "contexts.sqlite"))
+    monkeypatch.setattr(settings, "context_ttl_s", 0.3)
+    monkeypatch.setattr(case_context, "_store", None)
+
+
+def _create(owner="alice"):
+    return case_context.create_context(owner, "Day 1: admitted with cough.", ["Effusion: 0.71"])["context_id"]
+
+
+def test_contexts_are_visible_only_to_their_owner():
+    context_id = _create()
+    assert get_context(context_id, "alice")["imaging_findings"] == ["Effusion: 0.71"]
+    with pytest.raises(ContextNotFound):
+        get_context(context_id, "mallory")
+    with pytest.raises(ContextNotFound):
+        case_context.delete_context(context_id, "mallory")
+    case_context.delete_context(context_id, "alice")
+    with pytest.raises(ContextNotFound):
+        get_context(context_id, "alice")
+
+
+def test_recording_a_turn_restarts_the_ttl():
+    context_id = _create()
+    time.sleep(0.2)
+    record_turn(get_context(context_id, "alice"), "q1", "a1")
+    time.sleep(0.2)                              # past the original expiry
+    assert get_context(context_id, "alice")["history"] == [{"q": "q1", "a": "a1"}]
+    time.sleep(0.35)
+    with pytest.raises(ContextNotFound):
+        get_context(context_id, "alice")
+
+
+def test_stored_history_is_capped(monkeypatch):
+    monkeypatch.setattr(case_context, "MAX_STORED_TURNS", 3)
+    ctx = get_context(_create(), "alice")
+    for i in range(5):
+        record_turn(ctx, f"q{i}", f"a{i}")
+    assert [t["q"] for t in ctx["history"]] == ["q2", "q3", "q4"]
+
+
+def test_history_block_keeps_the_latest_turns_that_fit():
+    history = [{"q": f"question {i}", "a": "answer " * 10} for i in range(6)]
+    one = history_block(history[-1:], 10_000)
+    block = history_block(history, 2 * case_context.count_tokens(one))
+    assert block.startswith("(Earlier conversation: 4 older turn(s) omitted.)")
+    assert "question 4" in block and "question 5" in block and "question 3" not in block
+    assert block.index("question 4") < block.index("question 5")
+    assert history_block(history, 10_000).count("User:") == 6 and "omitted" not in history_block(history, 10_000)
+    assert history_block(history, 1) == ""
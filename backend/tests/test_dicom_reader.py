@@ -0,0 +1,111 @@
+import io
+
+import numpy as np
+import pytest
+
+pydicom = pytest.importorskip("pydicom")
+
+from backend.app.utils.common import UnsupportedDicom  # noqa: E402
+from backend.app.utils.dicom_reader import check_supported, decode_reduced  # noqa: E402
+
+
+def _dicom(pixels: np.ndarray, photometric: str, planar: int = 0, **attrs) -> bytes:
+    from pydicom.dataset import FileDataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.7"  # secondary capture
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = FileDataset(None, {}, file_meta=meta, preamble=b"\0" * 128)
+    ds.Modality = "DX"
+    ds.Rows, ds.Columns = pixels.shape[:2]
+    ds.SamplesPerPixel = 1 if pixels.ndim == 2 else pixels.shape[2]
+    ds.PhotometricInterpretation = photometric
+    if pixels.ndim == 3:
+        ds.PlanarConfiguration = planar
+        if planar:
+            pixels = np.moveaxis(pixels, -1, 0)
+    bits = 8 * pixels.dtype.itemsize
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit = bits, bits, bits - 1
+    ds.PixelRepresentation = 0
+    for name, value in attrs.items():
+        setattr(ds, name, value)
+    ds.PixelData = np.ascontiguousarray(pixels).tobytes()
+    buf = io.BytesIO()
+    pydicom.dcmwrite(buf, ds, enforce_file_format=True)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("planar", [0, 1])
+def test_rgb_is_reduced_to_luma(planar):
+    rgb = np.zeros((8, 8, 3), np.uint8)
+    rgb[:4, :, 0] = 200   # red top half
+    rgb[4:, :, 1] = 200   # green bottom half
+    arr, size, stats = decode_reduced(_dicom(rgb, "RGB", planar), min_side=8)
+    assert size == (8, 8) and stats["samples"] == 3 and stats["zero_copy"]
+    # luma 0.299 * 200 (red) < 0.587 * 200 (green): min-max maps them to 0 and 1
+    assert np.allclose(arr[:4], 0.0) and np.allclose(arr[4:], 1.0)
+
+
+def test_other_colour_models_are_refused():
+    with pytest.raises(UnsupportedDicom):
+        decode_reduced(_dicom(np.zeros((8, 8, 3), np.uint8), "PALETTE COLOR"), min_side=8)
+
+
+RAMP = np.arange(0, 1000, 10, dtype=np.uint16).reshape(10, 10)   # 0 .. 990
+
+
+def _gray(**attrs) -> np.ndarray:
+    arr, _, _ = decode_reduced(_dicom(RAMP, attrs.pop("photometric", "MONOCHROME2"), **attrs), min_side=10)
+    return arr
+
+
+def test_linear_window_clips_outside_the_window():
+    arr = _gray(WindowCenter=500, WindowWidth=200)
+    assert np.all(arr[RAMP <= 400] == 0.0) and np.all(arr[RAMP >= 600] == 1.0)
+    assert abs(float(arr[RAMP == 500][0]) - 0.5) < 0.01
+
+
+def test_rescale_applies_before_the_window():
+    arr = _gray(RescaleSlope=2, RescaleIntercept=-500, WindowCenter=500, WindowWidth=200)
+    assert abs(float(arr[RAMP == 500][0]) - 0.5) < 0.01        # 2 * 500 - 500 = 500
+
+
+def test_sigmoid_window_and_monochrome1_inversion():
+    arr = _gray(WindowCenter=500, WindowWidth=200, VOILUTFunction="SIGMOID")
+    assert abs(float(arr[RAMP == 500][0]) - 0.5) < 1e-6 and np.all(np.diff(arr.ravel()) >= 0)
+    inverted = _gray(WindowCenter=500, WindowWidth=200, photometric="MONOCHROME1")
+    assert np.allclose(inverted, 1.0 - _gray(WindowCenter=500, WindowWidth=200))
+
+
+def test_voi_lut_sequence_maps_through_the_table():
+    from pydicom.dataset import Dataset
+
+    item = Dataset()
+    item.LUTDescriptor = [21, 10, 16]         # 21 entries, the first for stored value 10
+    item.add_new("LUTData", "US", [v * v for v in range(21)])
+    arr = _gray(VOILUTSequence=[item])
+    assert arr[RAMP == 0][0] == 0.0                            # below the table: first entry
+    assert abs(float(arr[RAMP == 20][0]) - 100 / 400) < 1e-6   # entry 10 of a non-linear table
+    assert np.all(arr[RAMP >= 30] == 1.0)                      # above it: last entry
+
+
+def test_no_window_falls_back_to_min_max():
+    arr = _gray()
+    assert arr.min() == 0.0 and arr.max() == 1.0
+
+
+def test_unsupported_modality_is_refused():
+    with pytest.raises(UnsupportedDicom, match="modality"):
+        decode_reduced(_dicom(RAMP, "MONOCHROME2", Modality="MR"), min_side=10)
+
+
+def test_transfer_syntax_without_a_decoder_is_refused():
+    from pydicom.uid import MPEG2MPML
+
+    ds = pydicom.dcmread(io.BytesIO(_dicom(RAMP, "MONOCHROME2")))
+    check_supported(ds)
+    ds.file_meta.TransferSyntaxUID = MPEG2MPML
+    with pytest.raises(UnsupportedDicom, match="transfer syntax"):
+        check_supported(ds)
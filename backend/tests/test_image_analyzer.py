@@ -0,0 +1,10 @@
+from backend.app.core.config import settings
+from backend.app.services.image_analyzer import image_cache_key
+
+
+def test_cache_key_depends_on_the_inference_engine(monkeypatch):
+    monkeypatch.setattr(settings, "inference_backend", "eager")
+    eager = image_cache_key(b"same upload")
+    monkeypatch.setattr(settings, "inference_backend", "int8")
+    assert image_cache_key(b"same upload") != eager
+    assert image_cache_key(b"same upload") == image_cache_key(b"same upload")
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.services.inference_pool import InferencePool, InferenceQueueFull, pool_workers
+
+
+def test_pool_is_at_least_one_batch_wide(monkeypatch):
+    monkeypatch.setattr(settings, "inference_workers", 2)
+    monkeypatch.setattr(settings, "inference_max_batch_size", 8)
+    assert pool_workers() == 8
+    monkeypatch.setattr(settings, "inference_max_batch_size", 1)
+    assert pool_workers() == 2
+
+
+def test_admission_is_bounded():
+    pool = InferencePool(workers=1, max_queue=1)
+    gate = threading.Event()
+
+    async def main():
+        running = [asyncio.ensure_future(pool.run(gate.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(InferenceQueueFull):
+            await pool.run(gate.wait, 5)
+        gate.set()
+        await asyncio.gather(*running)
+
+    asyncio.run(main())
+    assert pool._admitted == 0
+
+
+def test_cancelled_call_keeps_its_slot_until_the_thread_ends():
+    pool = InferencePool(workers=1, max_queue=0)
+    started, gate = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        gate.wait(5)
+
+    async def main():
+        task = asyncio.ensure_future(pool.run(work))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert pool._admitted == 1  # the thread is still busy
+        with pytest.raises(InferenceQueueFull):
+            pool.admit()
+        gate.set()
+        for _ in range(100):
+            if pool._admitted == 0:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert pool._admitted == 0
+
+
+def test_blocking_call_waits_for_a_released_slot():
+    pool = InferencePool(workers=1, max_queue=0)
+    pool.admit()
+    out = []
+    waiter = threading.Thread(target=lambda: out.append(pool.call(lambda: "ok")))
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive() and not out
+    pool.release()
+    waiter.join(5)
+    assert out == ["ok"]
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.services import jobs
+
+_gate = threading.Event()
+
+
+def _wait_for_gate(payload, blob):
+    _gate.wait(5)
+    return {"echo": payload["n"]}
+
+
+def _unsupported(payload, blob):
+    raise jobs.JobError(415, "RGB DICOM")
+
+
+@pytest.fixture
+def queue(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "sched_enabled", False)
+    monkeypatch.setitem(jobs.HANDLERS, "test.gate", f"{__name__}:_wait_for_gate")
+    monkeypatch.setitem(jobs.HANDLERS, "test.unsupported", f"{__name__}:_unsupported")
+    _gate.clear()
+    q = jobs.JobQueue(str(tmp_path / "jobs.sqlite"), workers=1, lease_s=0.3)
+    yield q
+    _gate.set()
+
+
+def _wait(q, job_id, owner, status=jobs.DONE):
+    for _ in range(200):
+        job = q.get(job_id, owner)
+        if job and job["status"] == status:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} never reached {status}: {q.get(job_id, owner)}")
+
+
+def test_jobs_are_visible_to_their_owner_only(queue):
+    job_id = queue.submit("test.gate", {"n": 1}, owner="alice")["job_id"]
+    assert queue.get(job_id, "alice") is not None
+    assert queue.get(job_id, "bob") is None
+    assert queue.get(job_id) is None
+
+
+def test_identical_jobs_are_deduplicated_per_owner(queue):
+    a = queue.submit("test.gate", {"n": 1}, owner="alice")
+    assert queue.submit("test.gate", {"n": 1}, owner="alice")["job_id"] == a["job_id"]
+    b = queue.submit("test.gate", {"n": 1}, owner="bob")
+    assert b["job_id"] != a["job_id"] and not b["deduplicated"]
+
+
+def test_running_job_keeps_its_lease(queue):
+    job_id = queue.submit("test.gate", {"n": 7}, owner="alice")["job_id"]
+    _wait(queue, job_id, "alice", jobs.RUNNING)
+    time.sleep(1.0)  # > 3 lease periods: without renewal another claim would re-run it
+    assert queue._claim() is None
+    _gate.set()
+    assert _wait(queue, job_id, "alice")["result"] == {"echo": 7}
+    row = queue._conn().execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    assert row["attempts"] == 1
+
+
+def test_failures_keep_their_status_code(queue):
+    job_id = queue.submit("test.unsupported", {}, owner="alice")["job_id"]
+    job = _wait(queue, job_id, "alice", jobs.FAILED)
+    assert job["code"] == 415 and job["error"] == "RGB DICOM"
+
+
+def test_result_delivery_is_noted_once(queue):
+    job_id = queue.submit("test.gate", {"n": 2}, owner="alice")["job_id"]
+    assert not queue.mark_delivered(job_id)   # not done yet
+    _gate.set()
+    _wait(queue, job_id, "alice")
+    assert queue.mark_delivered(job_id)
+    assert not queue.mark_delivered(job_id)
+
+
+def test_workers_claim_only_the_kinds_they_serve(queue):
+    queue.start(["test.unsupported"])
+    gated = queue.submit("test.gate", {"n": 3}, owner="alice")["job_id"]
+    failed = queue.submit("test.unsupported", {}, owner="alice")["job_id"]
+    _wait(queue, failed, "alice", jobs.FAILED)
+    assert queue.get(gated, "alice")["status"] == jobs.QUEUED
+
+
+def test_unclaimed_jobs_fail_instead_of_waiting_forever(queue):
+    queue.start(["test.unsupported"])
+    assert not queue.serves("test.gate")
+    job_id = queue.submit("test.gate", {"n": 4}, owner="alice")["job_id"]
+    queue._cleanup(time.time() + queue.queued_ttl_s + 1)
+    job = queue.get(job_id, "alice")
+    assert job["status"] == jobs.FAILED and job["code"] == 503
+    assert queue.submit("test.gate", {"n": 4}, owner="alice")["job_id"] != job_id   # not deduplicated onto it
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.services import llm_cache
+
+
+@pytest.fixture(autouse=True)
+def memory_cache(monkeypatch):
+    monkeypatch.setattr(settings, "llm_cache_path", None)
+    monkeypatch.setattr(llm_cache, "_cache", None)
+    monkeypatch.setattr(llm_cache, "_inflight_async", {})
+    monkeypatch.setattr(llm_cache, "_inflight_sync", {})
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    calls = []
+
+    async def complete():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer", 10
+
+    async def main():
+        return await asyncio.gather(*(llm_cache.acached_call("k", complete) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["answer"] * 5
+    assert len(calls) == 1
+    assert asyncio.run(llm_cache.acached_call("k", complete)) == "answer"
+    assert len(calls) == 1
+
+
+def test_followers_take_over_when_the_leader_is_cancelled():
+    calls = []
+
+    async def complete():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer", 10
+
+    async def main():
+        leader = asyncio.ensure_future(llm_cache.acached_call("k", complete))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(llm_cache.acached_call("k", complete)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(main()) == ["answer"] * 3
+    assert len(calls) == 2
+    assert llm_cache._inflight_async == {}
+
+
+def test_leader_errors_reach_followers_and_are_not_cached():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        return await asyncio.gather(*(llm_cache.acached_call("k", fail) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(main()))
+    assert llm_cache.lookup("k") is None
+
+
+def test_blocking_calls_coalesce():
+    calls, gate = [], threading.Event()
+
+    def complete():
+        calls.append(1)
+        gate.wait(5)
+        return "answer", 10
+
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(llm_cache.cached_call("k", complete))) for _ in range(4)]
+    threads[0].start()
+    while not calls:
+        time.sleep(0.001)
+    for t in threads[1:]:
+        t.start()
+    time.sleep(0.05)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert out == ["answer"] * 4
+    assert len(calls) == 1
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.services import llm_limiter, llm_resilience
+
+
+@pytest.fixture
+def limiter(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "llm_limiter_enabled", True)
+    monkeypatch.setattr(settings, "llm_limiter_path", str(tmp_path / "limiter.sqlite"))
+    monkeypatch.setattr(settings, "llm_limiter_initial", 1)
+    monkeypatch.setattr(settings, "llm_limiter_tpm", 6000)
+    monkeypatch.setattr(settings, "llm_limiter_max_wait_s", 0.3)
+    monkeypatch.setattr(llm_limiter, "_limiter", None)
+    return llm_limiter.get_limiter()
+
+
+def _in_flight(limiter) -> int:
+    return limiter.snapshot().get("p", {}).get("in_flight", 0)
+
+
+def test_in_flight_cap_queues_then_times_out(limiter):
+    lease = llm_limiter.acquire("p", 10)
+    assert lease is not None and _in_flight(limiter) == 1
+    with pytest.raises(llm_limiter.LimiterTimeout):
+        llm_limiter.acquire("p", 10)
+    llm_limiter.release(lease, "p", 10, 10, 0.1, False)
+    assert llm_limiter.acquire("p", 10) is not None
+
+
+def test_throttle_halves_the_limit(limiter, monkeypatch):
+    monkeypatch.setattr(settings, "llm_limiter_initial", 8)
+    monkeypatch.setattr(settings, "llm_limiter_cut_window_s", 0.0)
+    lease = llm_limiter.acquire("q", 10)
+    assert limiter.release(lease, "q", 10, 10, 0.1, throttled=True) == 4.0
+
+
+def test_cancel_refunds_the_token_charge(limiter):
+    lease = llm_limiter.acquire("p", 1000)
+    charged = limiter.snapshot()["p"]["tokens"]
+    limiter.cancel(lease, "p")
+    assert _in_flight(limiter) == 0
+    assert limiter.snapshot()["p"]["tokens"] >= charged + 999
+
+
+def test_cancelled_acquire_does_not_leak_its_lease(limiter, monkeypatch):
+    entered, proceed = threading.Event(), threading.Event()
+    real = limiter.try_acquire
+
+    def slow_try_acquire(*args):
+        entered.set()
+        proceed.wait(5)
+        return real(*args)
+    monkeypatch.setattr(limiter, "try_acquire", slow_try_acquire)
+
+    async def main():
+        task = asyncio.ensure_future(llm_limiter.aacquire("p", 10))
+        await asyncio.to_thread(entered.wait, 5)
+        task.cancel()
+        proceed.set()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if _in_flight(limiter) == 0 and limiter.snapshot().get("p"):
+                break
+
+    asyncio.run(main())
+    assert limiter.snapshot()["p"]["in_flight"] == 0
+
+
+def test_attempt_clock_starts_after_the_lease(limiter, monkeypatch):
+    monkeypatch.setattr(settings, "llm_limiter_max_wait_s", 5.0)
+    monkeypatch.setattr(llm_resilience, "_breakers", {})
+    monkeypatch.setattr(llm_resilience, "_latency", {})
+    held = llm_limiter.acquire("p", 10)
+    seen = []
+
+    async def call(attempt):
+        lease = await llm_limiter.aacquire("p", 10)
+        try:
+            return await attempt.run(asyncio.sleep(0.01, "ok"))
+        finally:
+            seen.append(time.perf_counter() - attempt.started)
+            await asyncio.to_thread(llm_limiter.release, lease, "p", 10, 10, 0.01, False)
+
+    async def main():
+        threading.Timer(0.3, llm_limiter.release, (held, "p", 10, 10, 0.01, False)).start()
+        return await llm_resilience._attempt(call, "p", timeout=0.2)
+
+    assert asyncio.run(main()) == "ok"
+    assert seen[0] < 0.2
+    assert llm_resilience.latency("p").percentile(50, 1) < 0.2
+
+
+def test_open_stream_keeps_its_lease_past_the_lease_time(limiter, monkeypatch):
+    from backend.app.services import llm_cache, llm_client
+
+    monkeypatch.setattr(llm_resilience, "_breakers", {})
+    monkeypatch.setattr(llm_client, "PROVIDER", "openai")
+    monkeypatch.setattr(llm_client, "_providers", lambda: ["p"])
+    monkeypatch.setattr(llm_cache, "enabled_for", lambda route: False)
+    monkeypatch.setattr(llm_limiter, "lease_s", lambda: 0.2)
+    held = []
+
+    async def deltas(provider, system, user, temperature, timeout):
+        for i in range(8):
+            await asyncio.sleep(0.05)
+            held.append(_in_flight(limiter))
+            yield str(i)
+
+    monkeypatch.setattr(llm_client, "_provider_deltas", deltas)
+
+    async def main():
+        return [d async for d in llm_client.astream_chat_complete("s", "u")]
+
+    assert "".join(asyncio.run(main())) == "01234567"
+    assert held == [1] * 8 and _in_flight(limiter) == 0
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.services import llm_resilience
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(llm_resilience, "_breakers", {})
+    monkeypatch.setattr(llm_resilience, "_latency", {})
+    monkeypatch.setattr(settings, "llm_breaker_failures", 2)
+    monkeypatch.setattr(settings, "llm_breaker_cooldown_s", 0.0)
+    monkeypatch.setattr(settings, "llm_max_attempts", 3)
+    monkeypatch.setattr(settings, "llm_hedge_enabled", False)
+    monkeypatch.setattr(llm_resilience, "backoff_s", lambda attempt, exc=None: 0.0)
+
+
+def _open(provider: str) -> llm_resilience.CircuitBreaker:
+    b = llm_resilience.breaker(provider)
+    for _ in range(b.failures):
+        b.failure()
+    return b
+
+
+def test_breaker_opens_after_consecutive_failures_and_closes_on_success():
+    b = llm_resilience.CircuitBreaker("p", failures=2, cooldown_s=60.0)
+    b.failure()
+    assert b.allow()
+    b.failure()
+    assert b.state == "open" and not b.allow()
+    b.success()
+    assert b.state == "closed" and b.allow()
+
+
+def test_half_open_lets_exactly_one_trial_through():
+    b = _open("p")
+    assert b.state == "half_open"
+    assert b.allow()
+    assert not b.allow()
+
+
+def test_cancelled_trial_frees_the_half_open_slot():
+    b = _open("p")
+
+    async def hang(attempt):
+        await attempt.run(asyncio.sleep(10))
+
+    async def main():
+        task = asyncio.ensure_future(llm_resilience._attempt(hang, "p", 5.0))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    assert b.allow()
+    asyncio.run(main())
+    assert b.allow()
+
+
+def test_client_errors_do_not_trip_the_breaker():
+    calls = []
+
+    def bad_request(attempt):
+        attempt.begin()
+        calls.append(attempt.provider)
+        raise HTTPError(400)
+
+    for _ in range(5):
+        with pytest.raises(HTTPError):
+            llm_resilience.call(bad_request, ["p"])
+    assert calls == ["p"] * 5
+    assert llm_resilience.breaker("p").state == "closed"
+
+
+def test_async_client_errors_do_not_trip_the_breaker():
+    async def bad_request(attempt):
+        raise HTTPError(422)
+
+    for _ in range(5):
+        with pytest.raises(HTTPError):
+            asyncio.run(llm_resilience._attempt(bad_request, "p", 5.0))
+    assert llm_resilience.breaker("p").state == "closed"
+
+
+def test_retryable_errors_fail_over_to_the_next_provider():
+    def flaky(attempt):
+        attempt.begin()
+        if attempt.provider == "a":
+            raise HTTPError(503)
+        return attempt.provider
+
+    assert llm_resilience.call(flaky, ["a", "b"]) == "b"
+    assert llm_resilience.breaker("a")._errors == 1
+
+
+def test_open_circuits_surface_as_503_with_their_cooldown(monkeypatch):
+    pytest.importorskip("jwt")
+    from fastapi.testclient import TestClient
+
+    from backend.app.main import create_app
+
+    monkeypatch.setattr(settings, "llm_breaker_cooldown_s", 30.0)
+    _open("a"), _open("b")
+    with pytest.raises(llm_resilience.ProvidersUnavailable) as err:
+        llm_resilience.call(lambda attempt: attempt.provider, ["a", "b"])
+    assert err.value.retry_after == 30
+
+    app = create_app(routers=["health", "chat"])
+
+    @app.get("/down")
+    def down():
+        raise err.value
+
+    r = TestClient(app, raise_server_exceptions=False).get("/down")
+    assert r.status_code == 503 and r.headers["Retry-After"] == "30"
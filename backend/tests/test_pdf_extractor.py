@@ -0,0 +1,156 @@
+import tempfile
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from backend.app.core.config import settings
+from backend.app.utils import pdf_extractor
+
+
+@pytest.fixture(autouse=True)
+def memory_cache(monkeypatch):
+    monkeypatch.setattr(settings, "pdf_cache_enabled", True)
+    monkeypatch.setattr(settings, "pdf_cache_path", None)
+    monkeypatch.setattr(settings, "pdf_workers", 1)
+    monkeypatch.setattr(pdf_extractor, "_cache", None)
+
+
+def _pdf(*texts: str) -> bytes:
+    doc = fitz.open()
+    for text in texts:
+        doc.new_page().insert_text((72, 72), text)
+    return doc.tobytes()
+
+
+def _wrapped(text: str) -> bytes:
+    """One page whose content is only `/Fm0 Do`: the text lives in a Form XObject."""
+    src = fitz.open(stream=_pdf(text), filetype="pdf")
+    out = fitz.open()
+    page = out.new_page()
+    page.show_pdf_page(page.rect, src, 0)
+    return out.tobytes()
+
+
+def _lines(text: str) -> list:
+    return [line for line in text.splitlines() if line]
+
+
+def _digests(data: bytes, fn) -> list:
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        tmp.write(data)
+        tmp.flush()
+        return fn(tmp.name)
+
+
+def test_form_xobject_pages_get_their_own_digest():
+    alice, bob = _wrapped("Alice Smith, HIV positive"), _wrapped("Bob Jones, no findings")
+    assert _digests(alice, pdf_extractor.page_digests) != _digests(bob, pdf_extractor.page_digests)
+
+
+def test_form_xobject_pages_get_their_own_digest_with_pypdf():
+    pytest.importorskip("pypdf")
+    alice, bob = _wrapped("Alice Smith, HIV positive"), _wrapped("Bob Jones, no findings")
+    assert _digests(alice, pdf_extractor._pypdf_page_digests) != _digests(bob, pdf_extractor._pypdf_page_digests)
+
+
+def test_cached_page_text_is_not_served_for_another_document():
+    assert pdf_extractor.extract_pdf_text(_wrapped("Alice Smith, HIV positive")) == "Alice Smith, HIV positive"
+    assert pdf_extractor.extract_pdf_text(_wrapped("Bob Jones, no findings")) == "Bob Jones, no findings"
+
+
+def test_appended_version_only_extracts_new_pages(monkeypatch):
+    extracted = []
+    real = pdf_extractor.extract_page_range
+
+    def counting(path, start, stop):
+        extracted.extend(range(start, stop))
+        return real(path, start, stop)
+    monkeypatch.setattr(pdf_extractor, "extract_page_range", counting)
+
+    v1 = _pdf("day 1", "day 2")
+    assert _lines(pdf_extractor.extract_pdf_text(v1)) == ["day 1", "day 2"]
+    assert extracted == [0, 1]
+    extracted.clear()
+
+    v2 = _pdf("day 1", "day 2", "day 3")
+    assert _lines(pdf_extractor.extract_pdf_text(v2)) == ["day 1", "day 2", "day 3"]
+    assert extracted == [2]
+    extracted.clear()
+
+    assert _lines(pdf_extractor.extract_pdf_text(v2)) == ["day 1", "day 2", "day 3"]
+    assert extracted == []
+
+
+def test_first_upload_digests_only_the_pages_it_extracts(monkeypatch):
+    monkeypatch.setattr(settings, "pdf_pages_per_task", 1)
+    digested = []
+    real = pdf_extractor.page_digests
+
+    def counting(path, pages=None):
+        pages = list(pages)
+        digested.extend(pages)
+        return real(path, pages)
+    monkeypatch.setattr(pdf_extractor, "page_digests", counting)
+
+    data = _pdf(*(f"day {n}" for n in range(6)))
+    assert [i for i, _ in pdf_extractor.iter_pdf_pages(data, max_chars=8)] == [0, 1]   # 6 chars a page
+    assert digested == [0, 1]
+    digested.clear()
+
+    assert len(_lines(pdf_extractor.extract_pdf_text(data))) == 6
+    assert digested == list(range(6))
+    digested.clear()
+    assert len(_lines(pdf_extractor.extract_pdf_text(data))) == 6   # whole document cached by hash
+    assert digested == []
+
+
+def test_disk_spooled_upload_is_read_in_place(monkeypatch):
+    from backend.app.utils.uploads import close_path, map_file, release, spooled_path
+
+    spool = tempfile.SpooledTemporaryFile(max_size=16)
+    spool.write(_pdf("day 1", "day 2"))
+    spool.flush()
+    data, path = map_file(spool), spooled_path(spool)
+    spool.close()  # as when the handler returns; the path stays valid
+    monkeypatch.setattr(tempfile, "NamedTemporaryFile", None)   # no second copy
+    try:
+        assert _lines(pdf_extractor.extract_pdf_text(data, path=path)) == ["day 1", "day 2"]
+    finally:
+        release(data)
+        close_path(path)
+        close_path(path)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """A real two-process pool, one page per task."""
+    monkeypatch.setattr(settings, "pdf_workers", 2)
+    monkeypatch.setattr(settings, "pdf_pages_per_task", 1)
+    monkeypatch.setattr(pdf_extractor, "_pool", None)
+    yield
+    if pdf_extractor._pool is not None:
+        pdf_extractor._pool.shutdown(cancel_futures=True)
+
+
+@pytest.mark.parametrize("cache", [True, False])
+def test_pool_results_come_back_in_page_order(pool, monkeypatch, cache):
+    monkeypatch.setattr(settings, "pdf_cache_enabled", cache)
+    texts = [f"day {n}" for n in range(8)]
+    assert _lines(pdf_extractor.extract_pdf_text(_pdf(*texts))) == texts
+
+
+def test_cap_stops_feeding_the_pool(pool, monkeypatch):
+    submitted = []
+    real = pdf_extractor._get_pool
+
+    class Counting:
+        def submit(self, fn, start, stop):
+            submitted.append(start)
+            return real().submit(fn, start, stop)
+    monkeypatch.setattr(pdf_extractor, "_get_pool", Counting)
+
+    data = _pdf(*(f"day {n}" for n in range(40)))
+    assert [i for i, _ in pdf_extractor.iter_pdf_pages(data, max_chars=8)] == [0, 1]   # 6 chars a page
+    window = 2 * settings.pdf_workers
+    assert submitted == list(range(window + 1))   # the in-flight window, refilled once; then the cap closes it
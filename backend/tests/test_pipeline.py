@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from backend.app.services.pipeline import Stage, StageSkipped, run_stages
+
+
+def _collect(stages):
+    async def main():
+        return [rec async for rec in run_stages(stages)]
+    return asyncio.run(main())
+
+
+def test_independent_stages_run_concurrently_and_dependents_see_results():
+    started = []
+
+    def stage(name, value, delay):
+        async def run(inputs):
+            started.append((name, dict(inputs)))
+            await asyncio.sleep(delay)
+            return value
+        return run
+
+    records = _collect([
+        Stage("image", stage("image", "findings", 0.05)),
+        Stage("pdf", stage("pdf", "notes", 0.01)),
+        Stage("summary", stage("summary", "summary", 0.0), after=("image", "pdf")),
+    ])
+    assert [r["stage"] for r in records] == ["pdf", "image", "summary"]
+    assert {n for n, _ in started[:2]} == {"image", "pdf"}          # both started before either finished
+    assert started[2] == ("summary", {"image": "findings", "pdf": "notes"})
+    assert all(r["status"] == "ok" for r in records)
+
+
+def test_failed_and_skipped_stages_do_not_stop_dependents():
+    async def boom(inputs):
+        raise RuntimeError("decode failed")
+
+    async def nothing(inputs):
+        raise StageSkipped("no PDF uploaded")
+
+    async def summary(inputs):
+        return sorted(inputs)
+
+    records = {r["stage"]: r for r in _collect([
+        Stage("image", boom), Stage("pdf", nothing), Stage("summary", summary, after=("image", "pdf")),
+    ])}
+    assert records["image"]["status"] == "error" and records["image"]["detail"] == "decode failed"
+    assert records["pdf"]["status"] == "skipped"
+    assert records["summary"] == {**records["summary"], "status": "ok", "result": []}
+
+
+def test_unknown_dependency_is_rejected():
+    async def run(inputs):
+        return None
+    with pytest.raises(ValueError):
+        _collect([Stage("summary", run, after=("missing",))])
+
+
+def test_closing_the_stream_cancels_running_stages():
+    cancelled = []
+
+    async def fast(inputs):
+        return 1
+
+    async def slow(inputs):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        stream = run_stages([Stage("fast", fast), Stage("slow", slow)])
+        assert (await stream.__anext__())["stage"] == "fast"
+        await stream.aclose()
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert cancelled == [True]
+
+
+def test_refused_upload_releases_the_ones_already_mapped(monkeypatch):
+    pytest.importorskip("jwt")
+    from fastapi.testclient import TestClient
+    from backend.app.api.v1 import pipeline
+    from backend.app.core.security import create_access_token
+    from backend.app.main import create_app
+
+    released = []
+    monkeypatch.setattr(pipeline, "release", released.append)
+    png = b"\x89PNG\r\n\x1a\n" + b"\0" * 64
+    r = TestClient(create_app(routers=["pipeline"])).post(
+        "/api/v1/pipeline/case",
+        files={"image": ("scan.png", png), "pdf": ("notes.pdf", b"not a pdf")},
+        headers={"Authorization": f"Bearer {create_access_token('doc-1', 'clinician')}"},
+    )
+    assert r.status_code == 400 and released == [png]
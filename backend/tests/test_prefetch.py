@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.services import prefetch
+
+
+@pytest.fixture(autouse=True)
+def memory_prefetch(monkeypatch):
+    monkeypatch.setattr(settings, "summarize_prefetch", True)
+    monkeypatch.setattr(settings, "summarize_prefetch_path", None)
+    monkeypatch.setattr(settings, "sched_enabled", False)
+    monkeypatch.setattr(prefetch, "_cache", None)
+    monkeypatch.setattr(prefetch, "_inflight", {})
+    started = []
+
+    async def fake_run(key, notes, findings):
+        started.append(notes)
+        return {"summary": notes, "citations": [], "usage": {}}
+    monkeypatch.setattr(prefetch, "_run", fake_run)
+    return started
+
+
+def test_only_roles_that_can_summarize_prefetch(memory_prefetch):
+    async def main():
+        await prefetch.note_case("pat-1", "patient", notes="my notes")
+        await prefetch.note_case("doc-1", "clinician", notes="case notes")
+        await asyncio.sleep(0)
+    asyncio.run(main())
+    assert memory_prefetch == ["case notes"]
+
+
+def test_short_notes_skip_the_tokenizer(memory_prefetch, monkeypatch):
+    def no_tokenizer(text):
+        raise AssertionError("tokenized short notes")
+    monkeypatch.setattr(prefetch, "count_tokens", no_tokenizer)
+    monkeypatch.setattr(settings, "summarize_prefetch_max_tokens", 100)
+
+    async def main():
+        await prefetch.note_case("doc-1", "clinician", notes="x" * 100)
+        await asyncio.sleep(0)
+    asyncio.run(main())
+    assert memory_prefetch == ["x" * 100]
+
+
+def test_oversized_notes_are_not_prefetched(memory_prefetch, monkeypatch):
+    monkeypatch.setattr(settings, "summarize_prefetch_max_tokens", 10)
+
+    async def main():
+        await prefetch.note_case("doc-1", "clinician", notes="word " * 200)
+        await asyncio.sleep(0)
+    asyncio.run(main())
+    assert memory_prefetch == []
@@ -0,0 +1,46 @@
+from backend.app.services import retrieval
+from backend.app.services.retrieval import NotesIndex
+
+NOTES = "\n\n".join([
+    "Day 1: admitted with productive cough and fever.",
+    "Day 2: chest x-ray shows left lower lobe consolidation.",
+    "Day 3: started ceftriaxone, fever resolving, cough persists.",
+    "Day 4: afebrile, ambulating, tolerating diet well today.",
+    "Day 5: discharged home on oral amoxicillin, follow up at the home clinic.",
+])
+
+
+def _index() -> NotesIndex:
+    return NotesIndex(NOTES, chunk_tokens=20)   # one day per chunk
+
+
+def test_rare_terms_outrank_common_ones():
+    index = _index()
+    assert len(index.chunks) == 5
+    scores = index.scores("consolidation cough")
+    assert scores.argmax() == 1                  # "consolidation" occurs once, "cough" twice
+    assert scores[3] == 0
+
+
+def test_top_k_in_document_order_without_unmatched_padding():
+    hits = _index().search("fever cough ceftriaxone", k=2, max_tokens=1000)
+    assert [h["chunk"] for h in hits] == [0, 2]
+    assert [h["chunk"] for h in _index().search("amoxicillin", k=3, max_tokens=1000)] == [4]
+
+
+def test_chunks_over_the_budget_are_skipped_for_ones_that_fit():
+    index = _index()
+    assert index.scores("home fever").argmax() == 4
+    budget = int(index.tokens[4]) - 1            # the best chunk no longer fits
+    assert [h["chunk"] for h in index.search("home fever", k=2, max_tokens=budget)] == [0]
+    assert [h["chunk"] for h in index.search("home fever", k=2, max_tokens=budget + 1)] == [4]
+
+
+def test_unmatched_query_gets_the_leading_chunks():
+    assert [h["chunk"] for h in _index().search("summarize this", k=2, max_tokens=1000)] == [0, 1]
+
+
+def test_index_is_built_once_per_text(monkeypatch):
+    monkeypatch.setattr(retrieval, "_indexes", None)
+    assert retrieval.get_index(NOTES) is retrieval.get_index(NOTES)
+    assert retrieval.get_index(NOTES + " ") is not retrieval.get_index(NOTES)
@@ -0,0 +1,97 @@
+import asyncio
+import gc
+
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.services import scheduler
+from backend.app.services.scheduler import Overloaded, PriorityScheduler
+from backend.app.utils.sse import sse_response
+
+
+def _sched(capacity=1, max_queue=8, max_wait_s=5.0, quotas=None):
+    return PriorityScheduler("test", capacity=capacity, weights={"clinician": 3, "patient": 1},
+                             quotas=quotas or {}, max_queue=max_queue, max_wait_s=max_wait_s)
+
+
+def test_weighted_round_robin_favours_heavier_classes_without_starving():
+    s = _sched(max_queue=12, max_wait_s=60.0)
+    order = []
+
+    async def main():
+        first = await s.aacquire("clinician")
+
+        async def worker(role):
+            async with s.aslot(role):
+                order.append(role)
+                await asyncio.sleep(0)
+        tasks = [asyncio.ensure_future(worker(r)) for r in ["patient"] * 4 + ["clinician"] * 4]
+        await asyncio.sleep(0.01)
+        s.release(first, 0.0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert sorted(order) == ["clinician"] * 4 + ["patient"] * 4
+    assert order.index("patient") < 4          # patients get a turn before clinicians drain
+    assert order[:4].count("clinician") >= 2   # but clinicians get most early slots
+
+
+def test_full_queue_is_shed_with_retry_after():
+    s = _sched(max_queue=1)
+
+    async def main():
+        held = await s.aacquire("patient")
+        waiter = asyncio.ensure_future(s.aacquire("patient"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as e:
+            await s.aacquire("patient")
+        assert e.value.retry_after >= 1
+        s.release(held, 0.0)
+        s.release(await waiter, 0.0)
+
+    asyncio.run(main())
+
+
+def test_blocking_acquire_gives_up_after_its_timeout():
+    s = _sched()
+    held = s.acquire("clinician")
+    with pytest.raises(Overloaded):
+        s.acquire("patient", timeout=0.05)
+    s.release(held, 0.0)
+    assert s.snapshot()["patient"] == {"running": 0, "queued": 0, "quota": 1, "weight": 1}
+    with s.slot("patient", timeout=0.05):
+        pass
+
+
+def test_cancelled_waiter_does_not_keep_a_slot():
+    s = _sched()
+
+    async def main():
+        held = await s.aacquire("clinician")
+        waiter = asyncio.ensure_future(s.aacquire("patient"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        s.release(held, 0.0)
+        assert sum(v["running"] for v in s.snapshot().values()) == 0
+
+    asyncio.run(main())
+
+
+def test_held_slot_is_released_when_the_stream_never_starts(monkeypatch):
+    monkeypatch.setattr(settings, "sched_enabled", True)
+    monkeypatch.setattr(scheduler, "_schedulers", {"llm": _sched()})
+
+    async def main():
+        release = await scheduler.hold("llm", "clinician")
+
+        async def events():
+            try:
+                yield "never sent"
+            finally:
+                release()
+        sse_response(events(), cleanup=release)  # response dropped before it is served
+        gc.collect()
+        assert scheduler.get_scheduler("llm").snapshot()["clinician"]["running"] == 0
+
+    asyncio.run(main())
@@ -0,0 +1,7 @@
+from backend.serve import restart_delay
+
+
+def test_crash_looping_workers_back_off():
+    assert restart_delay(0) == 0.0
+    assert [restart_delay(n) for n in (1, 2, 3, 4)] == [0.5, 1.0, 2.0, 4.0]
+    assert restart_delay(20) == 30.0
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+pytest.importorskip("jwt")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from backend.app.api.v1 import chat, records  # noqa: E402
+from backend.app.core.config import settings  # noqa: E402
+from backend.app.core.security import create_access_token  # noqa: E402
+from backend.app.main import create_app  # noqa: E402
+
+
+@pytest.fixture
+def held(monkeypatch):
+    """Note whether the streaming routes take and give back a scheduler slot (release is idempotent)."""
+    slots = {"taken": False, "released": False}
+
+    async def hold(name, role):
+        slots["taken"] = True
+        return lambda: slots.__setitem__("released", True)
+
+    monkeypatch.setattr(chat, "hold", hold)
+    monkeypatch.setattr(records, "hold", hold)
+    return slots
+
+
+def _post(router: str, path: str, **kwargs):
+    headers = {"Authorization": f"Bearer {create_access_token('doc-1', 'clinician')}"}
+    r = TestClient(create_app(routers=[router])).post(f"/api/v1{path}", headers=headers, **kwargs)
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for frame in r.text.strip().split("\n\n"):
+        event, data = frame.split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def test_chat_stream_sends_tokens_then_done(monkeypatch, held):
+    async def answer(message, citations_out, **kwargs):
+        citations_out.append({"chunk": 0})
+        for part in ("Effusion ", "is likely."):
+            yield part
+
+    monkeypatch.setattr(chat, "astream_answer", answer)
+    events = _post("chat", "/chat/stream", json={"message": "what is it?"})
+    assert events == [("token", {"text": "Effusion "}), ("token", {"text": "is likely."}),
+                      ("done", {"citations": [{"chunk": 0}]})]
+    assert held == {"taken": True, "released": True}
+
+
+def test_chat_stream_failure_says_whether_tokens_were_sent(monkeypatch, held):
+    async def answer(message, citations_out, **kwargs):
+        yield "Effusion "
+        raise RuntimeError("provider went away")
+
+    monkeypatch.setattr(chat, "astream_answer", answer)
+    *tokens, (event, data) = _post("chat", "/chat/stream", json={"message": "what is it?"})
+    assert tokens == [("token", {"text": "Effusion "})]
+    assert event == "error" and data["partial"] is True and "provider went away" in data["detail"]
+    assert held["released"]
+
+
+def test_summary_stream_reports_usage(monkeypatch, held):
+    async def no_prefetch(notes, findings):
+        return None
+
+    async def summary(text, findings, usage_out):
+        usage_out["completion_tokens"] = 3
+        yield "Stable."
+
+    monkeypatch.setattr(records, "claim", no_prefetch)
+    monkeypatch.setattr(records, "astream_summary", summary)
+    events = _post("records", "/records/summarize/stream", json={"text": "Day 1: stable."})
+    assert events == [("token", {"text": "Stable."}),
+                      ("done", {"citations": [], "usage": {"completion_tokens": 3}})]
+    assert held == {"taken": True, "released": True}
+
+
+def test_pdf_stream_sends_a_page_event_per_page(monkeypatch):
+    fitz = pytest.importorskip("fitz")
+
+    async def note_case(*args, **kwargs):
+        noted.append(kwargs["notes"])
+
+    noted = []
+    monkeypatch.setattr(records, "note_case", note_case)
+    monkeypatch.setattr(settings, "pdf_cache_path", None)
+    monkeypatch.setattr(settings, "pdf_workers", 1)
+    doc = fitz.open()
+    for text in ("first page", "second page"):
+        doc.new_page().insert_text((72, 72), text)
+    events = _post("records", "/records/extract_pdf/stream", files={"file": ("notes.pdf", doc.tobytes())})
+    assert [(e, d["page"], d["text"].strip()) for e, d in events[:-1]] == [
+        ("page", 1, "first page"), ("page", 2, "second page")]
+    assert events[-1][0] == "done" and events[-1][1]["pages"] == 2 and not events[-1][1]["truncated"]
+    assert len(noted) == 1 and noted[0].split() == ["first", "page", "second", "page"]
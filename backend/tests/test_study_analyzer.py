@@ -0,0 +1,43 @@
+import io
+import zipfile
+
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.services.study_analyzer import ArchiveTooLarge, check_archives, iter_upload_items
+
+
+def _zip(members: dict) -> io.BytesIO:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def test_members_are_expanded_and_metadata_skipped():
+    fp = _zip({"a/1.dcm": b"one", "a/DICOMDIR": b"index", "a/.DS_Store": b"junk", "b/2.png": b"two"})
+    plain = io.BytesIO(b"\x89PNG plain")
+    items = list(iter_upload_items([("study.zip", fp), ("x.png", plain)]))
+    assert items == [("study.zip/a/1.dcm", b"one"), ("study.zip/b/2.png", b"two"), ("x.png", b"\x89PNG plain")]
+
+
+def test_highly_compressed_member_is_rejected_before_it_is_inflated(monkeypatch):
+    monkeypatch.setattr(settings, "study_max_member_mb", 1)
+    fp = _zip({"bomb.dcm": b"\0" * (2 * 1024 * 1024)})
+    assert len(fp.getvalue()) < 64 * 1024
+    with pytest.raises(ArchiveTooLarge):
+        check_archives([fp])
+    with pytest.raises(ArchiveTooLarge):
+        list(iter_upload_items([("bomb.zip", fp)]))
+
+
+def test_total_size_and_entry_count_are_capped(monkeypatch):
+    monkeypatch.setattr(settings, "study_max_total_mb", 1)
+    with pytest.raises(ArchiveTooLarge):
+        check_archives([_zip({f"{i}.dcm": b"\0" * (400 * 1024) for i in range(3)})])
+    monkeypatch.setattr(settings, "study_max_members", 10)
+    with pytest.raises(ArchiveTooLarge):
+        check_archives([_zip({f"{i}.dcm": b"x" for i in range(11)})])
+    check_archives([_zip({f"{i}.dcm": b"x" for i in range(10)})])
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.services import summarizer
+from backend.app.utils.tokens import count_tokens
+
+NOTES = "\n\n".join(f"Day {i}: afebrile, tolerating diet, ambulating with assistance." for i in range(60))
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    monkeypatch.setattr(settings, "summarize_single_shot_tokens", 200)
+    monkeypatch.setattr(settings, "summarize_chunk_tokens", 150)
+    seen = []
+
+    async def fake_complete(system, user, temperature=0.2, route="llm"):
+        seen.append(user)
+        return "- vitals stable" if user.startswith("This is part") else "summary"
+    monkeypatch.setattr(summarizer, "achat_complete", fake_complete)
+    return seen
+
+
+def test_short_notes_are_summarized_in_one_call(calls):
+    out = asyncio.run(summarizer.asummarize_notes("Day 1: cough.", ["Effusion: 0.71"]))
+    assert len(calls) == 1 and out["usage"]["mode"] == "single_shot"
+    exact = count_tokens(summarizer.SYSTEM) + count_tokens(calls[0])
+    assert abs(out["usage"]["tokens"]["prompt"] - exact) <= 2   # notes and scaffold are counted apart
+
+
+def test_long_notes_are_mapped_then_reduced(calls):
+    out = asyncio.run(summarizer.asummarize_notes(NOTES))
+    usage = out["usage"]
+    assert usage["mode"] == "map_reduce" and usage["chunks"] == len(calls) - 1 > 1
+    assert "truncated" not in usage
+    exact = sum(count_tokens(summarizer.SYSTEM) + count_tokens(c) for c in calls)
+    assert abs(usage["tokens"]["prompt"] - exact) <= exact // 10   # chunk counts are summed from pieces
+
+
+def test_extracts_that_never_shrink_are_truncated(calls, monkeypatch):
+    async def verbose(system, user, temperature=0.2, route="llm"):
+        calls.append(user)
+        return user if user.startswith("This is part") else "summary"
+    monkeypatch.setattr(summarizer, "achat_complete", verbose)
+    out = asyncio.run(summarizer.asummarize_notes(NOTES))
+    assert out["usage"]["map_rounds"] == summarizer.MAX_MAP_ROUNDS and out["usage"]["truncated"]
+    notes = calls[-1].split("Clinical Notes:\n", 1)[1].split("\n\nImaging Findings", 1)[0]
+    assert count_tokens(notes) <= settings.summarize_single_shot_tokens
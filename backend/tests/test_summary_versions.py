@@ -0,0 +1,41 @@
+from backend.app.core.config import settings
+from backend.app.services.summary_versions import FULL, INCREMENTAL, UNCHANGED, _digest, inputs_hash, plan
+
+NOTES = "Day 1: admitted with cough."
+FINDINGS = ["Effusion: 0.71"]
+
+
+def _prior(notes=NOTES, findings=FINDINGS, updates=0):
+    return {"summary": "s", "version": 1, "updates": updates, "inputs": inputs_hash(notes, findings),
+            "notes_len": len(notes), "notes_hash": _digest(notes), "findings": list(findings)}
+
+
+def test_first_summary_is_full():
+    assert plan(None, NOTES, FINDINGS) == (FULL, NOTES, FINDINGS)
+
+
+def test_same_inputs_are_unchanged():
+    assert plan(_prior(), NOTES, FINDINGS) == (UNCHANGED, "", [])
+
+
+def test_appended_notes_and_new_findings_are_incremental():
+    notes = NOTES + "\nDay 2: fever."
+    findings = FINDINGS + ["Pneumonia: 0.64"]
+    assert plan(_prior(), notes, findings) == (INCREMENTAL, "Day 2: fever.", ["Pneumonia: 0.64"])
+
+
+def test_edited_notes_or_dropped_findings_need_a_full_pass():
+    assert plan(_prior(), NOTES.replace("cough", "fever") + " more", FINDINGS)[0] == FULL
+    assert plan(_prior(), NOTES[:5], FINDINGS)[0] == FULL
+    assert plan(_prior(), NOTES + " more", [])[0] == FULL
+
+
+def test_reordered_findings_are_unchanged():
+    findings = ["A: 0.6", "B: 0.7"]
+    assert plan(_prior(findings=findings), NOTES, findings[::-1])[0] == UNCHANGED
+
+
+def test_periodic_full_pass(monkeypatch):
+    monkeypatch.setattr(settings, "summarize_full_every", 3)
+    assert plan(_prior(updates=2), NOTES + " more", FINDINGS)[0] == INCREMENTAL
+    assert plan(_prior(updates=3), NOTES + " more", FINDINGS)[0] == FULL
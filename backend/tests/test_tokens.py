@@ -0,0 +1,22 @@
+from backend.app.utils.tokens import count_tokens, split_by_tokens, split_counted, truncate_tokens
+
+NOTES = "\n\n".join(f"Day {i}: afebrile, tolerating diet, ambulating with assistance." for i in range(40))
+
+
+def test_split_counted_counts_match_the_chunks():
+    chunks = split_counted(NOTES, 50)
+    assert len(chunks) > 1
+    for chunk, n in chunks:
+        assert count_tokens(chunk) <= n <= 50
+        assert n - count_tokens(chunk) <= 4
+    assert [c for c, _ in chunks] == split_by_tokens(NOTES, 50)
+
+
+def test_split_counted_reuses_a_known_total():
+    assert split_counted(NOTES, 50, total=count_tokens(NOTES)) == split_counted(NOTES, 50)
+
+
+def test_truncate_tokens():
+    cut = truncate_tokens(NOTES, 30)
+    assert NOTES.startswith(cut) and count_tokens(cut) <= 30
+    assert truncate_tokens("short", 30) == "short"
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.utils.uploads import UploadLimit, sniff
+
+DICOM = b"\0" * 128 + b"DICM" + b"\2\0" * 8
+
+
+@pytest.mark.parametrize("head, filename, kind", [
+    (b"%PDF-1.7\n", None, "pdf"),
+    (b"\xef\xbb\xbf\r\n%PDF-1.4", None, "pdf"),        # junk before the header
+    (b"\x89PNG\r\n\x1a\n....", "scan.jpg", "png"),     # content wins over the name
+    (b"\xff\xd8\xff\xe0JFIF", None, "jpeg"),
+    (b"PK\x03\x04", "study.zip", "zip"),
+    (DICOM, None, "dicom"),
+    (b"\x08\x00\x05\x00CS", "IM0001.DCM", "dicom"),   # no preamble: only the name tells
+    (b"MZ\x90\x00", "scan.png", None),
+    (b"", None, None),
+])
+def test_sniff(head, filename, kind):
+    assert sniff(head, filename) == kind
+
+
+def _post(path, body, headers=()):
+    """Drive UploadLimit with a downstream app that drains the body; -> (status, bytes seen by the app)."""
+    seen, sent = [], []
+
+    async def app(scope, receive, send):
+        while True:
+            msg = await receive()
+            if msg["type"] != "http.request":
+                break
+            seen.append(len(msg.get("body", b"")))
+            if not msg.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    chunks = [body[i:i + 1024] for i in range(0, len(body), 1024)] or [b""]
+
+    async def receive():
+        if chunks:
+            chunk = chunks.pop(0)
+            return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+        return {"type": "http.disconnect"}
+
+    async def send(msg):
+        sent.append(msg)
+
+    scope = {"type": "http", "path": path, "headers": list(headers)}
+    asyncio.run(UploadLimit(app)(scope, receive, send))
+    return next(m["status"] for m in sent if m["type"] == "http.response.start"), sum(seen)
+
+
+def test_declared_length_over_the_limit_is_refused_unread(monkeypatch):
+    monkeypatch.setattr(settings, "upload_max_mb", {"pdf": 1})
+    status, read = _post("/api/v1/records/extract_pdf", b"x" * 10,
+                         [(b"content-length", str(3 * 2**20).encode())])
+    assert (status, read) == (413, 0)
+
+
+def test_streamed_body_is_cut_off_at_the_limit(monkeypatch):
+    monkeypatch.setattr(settings, "upload_max_mb", {"pdf": 1})
+    status, read = _post("/api/v1/records/extract_pdf", b"x" * (2 * 2**20))
+    assert status == 413 and read <= 2**20 + 64 * 1024 + 1024
+
+
+def test_other_routes_are_not_limited(monkeypatch):
+    monkeypatch.setattr(settings, "upload_max_mb", {"pdf": 1})
+    assert _post("/api/v1/chat", b"x" * (2 * 2**20)) == (200, 2 * 2**20)
@@ -1,4 +1,7 @@
+import hashlib
+import json
 import os
+import time
 import requests
 
 API_BASE = os.getenv("STREAMLIT_API_BASE", "http://127.0.0.1:8001")
@@ -27,16 +30,33 @@ def get_health(token: str | None = None):
     return r.json()
 
 
+def _wait_for_job(job_id: str, token: str | None = None, max_wait: float = 600.0):
+    """Poll a background job until it finishes; returns its result."""
+    deadline = time.monotonic() + max_wait
+    delay = 0.25
+    while True:
+        r = requests.get(
+            f"{API_BASE}/api/v1/jobs/{job_id}/result", headers=_headers(token), timeout=20
+        )
+        if r.status_code != 202:
+            r.raise_for_status()
+            return r.json()
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Job {job_id} still running after {max_wait:.0f}s")
+        time.sleep(delay)
+        delay = min(delay * 1.5, 2.0)
+
+
 def analyze_image(file_bytes: bytes, filename: str, token: str | None = None):
     files = {"file": (filename, file_bytes, "application/octet-stream")}
     r = requests.post(
-        f"{API_BASE}/api/v1/images/analyze",
+        f"{API_BASE}/api/v1/jobs/images/analyze",
         files=files,
         headers=_headers(token),
-        timeout=120,
+        timeout=60,
     )
     r.raise_for_status()
-    return r.json()
+    return _wait_for_job(r.json()["job_id"], token)
 
 
 def extract_pdf_text(file_bytes: bytes, filename: str, token: str | None = None):
@@ -54,22 +74,53 @@ def extract_pdf_text(file_bytes: bytes, filename: str, token: str | None = None)
 def summarize_records(text: str, imaging_findings=None, token: str | None = None):
     payload = {"text": text, "imaging_findings": imaging_findings or []}
     r = requests.post(
-        f"{API_BASE}/api/v1/records/summarize",
+        f"{API_BASE}/api/v1/jobs/records/summarize",
         json=payload,
         headers=_headers(token),
-        timeout=120,
+        timeout=30,
+    )
+    r.raise_for_status()
+    return _wait_for_job(r.json()["job_id"], token)
+
+
+def register_chat_context(notes: str | None = None, imaging_findings=None, token: str | None = None):
+    """Upload case context once; returns {"context_id", "expires_in_s", ...} for later chat calls."""
+    r = requests.post(
+        f"{API_BASE}/api/v1/chat/context",
+        json={"notes": notes, "imaging_findings": imaging_findings or []},
+        headers=_headers(token),
+        timeout=60,
     )
     r.raise_for_status()
     return r.json()
 
 
+def chat_context_id(cache: dict, notes: str | None, imaging_findings=None, token: str | None = None) -> str:
+    """
+    Context id for this notes/findings pair, registering it when new or about to
+    expire. `cache` is any dict that survives reruns (e.g. st.session_state).
+    """
+    key = hashlib.sha256(json.dumps([token, notes or "", imaging_findings or []]).encode()).hexdigest()
+    entry = cache.get("_chat_context")
+    now = time.monotonic()
+    if not entry or entry["key"] != key or now > entry["expires"]:
+        out = register_chat_context(notes, imaging_findings, token)
+        entry = {"key": key, "id": out["context_id"], "ttl": out["expires_in_s"]}
+    entry["expires"] = now + entry["ttl"] * 0.9  # each turn restarts the server-side TTL
+    cache["_chat_context"] = entry
+    return entry["id"]
+
+
 def patient_chat(
     message: str,
     notes: str | None = None,
     imaging_findings=None,
     token: str | None = None,
+    context_id: str | None = None,
 ):
     payload = {"message": message, "notes": notes, "imaging_findings": imaging_findings or []}
+    if context_id:
+        payload = {"message": message, "context_id": context_id}
     r = requests.post(
         f"{API_BASE}/api/v1/chat",
         json=payload,
@@ -78,3 +129,103 @@ def patient_chat(
     )
     r.raise_for_status()
     return r.json()
+
+
+def _iter_sse(r):
+    """(event, data) pairs from a streamed SSE response."""
+    event = "message"
+    for line in r.iter_lines(decode_unicode=True):
+        if not line:
+            event = "message"
+            continue
+        if line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            yield event, json.loads(line[5:].strip())
+
+
+def _sse_text(path: str, payload: dict, token: str | None = None, timeout: int = 120):
+    """
+    POST to an SSE endpoint and yield the text of each `token` event as it
+    arrives. An error before any text raises; an error after some text ends
+    the stream with a note that the answer is incomplete (and the disclaimer,
+    which a cut-off chat answer never reached).
+    """
+    headers = {**_headers(token), "Accept": "text/event-stream"}
+    with requests.post(
+        f"{API_BASE}{path}", json=payload, headers=headers, stream=True, timeout=timeout
+    ) as r:
+        r.raise_for_status()
+        partial = False
+        for event, data in _iter_sse(r):
+            if event == "token":
+                partial = True
+                yield data.get("text", "")
+            elif event == "error":
+                detail = data.get("detail", "stream failed")
+                if not partial:
+                    raise RuntimeError(detail)
+                yield f"\n\n**[Answer interrupted — incomplete: {detail}]**" + data.get("disclaimer", "")
+                return
+
+
+def case_pipeline(image=None, pdf=None, notes: str = "", token: str | None = None):
+    """
+    Image analysis, PDF extraction and summary in one streamed call. `image`
+    and `pdf` are (filename, bytes) or None; yields (event, data): a "stage"
+    per finished stage, then "done".
+    """
+    files = {}
+    if image:
+        files["image"] = (image[0], image[1], "application/octet-stream")
+    if pdf:
+        files["pdf"] = (pdf[0], pdf[1], "application/pdf")
+    headers = {**_headers(token), "Accept": "text/event-stream"}
+    with requests.post(
+        f"{API_BASE}/api/v1/pipeline/case",
+        files=files or None,
+        data={"notes": notes},
+        headers=headers,
+        stream=True,
+        timeout=300,
+    ) as r:
+        r.raise_for_status()
+        yield from _iter_sse(r)
+
+
+def stream_summary(text: str, imaging_findings=None, token: str | None = None, case_id: str | None = None):
+    payload = {"text": text, "imaging_findings": imaging_findings or []}
+    if case_id:
+        payload["case_id"] = case_id
+    yield from _sse_text("/api/v1/records/summarize/stream", payload, token)
+
+
+def stream_chat(
+    message: str,
+    notes: str | None = None,
+    imaging_findings=None,
+    token: str | None = None,
+    context_id: str | None = None,
+):
+    payload = {"message": message, "notes": notes, "imaging_findings": imaging_findings or []}
+    if context_id:
+        payload = {"message": message, "context_id": context_id}
+    yield from _sse_text("/api/v1/chat/stream", payload, token, timeout=90)
+
+
+def stream_case_chat(cache: dict, message: str, notes: str | None, imaging_findings=None,
+                     token: str | None = None):
+    """
+    `stream_chat` against the registered context for notes/findings (see
+    `chat_context_id`). A context the server no longer has (404: expired or
+    evicted early) is registered again and the question retried once.
+    """
+    for retry in (False, True):
+        context_id = chat_context_id(cache, notes, imaging_findings, token)
+        try:
+            yield from stream_chat(message, context_id=context_id, token=token)
+            return
+        except requests.HTTPError as e:
+            if retry or e.response is None or e.response.status_code != 404:
+                raise
+            cache.pop("_chat_context", None)
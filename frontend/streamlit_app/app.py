@@ -1,14 +1,16 @@
 import os
+import uuid
 import streamlit as st
 import pandas as pd
 
 from api import (
     login,
     get_health,
-    summarize_records,
-    patient_chat,
+    stream_summary,
+    stream_case_chat,
     analyze_image,
     extract_pdf_text,
+    case_pipeline,
 )
 
 # -------------------------------------------------------------------
@@ -28,6 +30,19 @@ def do_rerun():
 # -------------------------------------------------------------------
 # Helpers
 # -------------------------------------------------------------------
+def new_case(upload=None):
+    """
+    Start a new summary case (a fresh case_id, so the next summary is a full
+    pass) for a pipeline run, or when `upload` differs from the last file ingested.
+    """
+    if upload is not None:
+        ingested = st.session_state.setdefault("ingested", set())
+        if (upload.name, upload.size) in ingested:
+            return
+        ingested.add((upload.name, upload.size))
+    st.session_state["case_id"] = uuid.uuid4().hex
+
+
 def pct(p):
     try:
         return f"{float(p) * 100:.0f}%"
@@ -172,8 +187,38 @@ if role in ("clinician", "admin"):
 
     findings: list[str] = st.session_state.get("last_findings", [])
 
+    # One call: the backend analyzes the image and extracts the PDF concurrently,
+    # then summarizes both; each stage is shown as it finishes.
+    if (img_file is not None or pdf_file is not None) and st.button("Run full pipeline"):
+        new_case()
+        with st.spinner("Running image, PDF and summary stages..."):
+            try:
+                for event, data in case_pipeline(
+                    image=(img_file.name, img_file.getvalue()) if img_file is not None else None,
+                    pdf=(pdf_file.name, pdf_file.getvalue()) if pdf_file is not None else None,
+                    notes=st.session_state.get("notes_text", ""),
+                    token=st.session_state.auth["token"],
+                ):
+                    if event != "stage":
+                        continue
+                    if data["status"] != "ok":
+                        st.warning(f"{data['stage'].capitalize()}: {data.get('detail')}")
+                    elif data["stage"] == "image":
+                        render_image_result(data["result"], role=st.session_state.auth.get("role", "clinician"))
+                        findings = data["result"].get("findings", [])
+                        st.session_state["last_findings"] = findings
+                    elif data["stage"] == "pdf":
+                        st.session_state["notes_text"] = data["result"]["text"]
+                        st.success(f"Text extracted from PDF ({data['ms'] / 1000:.1f}s)")
+                    elif data["stage"] == "summary":
+                        st.success(f"Summary ({data['ms'] / 1000:.1f}s)")
+                        st.markdown(data["result"]["summary"])
+            except Exception as e:
+                st.error(str(e))
+
     # Analyze image
     if img_file is not None and st.button("Analyze image"):
+        new_case(img_file)
         with st.spinner("Analyzing image..."):
             try:
                 res = analyze_image(
@@ -191,6 +236,7 @@ if role in ("clinician", "admin"):
 
     # Extract text from PDF
     if pdf_file is not None and st.button("Extract text from PDF"):
+        new_case(pdf_file)
         with st.spinner("Extracting text..."):
             try:
                 out = extract_pdf_text(
@@ -205,7 +251,7 @@ if role in ("clinician", "admin"):
         "Notes",
         height=220,
         placeholder="CC/HPI...\nMedications...\nLabs...",
-        value=st.session_state.get("notes_text", ""),
+        key="notes_text",  # edits survive reruns and reach the pipeline
     )
 
     # Summarize
@@ -213,18 +259,16 @@ if role in ("clinician", "admin"):
         if not text.strip() and not findings:
             st.warning("Provide notes and/or analyze an image.")
         else:
-            with st.spinner("Summarizing..."):
-                try:
-                    out = summarize_records(
-                        text, findings, token=st.session_state.auth["token"]
-                    )
-                    st.success("Summary")
-                    st.write(out.get("summary", ""))
-                    if out.get("citations"):
-                        st.caption("Citations")
-                        st.json(out["citations"])
-                except Exception as e:
-                    st.error(str(e))
+            try:
+                st.success("Summary")
+                # Rendered token by token as the backend streams it; one case
+                # per session, so re-summarizing after adding notes is incremental.
+                case_id = st.session_state.setdefault("case_id", uuid.uuid4().hex)
+                st.write_stream(
+                    stream_summary(text, findings, token=st.session_state.auth["token"], case_id=case_id)
+                )
+            except Exception as e:
+                st.error(str(e))
 
     # Case-aware chat
     st.markdown("---")
@@ -258,19 +302,15 @@ if role in ("clinician", "admin"):
 
     if prompt:
         st.session_state.chat_msgs.append(("user", prompt))
-        with st.spinner("Thinking..."):
-            try:
-                resp = patient_chat(
-                    prompt,
-                    notes=case_notes,
-                    imaging_findings=case_findings,
-                    token=st.session_state.auth["token"],
+        try:
+            with st.chat_message("assistant"):
+                bot = st.write_stream(
+                    stream_case_chat(st.session_state, prompt, case_notes, case_findings,
+                                     token=st.session_state.auth["token"])
                 )
-                bot = resp.get("reply", "")
-                st.session_state.chat_msgs.append(("assistant", bot))
-                st.chat_message("assistant").markdown(bot)
-            except Exception as e:
-                st.error(str(e))
+            st.session_state.chat_msgs.append(("assistant", bot))
+        except Exception as e:
+            st.error(str(e))
 
 # ===================================================================
 # PATIENT
@@ -324,19 +364,19 @@ elif role == "patient":
     prompt = st.chat_input("Type your question…")
     if prompt:
         st.session_state.patient_chat.append(("you", prompt))
-        with st.spinner("Thinking..."):
-            try:
-                ctx = (
-                    st.session_state.patient_context_text.strip()
-                    if use_context and st.session_state.patient_context_text.strip()
-                    else None
+        try:
+            ctx = (
+                st.session_state.patient_context_text.strip()
+                if use_context and st.session_state.patient_context_text.strip()
+                else None
+            )
+            with st.chat_message("assistant"):
+                bot = st.write_stream(
+                    stream_case_chat(st.session_state, prompt, ctx, token=st.session_state.auth["token"])
                 )
-                resp = patient_chat(prompt, notes=ctx, token=st.session_state.auth["token"])
-                bot = resp.get("reply", "")
-                st.session_state.patient_chat.append(("bot", bot))
-                st.chat_message("assistant").markdown(bot)
-            except Exception as e:
-                st.error(str(e))
+            st.session_state.patient_chat.append(("bot", bot))
+        except Exception as e:
+            st.error(str(e))
 
 # ===================================================================
 # ADMIN